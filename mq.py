@@ -16,10 +16,66 @@ logger = Logging(__name__).init()
 mq = MQ().from_json_config(os.environ.get('CONFIG_MQ'), 'ASM')
 bigquery_dml = BigQuery().connect(os.environ.get('SECRET_GSERVICE_DML'))
 
-from sqls.asm_con import sql
+from sqls import asm_con
 
-r = bigquery_dml.select_rows_by_standard_sql(sql.get_select_msg_payload('dml-prod'))
+if os.environ.get('PATH_ASM_WATERMARK'):
+    ## Incremental: only legs updated since the last published SRC_UPDATED_TIME
+    from utils.watermark import Watermark, get_next_watermark
 
-mq.set_message(r['payload'][0])
-mq.set_correlation_id(r['correlationId'][0])
-mq.callback()
\ No newline at end of file
+    watermark = Watermark(os.environ.get('PATH_ASM_WATERMARK'))
+    payload_job = bigquery_dml.submit(*asm_con.render('msg_payload', 'dml-prod', watermark=watermark.get('dml-prod')))
+else:
+    watermark = None
+    payload_job = bigquery_dml.submit(*asm_con.render('msg_payload', 'dml-prod'))
+
+if os.environ.get('PATH_MQ_PAYLOAD_INDEX'):
+    ## Send only legs whose payload changed since the last successful send
+    from utils.payload_index import PayloadIndex
+
+    payload_index = PayloadIndex(os.environ.get('PATH_MQ_PAYLOAD_INDEX'))
+    if payload_index.count() == 0 and os.environ.get('ASM_CON_LATEST_STATE'):
+        ## Primary-key style read of the latest state table, backfilled once from the full history
+        from utils.history import merge_latest_state
+
+        bigquery_dml.execute_by_standard_sql(*asm_con.render('msg_latest_create', 'dml-prod'))
+        r, history = bigquery_dml.gather(payload_job, bigquery_dml.submit(*asm_con.render('msg_latest', 'dml-prod'), bypass_cache=True))
+        if len(history) == 0:
+            history = bigquery_dml.select_rows_by_standard_sql(*asm_con.render('msg_history', 'dml-prod'))
+            merge_latest_state(bigquery_dml, asm_con.get_template('msg_latest_merge').render('dml-prod'), history.to_dict('records'))
+        payload_index.rebuild(history)
+    elif payload_index.count() == 0:
+        ## The history query runs alongside the payload query
+        r, history = bigquery_dml.gather(payload_job, bigquery_dml.submit(*asm_con.render('msg_history', 'dml-prod')))
+        payload_index.rebuild(history)
+    else:
+        r = payload_job.result()
+    extract = r
+    r = payload_index.filter_changed(r)
+else:
+    payload_index = None
+    r = payload_job.result()
+    extract = r
+
+if os.environ.get('PATH_MQ_OUTBOX'):
+    ## Record the extract first, so a failed run replays only what was not delivered
+    from utils.outbox import Outbox
+
+    outbox = Outbox(os.environ.get('PATH_MQ_OUTBOX'))
+    outbox.append_many(r)
+    outcomes = outbox.publish(mq)
+    outbox.compact()
+    outbox.close()
+else:
+    outcomes = mq.callback_many(r)
+
+if payload_index is not None:
+    payload_index.mark_sent(r[r['correlationId'].isin([i['correlationId'] for i in outcomes if i['status'] == 'OK'])])
+    payload_index.close()
+
+if watermark is not None:
+    ## Advance only after publishing; without an outbox, stop before the earliest failed message
+    watermark.advance('dml-prod', get_next_watermark(extract, None if os.environ.get('PATH_MQ_OUTBOX') else outcomes))
+
+if os.environ.get('PATH_BIGQUERY_STATS'):
+    ## Keep per-query bytes billed / slot-ms / duration to compare runs
+    bigquery_dml.export_query_stats(os.environ.get('PATH_BIGQUERY_STATS'))
@@ -0,0 +1,58 @@
+import os
+import json
+from dotenv import load_dotenv
+try:
+    load_dotenv(dotenv_path='/home/connectivity-checker/.env', override=True)
+except:
+    try:
+        load_dotenv()
+    except:
+        pass
+
+from utils.logging import Logging
+from utils.mq import MQ
+from utils.bigquery import BigQuery
+from utils.pipeline import run_asm_con_projects
+
+logger = Logging(__name__).init()
+
+from sqls import asm_con
+from sqls.asm_con import sql
+
+## Projects to run concurrently: JSON list of
+## {"project_id", "mq_config", "message_type", "service_account", "rate_limit"}, missing keys fall back to the single-project settings
+if os.environ.get('CONFIG_ASM_CON_PROJECTS'):
+    with open(os.environ.get('CONFIG_ASM_CON_PROJECTS'), 'r') as f:
+        projects = json.load(f)
+else:
+    projects = [{'project_id': 'dml-prod'}]
+
+profiles = []
+for project in projects:
+    project_id = project['project_id']
+    bigquery = BigQuery().connect(project.get('service_account') or os.environ.get('SECRET_GSERVICE_DML'))
+    query, query_parameters = asm_con.render('msg_payload', project_id)
+
+    if os.environ.get('ASM_CON_LATEST_STATE'):
+        ## Maintain the latest message per correlationId alongside the history
+        bigquery.execute_by_standard_sql(*asm_con.render('msg_latest_create', project_id))
+        latest_sql = asm_con.get_template('msg_latest_merge').render(project_id)
+    else:
+        latest_sql = None
+
+    profiles.append({
+        'project_id': project_id,
+        'bigquery': bigquery,
+        'mq': MQ().from_json_config(project.get('mq_config') or os.environ.get('CONFIG_MQ'), project.get('message_type', 'ASM')),
+        'sql': query,
+        'query_parameters': query_parameters,
+        'history_table_id': sql.get_msg_history_table_id(project_id),
+        'latest_sql': latest_sql,
+        'rate_limit': project.get('rate_limit')
+    })
+
+summaries, totals = run_asm_con_projects(profiles)
+
+if os.environ.get('PATH_BIGQUERY_STATS'):
+    ## Keep per-query bytes billed / slot-ms / duration to compare runs
+    profiles[0]['bigquery'].export_query_stats(os.environ.get('PATH_BIGQUERY_STATS'))
@@ -1,62 +1,16 @@
+import re
+import datetime
+from zoneinfo import ZoneInfo
+
 class sql():
 
   def get_select_msg_payload(project_id):
+    ### The message format (correlationId, payload) is shared with the msg_payload template, see MSG_PAYLOAD_COLUMNS
     return '''
     -- Author: hexton.chan@hkexpress.com 
     -- Description: Get 7-day flight schedule IN which updated BY 7-day before departure, generate ASM_CON
   SELECT
-    ID,
-    FLTID,
-    DATOP_CHN,
-    'OpmLegChangeAsmCon-' || FLTID || UPPER(FORMAT_DATETIME("-%y%m%d%H%M%S",SRC_UPDATED_TIME))  AS correlationId,
-    'ASM' AS msgType,
-    --'UTC' AS timeZone,
-    --UPPER(FORMAT_DATETIME("%d%b%y",CURRENT_DATETIME())) AS msgGenTime,
-    --'CON' AS msgSubType,
-    --FLIGHT_NO,
-    --UPPER(FORMAT_DATETIME("%d%b%y",DATOP)) AS DATOP,
-    --ACTYPE,
-    --LONG_REG,
-    --SERVICE_TYPE_ID,
-    --DEPSTN,
-    --ARRSTN,
-    --FORMAT_DATETIME("%d%H%M",STD) AS STD,
-    --FORMAT_DATETIME("%d%H%M",STA) AS STA,
-    --SRC_CREATED_TIME,
-    --SRC_UPDATED_TIME,
-    'ASM\\r\\nUTC\\r\\n' ||
-    UPPER(FORMAT_DATETIME("%d%b%y",DATOP)) || '001E001\\r\\n' ||
-    'CON\\r\\n' ||
-    ACOWN||SRC_FLIGHT_NO || '/' || UPPER(FORMAT_DATETIME("%d%b%y",DATOP)) || '\\r\\n' ||
-    CASE
-      WHEN SERVICE_TYPE_ID = 1 THEN 'C'
-      WHEN SERVICE_TYPE_ID = 2 THEN 'D'
-      WHEN SERVICE_TYPE_ID = 3 THEN 'E'
-      WHEN SERVICE_TYPE_ID = 4 THEN 'F'
-      WHEN SERVICE_TYPE_ID = 5 THEN 'J'
-      WHEN SERVICE_TYPE_ID = 6 THEN 'K'
-      WHEN SERVICE_TYPE_ID = 7 THEN 'L'
-      WHEN SERVICE_TYPE_ID = 8 THEN 'M'
-      WHEN SERVICE_TYPE_ID = 9 THEN 'O'
-      WHEN SERVICE_TYPE_ID = 10 THEN 'P'
-      WHEN SERVICE_TYPE_ID = 11 THEN 'Q'
-      WHEN SERVICE_TYPE_ID = 12 THEN 'S'
-      WHEN SERVICE_TYPE_ID = 13 THEN 'T'
-      WHEN SERVICE_TYPE_ID = 14 THEN 'X'
-      WHEN SERVICE_TYPE_ID = 15 THEN 'Z'
-      WHEN SERVICE_TYPE_ID = 16 THEN 'T'
-    ELSE
-    'J'
-  END
-    || ' ' ||
-    CASE
-      WHEN ACTYPE = 'A321' THEN '321'
-      WHEN ACTYPE = 'A320' THEN '320'
-      WHEN ACTYPE = 'A21N' THEN '32Q'
-    ELSE
-    ACTYPE
-  END
-    || ' . ' || LONG_REG || '\\r\\n' || DEPSTN || FORMAT_DATETIME("%d%H%M",STD) || ' ' || ARRSTN || FORMAT_DATETIME("%d%H%M",STA)|| '\\r\\n' AS payload
+    {}
   FROM
     `{}.ODS_FlightNet.M_FOC_LEGS`
   WHERE
@@ -86,7 +40,9 @@ class sql():
   ORDER BY
     DATOP ASC
 
-  '''.format(project_id)
+  '''.format(
+      get_select_columns(MSG_PAYLOAD_COLUMNS, ['ID', 'FLTID', 'DATOP_CHN', 'correlationId', 'msgType', 'payload']),
+      project_id)
 
   def get_select_msg_history(project_id):
     return '''
@@ -119,4 +75,250 @@ class sql():
   '''.format(project_id, project_id)
 
   def get_msg_history_table_id(project_id):
-    return project_id + '.ODS_Eking.ASM_CON'
\ No newline at end of file
+    return project_id + '.ODS_Eking.ASM_CON'
+
+  def get_msg_latest_table_id(project_id):
+    ### Latest message per correlationId, maintained from the history writes (templates msg_latest_*)
+    return project_id + '.ODS_Eking.ASM_CON_LATEST'
+
+### Parameterized, deterministic query templates.
+### {project} and {columns} are rendered into the text (table identifiers cannot be query parameters);
+### everything else is a typed @parameter, so the same run date gives the same query text and hits BigQuery's result cache.
+
+PROJECT_ID_PATTERN = re.compile(r'^[a-z][a-z0-9\-]{4,28}[a-z0-9]$')
+RUN_DATE_TIME_ZONE = 'Asia/Hong_Kong'
+
+def get_select_columns(expressions, columns):
+  ### SELECT list of the given column aliases, from {alias: expression}
+  return ',\n    '.join(
+    column if expressions[column] == column else '{} AS {}'.format(expressions[column], column) for column in columns)
+
+class template():
+
+  def __init__(self, name, text, columns, parameters, default_columns = None):
+    self.name = name
+    self.text = text
+    self.columns = columns
+    self.parameters = parameters
+    self.default_columns = default_columns or list(columns)
+
+  def render(self, project_id, columns = None):
+    ### Return the query text for a project, projected to the given column aliases
+    if not PROJECT_ID_PATTERN.match(str(project_id)):
+      raise ValueError(__name__, 'Invalid project id - "{}"'.format(project_id))
+
+    columns = columns or self.default_columns
+    unknown = [column for column in columns if column not in self.columns]
+    if unknown:
+      raise KeyError(__name__, 'Unknown column(s) for template {}: {}'.format(self.name, unknown))
+
+    return self.text.replace('{project}', project_id).replace('{columns}', get_select_columns(self.columns, columns))
+
+  def get_query_parameters(self, **values):
+    ### Return {name: value} for every declared parameter, converted to the declared type
+    query_parameters = {}
+
+    for name, parameter_type in self.parameters.items():
+      if values.get(name) is None:
+        raise KeyError(__name__, 'Missing parameter @{} for template {}'.format(name, self.name))
+
+      value = values[name]
+      if parameter_type == 'DATE' and isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+      elif parameter_type == 'DATE' and isinstance(value, datetime.datetime):
+        value = value.date()
+      elif parameter_type == 'DATETIME' and isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+      elif parameter_type == 'DATETIME' and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+
+      query_parameters[name] = value
+
+    return query_parameters
+
+def get_run_date():
+  return datetime.datetime.now(ZoneInfo(RUN_DATE_TIME_ZONE)).date()
+
+MSG_PAYLOAD_COLUMNS = {
+  'ID': 'ID',
+  'FLTID': 'FLTID',
+  'DATOP_CHN': 'DATOP_CHN',
+  'correlationId': """'OpmLegChangeAsmCon-' || FLTID || UPPER(FORMAT_DATETIME("-%y%m%d%H%M%S",SRC_UPDATED_TIME))""",
+  'msgType': "'ASM'",
+  'payload': """'ASM\\r\\nUTC\\r\\n' ||
+    UPPER(FORMAT_DATETIME("%d%b%y",DATOP)) || '001E001\\r\\n' ||
+    'CON\\r\\n' ||
+    ACOWN||SRC_FLIGHT_NO || '/' || UPPER(FORMAT_DATETIME("%d%b%y",DATOP)) || '\\r\\n' ||
+    CASE SERVICE_TYPE_ID
+      WHEN 1 THEN 'C' WHEN 2 THEN 'D' WHEN 3 THEN 'E' WHEN 4 THEN 'F'
+      WHEN 5 THEN 'J' WHEN 6 THEN 'K' WHEN 7 THEN 'L' WHEN 8 THEN 'M'
+      WHEN 9 THEN 'O' WHEN 10 THEN 'P' WHEN 11 THEN 'Q' WHEN 12 THEN 'S'
+      WHEN 13 THEN 'T' WHEN 14 THEN 'X' WHEN 15 THEN 'Z' WHEN 16 THEN 'T'
+    ELSE 'J' END
+    || ' ' ||
+    CASE ACTYPE WHEN 'A321' THEN '321' WHEN 'A320' THEN '320' WHEN 'A21N' THEN '32Q' ELSE ACTYPE END
+    || ' . ' || LONG_REG || '\\r\\n' || DEPSTN || FORMAT_DATETIME("%d%H%M",STD) || ' ' || ARRSTN || FORMAT_DATETIME("%d%H%M",STA)|| '\\r\\n'""",
+  'SRC_UPDATED_TIME': 'SRC_UPDATED_TIME',
+  'DATOP': 'DATOP',
+  'ACOWN': 'ACOWN',
+  'SRC_FLIGHT_NO': 'SRC_FLIGHT_NO',
+  'SERVICE_TYPE_ID': 'SERVICE_TYPE_ID',
+  'ACTYPE': 'ACTYPE',
+  'LONG_REG': 'LONG_REG',
+  'DEPSTN': 'DEPSTN',
+  'ARRSTN': 'ARRSTN',
+  'STD': 'STD',
+  'STA': 'STA'
+}
+
+### Raw leg fields only, the payload and correlationId are built locally by utils.asm.build_asm_con
+RAW_LEG_COLUMNS = ['ID', 'FLTID', 'DATOP_CHN', 'SRC_UPDATED_TIME', 'DATOP', 'ACOWN', 'SRC_FLIGHT_NO',
+  'SERVICE_TYPE_ID', 'ACTYPE', 'LONG_REG', 'DEPSTN', 'ARRSTN', 'STD', 'STA']
+
+templates = {
+  'msg_payload': template(
+    'msg_payload',
+    """
+  -- Description: 7-day flight schedule from @run_date, updated within 7 days before departure and after @watermark, generate ASM_CON
+  SELECT
+    {columns}
+  FROM
+    `{project}.ODS_FlightNet.M_FOC_LEGS`
+  WHERE
+    DATE_DIFF(DATOP_CHN, @run_date, DAY) <= 7
+    AND DATE(DATOP_CHN) >= @run_date
+    AND DELETED IS FALSE
+    AND long_reg IS NOT NULL
+    AND ATA IS NULL
+    AND ATD IS NULL
+    AND TOFF IS NULL
+    AND TDWN IS NULL
+    AND SRC_Flight_no IS NOT NULL
+    AND FLTID IS NOT NULL
+    AND LEGNO IS NOT NULL
+    AND DATETIME_DIFF(DATETIME(STA), DATETIME(STD), MINUTE) > 0
+    AND SRC_CREATED_TIME <> SRC_UPDATED_TIME
+    AND DATE(SRC_UPDATED_TIME) > (DATOP_CHN - 7)
+    AND SRC_UPDATED_TIME > @watermark
+  ORDER BY
+    DATOP ASC
+  """,
+    MSG_PAYLOAD_COLUMNS,
+    {'run_date': 'DATE', 'watermark': 'DATETIME'},
+    ['ID', 'FLTID', 'DATOP_CHN', 'correlationId', 'msgType', 'payload', 'SRC_UPDATED_TIME']),
+  'msg_history': template(
+    'msg_history',
+    """
+  SELECT
+    {columns}
+  FROM
+    `{project}.ODS_Eking.ASM_CON` all_msg
+  INNER JOIN (
+    SELECT
+      correlationId,
+      MAX( PARSE_DATE('%d%b%y', REPLACE(REGEXP_SUBSTR(payload, '.{7}001E001'), '001E001', '' ) ) ) AS latestDate
+    FROM
+      `{project}.ODS_Eking.ASM_CON`
+    GROUP BY
+      correlationId ) latest_msg
+  ON
+    all_msg.correlationId = latest_msg.correlationId
+    AND PARSE_DATE('%d%b%y', REPLACE(REGEXP_SUBSTR(payload, '.{7}001E001'), '001E001', '' ) ) = latest_msg.latestDate
+  WHERE
+    DATOP_CHN >= @run_date
+  """,
+    {
+      'ID': 'ID',
+      'FLTID': 'FLTID',
+      'DATOP_CHN': 'DATOP_CHN',
+      'correlationId': 'all_msg.correlationId',
+      'msgType': 'msgType',
+      'payload': 'payload'
+    },
+    {'run_date': 'DATE'}),
+  'msg_latest_create': template(
+    'msg_latest_create',
+    """
+  CREATE TABLE IF NOT EXISTS `{project}.ODS_Eking.ASM_CON_LATEST` (
+    correlationId STRING NOT NULL,
+    FLTID STRING,
+    DATOP_CHN DATE,
+    msgType STRING,
+    latestDate DATE,
+    payloadHash STRING,
+    updatedTime TIMESTAMP
+  )
+  PARTITION BY
+    DATOP_CHN
+  CLUSTER BY
+    correlationId
+  """,
+    {},
+    {}),
+  'msg_latest_merge': template(
+    'msg_latest_merge',
+    """
+  -- Description: Upsert the latest message per correlationId from a JSON array of utils.history.get_latest_state rows
+  MERGE
+    `{project}.ODS_Eking.ASM_CON_LATEST` latest
+  USING (
+    SELECT
+      JSON_VALUE(msg, '$.correlationId') AS correlationId,
+      JSON_VALUE(msg, '$.FLTID') AS FLTID,
+      CAST(JSON_VALUE(msg, '$.DATOP_CHN') AS DATE) AS DATOP_CHN,
+      JSON_VALUE(msg, '$.msgType') AS msgType,
+      CAST(JSON_VALUE(msg, '$.latestDate') AS DATE) AS latestDate,
+      JSON_VALUE(msg, '$.payloadHash') AS payloadHash
+    FROM
+      UNNEST(JSON_QUERY_ARRAY(@rows)) msg ) msg
+  ON
+    latest.correlationId = msg.correlationId
+  WHEN MATCHED AND msg.latestDate >= latest.latestDate THEN
+    UPDATE SET
+      FLTID = msg.FLTID,
+      DATOP_CHN = msg.DATOP_CHN,
+      msgType = msg.msgType,
+      latestDate = msg.latestDate,
+      payloadHash = msg.payloadHash,
+      updatedTime = CURRENT_TIMESTAMP()
+  WHEN NOT MATCHED THEN
+    INSERT (correlationId, FLTID, DATOP_CHN, msgType, latestDate, payloadHash, updatedTime)
+    VALUES (msg.correlationId, msg.FLTID, msg.DATOP_CHN, msg.msgType, msg.latestDate, msg.payloadHash, CURRENT_TIMESTAMP())
+  """,
+    {},
+    {'rows': 'STRING'}),
+  'msg_latest': template(
+    'msg_latest',
+    """
+  -- Description: Latest message per correlationId of legs from @run_date, replaces msg_history for the payload index
+  SELECT
+    {columns}
+  FROM
+    `{project}.ODS_Eking.ASM_CON_LATEST`
+  WHERE
+    DATOP_CHN >= @run_date
+  """,
+    {
+      'FLTID': 'FLTID',
+      'DATOP_CHN': 'DATOP_CHN',
+      'correlationId': 'correlationId',
+      'msgType': 'msgType',
+      'latestDate': 'latestDate',
+      'payloadHash': 'payloadHash'
+    },
+    {'run_date': 'DATE'})
+}
+
+def get_template(name):
+  return templates[name]
+
+def render(name, project_id, run_date = None, watermark = None, columns = None, **values):
+  ### Return (query text, {name: value} query parameters) with a fixed run date, for BigQuery.select_rows_by_standard_sql
+  query_template = get_template(name)
+  values.update({
+    'run_date': run_date or get_run_date(),
+    'watermark': watermark or datetime.datetime(1970, 1, 1)
+  })
+
+  return query_template.render(project_id, columns), query_template.get_query_parameters(
+    **{name: value for name, value in values.items() if name in query_template.parameters})
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+    Name:
+        mq_standin.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Local stand-in for `java ... <BridgeClass>` (see utils.mq._MQBridge), used as MQ_JAVA in tests.
+        JVM options and the main class are ignored; queues are kept in memory, so a GET returns what was PUT.
+        Behaviour is set by environment variables:
+            MQ_STANDIN_CONNECT_MS - connect_ms reported by READY, default 12.5
+            MQ_STANDIN_SLOW       - correlationId (substring) acknowledged after MQ_STANDIN_DELAY seconds, frames behind it wait
+            MQ_STANDIN_DEFER      - correlationIds (comma separated substrings) acknowledged after MQ_STANDIN_DELAY seconds,
+                                    frames behind them are not held up
+            MQ_STANDIN_HANG       - correlationIds (comma separated substrings) never acknowledged, frames behind them are not held up
+            MQ_STANDIN_FAIL       - PUT | GET, answer ERROR to this operation
+    Note:
+        20261017 - Init commit
+        20261017 - Add deferred and hanging frames
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+def get_matches(name):
+    return [value for value in os.environ.get(name, '').split(',') if value]
+
+def main():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    lock = threading.Lock()
+    slow = os.environ.get('MQ_STANDIN_SLOW')
+    defer = get_matches('MQ_STANDIN_DEFER')
+    hang = get_matches('MQ_STANDIN_HANG')
+    delay = float(os.environ.get('MQ_STANDIN_DELAY', '5'))
+    fail = os.environ.get('MQ_STANDIN_FAIL')
+    queues = {}
+
+    def write(line):
+        with lock:
+            stdout.write((line + '\n').encode('utf-8'))
+            stdout.flush()
+
+    write('READY {}'.format(os.environ.get('MQ_STANDIN_CONNECT_MS', '12.5')))
+
+    for header in iter(stdin.readline, b''):
+        seq, op, length = header.decode('ascii').split()
+        envelope = json.loads(stdin.read(int(length)))
+        queue = queues.setdefault(envelope['queueBsmSendName'], {})
+
+        if any(value in envelope['correlationId'] for value in hang):
+            continue
+        if slow and slow in envelope['correlationId']:
+            time.sleep(delay)
+
+        if op == fail:
+            ack = 'ACK {} ERROR {} rejected by stand-in'.format(seq, op)
+        elif op == 'PUT':
+            queue[envelope['correlationId']] = envelope['payload']
+            ack = 'ACK {} OK'.format(seq)
+        elif envelope['correlationId'] in queue:
+            ack = 'ACK {} OK {}'.format(seq, json.dumps(queue.pop(envelope['correlationId'])))
+        else:
+            ack = 'ACK {} ERROR no message for {}'.format(seq, envelope['correlationId'])
+
+        if any(value in envelope['correlationId'] for value in defer):
+            threading.Timer(delay, write, args=(ack,)).start()
+        else:
+            write(ack)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+    Name:
+        sftp_standin.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Local stand-in for an SFTP server (paramiko server mode), used by the SFTP transfer tests.
+        Any username/password is accepted; remote paths are served from a local root directory.
+    Note:
+        20261017 - Init commit
+"""
+
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko import ServerInterface, SFTPServerInterface, SFTPServer, SFTPAttributes, SFTPHandle, SFTP_OK, AUTH_SUCCESSFUL, OPEN_SUCCEEDED
+
+HOST_KEY = paramiko.RSAKey.generate(2048)
+
+class _Server(ServerInterface):
+    def check_auth_password(self, username, password):
+        return AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return OPEN_SUCCEEDED
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+def get_interface(root):
+    class _Interface(SFTPServerInterface):
+        def get_path(self, path):
+            return root + self.canonicalize(path)
+
+        def list_folder(self, path):
+            path = self.get_path(path)
+            try:
+                attributes = []
+                for name in sorted(os.listdir(path)):
+                    attribute = SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                    attribute.filename = name
+                    attributes.append(attribute)
+                return attributes
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+
+        def stat(self, path):
+            try:
+                return SFTPAttributes.from_stat(os.stat(self.get_path(path)))
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def open(self, path, flags, attr):
+            try:
+                fd = os.open(self.get_path(path), flags, 0o666)
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+
+            if flags & os.O_WRONLY:
+                mode = 'ab' if flags & os.O_APPEND else 'wb'
+            elif flags & os.O_RDWR:
+                mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+            else:
+                mode = 'rb'
+
+            handle = _Handle(flags)
+            handle.filename = path
+            handle.readfile = handle.writefile = os.fdopen(fd, mode)
+            return handle
+
+        def remove(self, path):
+            return self.call(os.remove, self.get_path(path))
+
+        def rename(self, old_path, new_path):
+            return self.call(os.rename, self.get_path(old_path), self.get_path(new_path))
+
+        def posix_rename(self, old_path, new_path):
+            return self.call(os.replace, self.get_path(old_path), self.get_path(new_path))
+
+        def mkdir(self, path, attr):
+            return self.call(os.mkdir, self.get_path(path))
+
+        def rmdir(self, path):
+            return self.call(os.rmdir, self.get_path(path))
+
+        def chattr(self, path, attr):
+            if attr._flags & attr.FLAG_AMTIME:
+                return self.call(os.utime, self.get_path(path), (attr.st_atime, attr.st_mtime))
+            return SFTP_OK
+
+        def call(self, function, *args):
+            try:
+                function(*args)
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+            return SFTP_OK
+
+    return _Interface
+
+def serve(root):
+    ### Serve root on a free local port until the process ends, return the port
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+
+    def accept():
+        while True:
+            client, _ = listener.accept()
+            transport = paramiko.Transport(client)
+            transport.add_server_key(HOST_KEY)
+            transport.set_subsystem_handler('sftp', SFTPServer, get_interface(str(root)))
+            transport.start_server(server=_Server())
+
+    threading.Thread(target=accept, daemon=True).start()
+
+    return listener.getsockname()[1]
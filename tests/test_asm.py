@@ -0,0 +1,69 @@
+import datetime
+
+import pandas as pd
+
+from utils.asm import build_asm_con
+from sqls.asm_con import RAW_LEG_COLUMNS
+
+### Expected strings as rendered by the payload/correlationId expressions of the msg_payload query
+def get_legs():
+    return pd.DataFrame({
+        'ID': [1, 2, 3, 4, 5, 6],
+        'FLTID': ['170710-230130', '170711-230130', '170712-230130', '170713-230130', '170714-230130', None],
+        'DATOP_CHN': [datetime.date(2026, 10, 20)] * 5 + [datetime.date(2026, 1, 2)],
+        'SRC_UPDATED_TIME': [datetime.datetime(2023, 1, 30, 13, 19, 8), datetime.datetime(2026, 10, 17, 9, 5, 1),
+                             datetime.datetime(2026, 10, 17, 23, 59, 59), datetime.datetime(2026, 10, 17, 0, 0, 0),
+                             None, datetime.datetime(2026, 1, 1, 12, 0, 0)],
+        'DATOP': [datetime.datetime(2026, 10, 20)] * 5 + [datetime.datetime(2026, 1, 2)],
+        'ACOWN': ['UO'] * 6,
+        'SRC_FLIGHT_NO': ['123', '456', '789', '12', '34', '5'],
+        'SERVICE_TYPE_ID': [1, None, 16, 99, 5, 0],
+        'ACTYPE': ['A321', 'A320', 'A21N', '333', 'A321', 'A320'],
+        'LONG_REG': ['B-LEA', 'B-LEB', 'B-LEC', 'B-LED', None, 'B-LEF'],
+        'DEPSTN': ['HKG', 'HKG', 'NRT', 'HKG', 'HKG', 'HKG'],
+        'ARRSTN': ['NRT', 'KIX', 'HKG', 'TPE', 'TPE', 'CTS'],
+        'STD': [datetime.datetime(2026, 10, 20, 1, 5), datetime.datetime(2026, 10, 20, 23, 55),
+                datetime.datetime(2026, 10, 20, 10, 0), datetime.datetime(2026, 10, 20, 0, 0),
+                datetime.datetime(2026, 10, 20, 8, 0), datetime.datetime(2026, 1, 2, 9, 30)],
+        'STA': [datetime.datetime(2026, 10, 20, 5, 40), datetime.datetime(2026, 10, 21, 3, 10),
+                datetime.datetime(2026, 10, 20, 14, 5), datetime.datetime(2026, 10, 20, 1, 45),
+                datetime.datetime(2026, 10, 20, 9, 50), datetime.datetime(2026, 1, 2, 14, 15)]
+    }, columns=RAW_LEG_COLUMNS)
+
+def test_payload_matches_sql():
+    messages = build_asm_con(get_legs())
+
+    assert list(messages['payload']) == [
+        'ASM\r\nUTC\r\n20OCT26001E001\r\nCON\r\nUO123/20OCT26\r\nC 321 . B-LEA\r\nHKG200105 NRT200540\r\n',
+        ## Null SERVICE_TYPE_ID falls back to 'J'
+        'ASM\r\nUTC\r\n20OCT26001E001\r\nCON\r\nUO456/20OCT26\r\nJ 320 . B-LEB\r\nHKG202355 KIX210310\r\n',
+        'ASM\r\nUTC\r\n20OCT26001E001\r\nCON\r\nUO789/20OCT26\r\nT 32Q . B-LEC\r\nNRT201000 HKG201405\r\n',
+        ## Unknown SERVICE_TYPE_ID falls back to 'J', unmapped ACTYPE is kept as is
+        'ASM\r\nUTC\r\n20OCT26001E001\r\nCON\r\nUO12/20OCT26\r\nJ 333 . B-LED\r\nHKG200000 TPE200145\r\n',
+        ## Null LONG_REG gives a null payload
+        None,
+        'ASM\r\nUTC\r\n02JAN26001E001\r\nCON\r\nUO5/02JAN26\r\nJ 320 . B-LEF\r\nHKG020930 CTS021415\r\n'
+    ]
+    assert list(messages['msgType']) == ['ASM'] * 6
+
+def test_correlation_id_matches_sql():
+    messages = build_asm_con(get_legs())
+
+    assert list(messages['correlationId']) == [
+        'OpmLegChangeAsmCon-170710-230130-230130131908',
+        'OpmLegChangeAsmCon-170711-230130-261017090501',
+        'OpmLegChangeAsmCon-170712-230130-261017235959',
+        'OpmLegChangeAsmCon-170713-230130-261017000000',
+        ## Null SRC_UPDATED_TIME or FLTID gives a null correlationId
+        None,
+        None
+    ]
+
+def test_dict_of_arrays_input():
+    legs = get_legs()
+    batch = {name: legs[name].to_numpy() for name in RAW_LEG_COLUMNS}
+
+    messages = build_asm_con(batch)
+
+    assert list(messages['payload']) == list(build_asm_con(legs)['payload'])
+    assert list(messages['correlationId']) == list(build_asm_con(legs)['correlationId'])
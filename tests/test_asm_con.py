@@ -0,0 +1,32 @@
+import datetime
+
+import pytest
+
+from sqls import asm_con
+
+def test_render_is_deterministic_with_typed_parameters():
+    sql, query_parameters = asm_con.render('msg_payload', 'hkexpress-dw', run_date='2026-10-17', watermark=datetime.date(2026, 10, 16))
+
+    assert (sql, query_parameters) == asm_con.render('msg_payload', 'hkexpress-dw', run_date=datetime.datetime(2026, 10, 17, 8, 30), watermark='2026-10-16T00:00:00')
+    assert query_parameters == {'run_date': datetime.date(2026, 10, 17), 'watermark': datetime.datetime(2026, 10, 16)}
+    assert '`hkexpress-dw.ODS_FlightNet.M_FOC_LEGS`' in sql
+    assert '@run_date' in sql and '@watermark' in sql
+    assert '{project}' not in sql and '{columns}' not in sql
+
+def test_render_projects_columns():
+    query_template = asm_con.get_template('msg_payload')
+    sql = query_template.render('hkexpress-dw', ['ID', 'msgType'])
+
+    assert "'ASM' AS msgType" in sql
+    assert 'payload' not in sql
+    with pytest.raises(KeyError):
+        query_template.render('hkexpress-dw', ['ID', 'NOT_A_COLUMN'])
+
+def test_render_rejects_invalid_project_id():
+    for project_id in ['hkexpress-dw`; DROP TABLE x; --', 'HKEXPRESS', '', None]:
+        with pytest.raises(ValueError):
+            asm_con.get_template('msg_payload').render(project_id)
+
+def test_query_parameters_require_every_declared_parameter():
+    with pytest.raises(KeyError):
+        asm_con.get_template('msg_payload').get_query_parameters(run_date=datetime.date(2026, 10, 17))
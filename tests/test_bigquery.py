@@ -0,0 +1,229 @@
+import os
+import time
+import json
+import types
+import concurrent.futures
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import bigquery as bigquery_module
+
+class _LoadJobConfig():
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+@pytest.fixture
+def google(monkeypatch):
+    ### Stand-in of google.cloud.bigquery, only the names used by utils.bigquery
+    module = types.SimpleNamespace(
+        LoadJobConfig=_LoadJobConfig,
+        QueryJobConfig=_LoadJobConfig,
+        SourceFormat=types.SimpleNamespace(PARQUET='PARQUET', NEWLINE_DELIMITED_JSON='NEWLINE_DELIMITED_JSON'),
+        WriteDisposition=types.SimpleNamespace(WRITE_APPEND='WRITE_APPEND'))
+    monkeypatch.setattr(bigquery_module, 'bigquery', module)
+
+    return module
+
+class _LoadClient():
+    ### Records the load jobs; like BigQuery, a load without the destination schema fails on pandas' inferred types
+    schema = ['ID:INTEGER', 'FLTID:STRING', 'REMARK:STRING', 'SRC_UPDATED_TIME:TIMESTAMP']
+
+    def __init__(self):
+        self.loads = []
+
+    def get_table(self, table_id):
+        return types.SimpleNamespace(schema=self.schema)
+
+    def load_table_from_dataframe(self, dataframe, table_id, job_config = None):
+        self.loads.append((dataframe, table_id, job_config))
+        error_result = None if getattr(job_config, 'schema', None) == self.schema else {'reason': 'invalid', 'message': 'schema mismatch'}
+
+        return types.SimpleNamespace(
+            job_id='job-{}'.format(len(self.loads)), error_result=error_result, errors=None,
+            output_rows=len(dataframe), result=lambda: None)
+
+def test_load_mixed_type_frame_with_destination_schema(google, monkeypatch):
+    ## object strings, a None-only column, tz-naive datetimes, an int column with NaN (float in pandas)
+    dataframe = pd.DataFrame({
+        'ID': [1, np.nan, 3, 4, 5],
+        'FLTID': ['UO123', 'UO456', None, 'UO789', 'UO001'],
+        'REMARK': [None] * 5,
+        'SRC_UPDATED_TIME': [datetime.datetime(2026, 10, 17, i) for i in range(5)]
+    })
+    client = _LoadClient()
+    monkeypatch.setenv('BIGQUERY_LOAD_CHUNK_ROWS', '2')
+
+    job_history = bigquery_module.insert_rows_by_dataframe(client, 'p.d.t', dataframe, stream_max_rows=2)
+    responses = bigquery_module.load_rows_by_dataframe(client, 'p.d.t', dataframe, chunk_rows=2, max_workers=2)
+
+    assert job_history == [[], [], []]
+    assert len(responses) == 3
+    for chunk, table_id, job_config in client.loads:
+        assert table_id == 'p.d.t'
+        assert job_config.schema == _LoadClient.schema
+        assert job_config.source_format == 'PARQUET'
+        assert job_config.write_disposition == 'WRITE_APPEND'
+    ## The frame is handed over as is, every row once per load
+    pd.testing.assert_frame_equal(pd.concat([chunk for chunk, _, _ in client.loads[:3]]), dataframe)
+
+def test_query_cache_hit_miss_expiry_and_eviction(tmp_path):
+    cache = bigquery_module._QueryCache(str(tmp_path), ttl=60, max_bytes=10 ** 9)
+    dataframe = pd.DataFrame({'ID': [1, 2, 3], 'FLTID': ['UO1', 'UO2', 'UO3']})
+    key = cache.get_key('SELECT 1', {'run_date': datetime.date(2026, 10, 17)}, ['p', 'sa@p'])
+
+    assert cache.get(key) is None
+    cache.put(key, dataframe)
+    pd.testing.assert_frame_equal(cache.get(key), dataframe)
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 1
+
+    ## Expired by TTL: a miss, and the entry is removed
+    path = tmp_path / (key + '.parquet')
+    os.utime(str(path), (time.time(), time.time() - 120))
+    assert cache.get(key) is None
+    assert not path.exists()
+
+    ## Above max_bytes, the least recently used entry is evicted
+    for name in ['a', 'b']:
+        cache.put(name, dataframe)
+    size = os.path.getsize(str(tmp_path / 'a.parquet'))
+    os.utime(str(tmp_path / 'a.parquet'), (time.time() - 30, time.time()))
+    small = bigquery_module._QueryCache(str(tmp_path), ttl=60, max_bytes=size)
+    small.evict()
+    assert sorted(os.listdir(str(tmp_path))) == ['b.parquet']
+
+def test_query_cache_drops_corrupt_entry(tmp_path):
+    cache = bigquery_module._QueryCache(str(tmp_path), ttl=60, max_bytes=10 ** 9)
+    (tmp_path / 'bad.parquet').write_bytes(b'PAR1 truncated')
+
+    assert cache.get('bad') is None
+    assert cache.get_stats() == {'hits': 0, 'misses': 1, 'entries': 0, 'bytes': 0}
+
+def test_query_cache_key_of_exact_sql_and_scope(tmp_path):
+    cache = bigquery_module._QueryCache(str(tmp_path), ttl=60, max_bytes=10 ** 9)
+    sql = "SELECT * FROM t WHERE name = 'a  b'"
+
+    assert cache.get_key(sql, scope=['p', 'sa@p']) == cache.get_key(sql, scope=['p', 'sa@p'])
+    assert cache.get_key(sql, scope=['p', 'sa@p']) != cache.get_key("SELECT * FROM t WHERE name = 'a b'", scope=['p', 'sa@p'])
+    assert cache.get_key(sql, scope=['p', 'sa@p']) != cache.get_key(sql, scope=['q', 'sa@q'])
+    assert cache.get_key(sql, scope=['p', 'sa@p']) != cache.get_key(sql, scope=['p', 'other@p'])
+
+class _Client():
+    created = []
+
+    def __init__(self, info):
+        self.project = info['project_id']
+        self.info = info
+        _Client.created.append(self)
+
+    @classmethod
+    def from_service_account_info(cls, info):
+        ## Slow enough for concurrent callers to race on an unguarded registry
+        time.sleep(0.01)
+        return cls(info)
+
+def get_service_account_info(project_id, client_email):
+    return {'project_id': project_id, 'client_email': client_email, 'private_key': 'key'}
+
+def test_client_registry_one_client_per_identity(google, monkeypatch):
+    google.Client = _Client
+    monkeypatch.setattr(_Client, 'created', [])
+    registry = bigquery_module._ClientRegistry()
+    info = get_service_account_info('hkexpress-dw', 'etl@hkexpress-dw')
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        clients = list(executor.map(lambda _: registry.get(dict(info)), range(16)))
+
+    assert len(_Client.created) == 1 and all(client is clients[0] for client in clients)
+    assert registry.get(get_service_account_info('hkexpress-dw', 'report@hkexpress-dw')) is not clients[0]
+    assert len(_Client.created) == 2
+
+    registry.clear()
+    assert registry.get(info) is not clients[0]
+    assert len(_Client.created) == 3
+
+def test_connect_creates_client_on_first_use(google, monkeypatch):
+    google.Client = _Client
+    monkeypatch.setattr(_Client, 'created', [])
+    monkeypatch.setattr(bigquery_module, 'CLIENTS', bigquery_module._ClientRegistry())
+    info = get_service_account_info('hkexpress-dw', 'etl@hkexpress-dw')
+
+    first = bigquery_module.BigQuery.connect(json.dumps(info))
+    second = bigquery_module.BigQuery.connect(info)
+    assert _Client.created == []
+
+    assert first.get_client() is second.get_client() is _Client.created[0]
+    assert len(_Client.created) == 1
+
+    with pytest.raises(KeyError):
+        bigquery_module.BigQuery.connect({'private_key': 'key'})
+
+class _ScalarQueryParameter():
+    def __init__(self, name, type_, value):
+        self.name, self.type_, self.value = name, type_, value
+
+class _DryRunClient():
+    project = 'hkexpress-dw'
+    tables = {
+        'legs': types.SimpleNamespace(num_bytes=1000, time_partitioning=object(), range_partitioning=None, clustering_fields=['FLTID']),
+        'asm': types.SimpleNamespace(num_bytes=3000, time_partitioning=None, range_partitioning=None, clustering_fields=None)
+    }
+
+    def __init__(self, error = None):
+        self.error = error
+        self.job_configs = []
+
+    def query(self, sql, job_config = None):
+        self.job_configs.append(job_config)
+        if self.error is not None:
+            raise self.error
+        references = [types.SimpleNamespace(project='hkexpress-dw', dataset_id='ods', table_id=name) for name in ['legs', 'asm', 'view']]
+        return types.SimpleNamespace(total_bytes_processed=400, referenced_tables=references)
+
+    def get_table(self, reference):
+        return self.tables[reference.table_id]
+
+def test_dry_run_query_estimate(google):
+    google.ScalarQueryParameter = _ScalarQueryParameter
+    client = _DryRunClient()
+
+    estimate = bigquery_module.dry_run_query(client, 'SELECT * FROM ods.legs WHERE DATOP_CHN >= @run_date', {'run_date': datetime.date(2026, 10, 17)})
+
+    job_config = client.job_configs[0]
+    assert job_config.dry_run is True and job_config.use_query_cache is False
+    assert [(p.name, p.type_, p.value) for p in job_config.query_parameters] == [('run_date', 'DATE', datetime.date(2026, 10, 17))]
+    assert estimate['referenced_tables'] == [
+        {'table_id': 'hkexpress-dw.ods.legs', 'num_bytes': 1000, 'partitioned': True, 'clustered': True},
+        {'table_id': 'hkexpress-dw.ods.asm', 'num_bytes': 3000, 'partitioned': False, 'clustered': False},
+        ## No metadata (e.g. a view), still listed
+        {'table_id': 'hkexpress-dw.ods.view', 'num_bytes': None, 'partitioned': None, 'clustered': None}]
+    assert estimate['total_bytes_processed'] == 400 and estimate['table_bytes'] == 4000
+    assert estimate['processed_bytes_ratio'] == 0.1
+    assert estimate['sql_hash'] == bigquery_module.get_sql_hash('SELECT *  FROM ods.legs\nWHERE DATOP_CHN >= @run_date')
+
+def test_dry_run_query_raises_validation_error(google):
+    class BadRequest(ValueError):
+        pass
+
+    with pytest.raises(BadRequest):
+        bigquery_module.dry_run_query(_DryRunClient(BadRequest('Unrecognized name: FLTNO')), 'SELECT FLTNO FROM ods.legs')
+
+def test_query_stats_keeps_most_recent_and_exports_json_lines(tmp_path):
+    stats = bigquery_module._QueryStats(2)
+    for i in range(3):
+        stats.record({'job_id': 'job-{}'.format(i), 'ended': datetime.datetime(2026, 10, 17, i), 'rows': i})
+
+    assert [record['job_id'] for record in stats.get_records()] == ['job-1', 'job-2']
+    assert list(stats.to_dataframe()['rows']) == [1, 2]
+
+    path = tmp_path / 'stats' / 'query_stats.jsonl'
+    assert stats.export(str(path)) == 2
+    assert stats.export(str(path)) == 2
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 4
+    assert records[0] == {'job_id': 'job-1', 'ended': '2026-10-17 01:00:00', 'rows': 1}
+
+    stats.clear()
+    assert stats.get_records() == []
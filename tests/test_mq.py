@@ -0,0 +1,251 @@
+import os
+import json
+import asyncio
+import threading
+import time
+import datetime
+
+import pytest
+
+from utils import mq as mq_module
+from utils.mq import MQ
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mq_standin.py')
+
+@pytest.fixture
+def standin(monkeypatch):
+    ### Route the Java launcher to the stand-in worker
+    monkeypatch.setattr(mq_module, 'JAVA', STANDIN)
+    for name in ['MQ_STANDIN_SLOW', 'MQ_STANDIN_DEFER', 'MQ_STANDIN_HANG', 'MQ_STANDIN_DELAY', 'MQ_STANDIN_FAIL', 'MQ_STANDIN_CONNECT_MS']:
+        monkeypatch.delenv(name, raising=False)
+
+    return monkeypatch
+
+def get_mq(**kwargs):
+    return MQ(
+        host='127.0.0.1', port='1414', queue_manager_name='QM1', channel='CH1', queue_producer_name='Q1',
+        user_name='user', password='secret', address_line_1='ADDR1', address_line_2='ADDR2',
+        sender='SENDER', message_type='ASM', bridge_class='Bridge', **kwargs)
+
+def test_publish_all_timeout_does_not_stall_bridge(standin):
+    standin.setenv('MQ_STANDIN_SLOW', 'C2')
+    standin.setenv('MQ_STANDIN_DELAY', '3')
+    rows = [('MSG{}'.format(i), 'C{}'.format(i)) for i in range(6)]
+    mq = get_mq().start_bridge()
+
+    try:
+        outcomes = asyncio.run(mq.publish_all(rows, concurrency=1, timeout=1))
+    finally:
+        mq.stop_bridge()
+
+    assert [outcome['correlationId'] for outcome in outcomes] == ['C{}'.format(i) for i in range(6)]
+    assert [outcome['status'] for outcome in outcomes] == ['OK', 'OK', 'ERROR', 'OK', 'OK', 'OK']
+    assert outcomes[2]['error'] == 'Timeout after 1s.'
+
+def test_timeout_fails_only_the_timed_out_frame(standin):
+    ### C1 is never acknowledged; C2 is in flight when C1 times out and is acknowledged later
+    standin.setenv('MQ_STANDIN_HANG', 'C1')
+    standin.setenv('MQ_STANDIN_DEFER', 'C0,C2')
+    standin.setenv('MQ_STANDIN_DELAY', '1.5')
+    rows = [('MSG{}'.format(i), 'C{}'.format(i)) for i in range(6)]
+    mq = get_mq().start_bridge()
+
+    try:
+        outcomes = asyncio.run(mq.publish_all(rows, concurrency=2, timeout=2))
+    finally:
+        mq.stop_bridge()
+
+    assert [outcome['status'] for outcome in outcomes] == ['OK', 'ERROR', 'OK', 'OK', 'OK', 'OK']
+    assert outcomes[1]['error'] == 'Timeout after 2s.'
+
+def test_unacknowledged_frames_of_a_restarted_worker_are_unknown(standin):
+    standin.setenv('MQ_STANDIN_HANG', 'C0,C1')
+    mq = get_mq()
+    bridge = mq_module._MQBridge(mq.get_java_command('Bridge'), mq.get_java_environ(), '', drain_timeout=0.5)
+    bridge.start()
+    now = datetime.datetime.now()
+
+    try:
+        abandoned = bridge.submit(mq.build_envelope('MSG', 'C0', now))
+        in_flight = bridge.submit(mq.build_envelope('MSG', 'C1', now))
+        assert bridge.abandon(abandoned)
+
+        ## The next frame drains the worker for 0.5s, then restarts it
+        assert bridge.send(mq.build_envelope('MSG', 'C2', now), timeout=10) == ('OK', '')
+        assert in_flight.result(0)[0] == 'UNKNOWN'
+        assert abandoned.cancelled()
+    finally:
+        bridge.stop()
+
+def test_async_submit_runs_off_the_event_loop(standin):
+    mq = get_mq().start_bridge()
+    bridge = mq.get_bridge()
+    submit = bridge.submit
+    threads = []
+
+    def recording_submit(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return submit(*args, **kwargs)
+
+    standin.setattr(bridge, 'submit', recording_submit)
+
+    try:
+        outcomes = asyncio.run(mq.publish_all([('MSG{}'.format(i), 'C{}'.format(i)) for i in range(4)], concurrency=2, timeout=5))
+    finally:
+        mq.stop_bridge()
+
+    assert [outcome['status'] for outcome in outcomes] == ['OK'] * 4
+    assert threads and threading.main_thread() not in threads
+
+def test_callback_times_out_and_restarts_hung_worker(standin):
+    standin.setenv('MQ_STANDIN_HANG', 'C0')
+    standin.setattr(mq_module, 'BRIDGE_SEND_TIMEOUT', 1)
+    mq = get_mq().start_bridge()
+    mq.set_message('MSG')
+
+    try:
+        mq.set_correlation_id('C0')
+        with pytest.raises(AssertionError, match='within 1s'):
+            mq.callback(datetime.datetime.now())
+        pid = mq.get_bridge()._MQBridge__process.pid
+
+        mq.set_correlation_id('C1')
+        mq.callback(datetime.datetime.now())
+        assert mq.get_bridge()._MQBridge__process.pid != pid
+    finally:
+        mq.stop_bridge()
+
+def test_publish_envelopes_times_out_stuck_messages(standin):
+    standin.setenv('MQ_STANDIN_HANG', 'C1')
+    mq = get_mq().start_bridge()
+    now = datetime.datetime.now()
+
+    try:
+        started = time.perf_counter()
+        outcomes = mq.callback_many([('MSG{}'.format(i), 'C{}'.format(i)) for i in range(3)], now, timeout=1)
+        assert time.perf_counter() - started < 5
+        ## The next batch restarts the stuck worker
+        retried = mq.callback_many([('MSG', 'C3')], now, timeout=5)
+    finally:
+        mq.stop_bridge()
+
+    assert [outcome['status'] for outcome in outcomes] == ['OK', 'ERROR', 'OK']
+    assert outcomes[1]['error'] == 'Timeout after 1s.'
+    assert [outcome['status'] for outcome in retried] == ['OK']
+
+def test_late_ack_keeps_reader_alive(standin):
+    standin.setenv('MQ_STANDIN_SLOW', 'C0')
+    standin.setenv('MQ_STANDIN_DELAY', '1')
+    mq = get_mq().start_bridge()
+    bridge = mq.get_bridge()
+
+    try:
+        future = bridge.submit(mq.build_envelope('MSG', 'C0', datetime.datetime.now()))
+        future.cancel()
+        ## The late ACK of C0 is dropped, the next frame is still acknowledged
+        assert bridge.send(mq.build_envelope('MSG', 'C1', datetime.datetime.now()), timeout=5) == ('OK', '')
+    finally:
+        mq.stop_bridge()
+
+def baseline_to_byte(sender, message_generation_time, message_type, address_line_1, address_line_2, message, correlation_id,
+                     host, port, queue_manager_name, channel, queue_producer_name, user_name, password):
+    ### MQ.to_byte() before the envelope encoder, as read by the legacy Main from argv
+    return (
+        '{\"sender\": \"' + sender +
+        '\", \"msgGenTime\": \"'+ message_generation_time.strftime("%Y-%m-%dT%H:%M:%S") +
+        '\", \"msgType\": \"'+ message_type  +
+        '\", \"payload\": \"'+ "\r\n\x01{}\r\n{} {}\r\n\x02{}=\x03".format(
+            address_line_1,
+            address_line_2,
+            message_generation_time.strftime("%d%m%y"),
+            message) +
+        '\", \"correlationId\": \"'+ correlation_id +
+        '\", \"host\": \"' + host +
+        '\", \"port\": \"' + port +
+        '\", \"queueManagerName\": \"' + queue_manager_name +
+        '\", \"channel\": \"' + channel +
+        '\", \"queueBsmSendName\": \"' + queue_producer_name +
+        '\", \"userName\": \"' + user_name +
+        '\", \"password\": \"' + password +
+        '\"}'
+    ).encode("utf-8")
+
+def test_argv_transport_matches_baseline_encoding(monkeypatch):
+    monkeypatch.setattr(mq_module, 'PAYLOAD_TRANSPORT', 'argv')
+    message_generation_time = datetime.datetime(2026, 10, 17, 8, 5, 9)
+    message = 'ASM\r\nUTC\r\n17OCT26001E001\r\nCON\r\nUO123/17OCT26\r\nJ 320 . BLHA\r\nHKG170800 NRT171300\r\n'
+    mq = get_mq()
+
+    args, stdin, temp_path = mq._MQ__get_payload_transport(mq.build_envelope(message, 'OpmLegChangeAsmCon-1', message_generation_time))
+    baseline = baseline_to_byte('SENDER', message_generation_time, 'ASM', 'ADDR1', 'ADDR2', message, 'OpmLegChangeAsmCon-1',
+                                '127.0.0.1', '1414', 'QM1', 'CH1', 'Q1', 'user', 'secret')
+
+    assert args == [f'{baseline}', '2>&1']
+    assert stdin is None and temp_path is None
+
+def test_stdin_transport_is_escaped_json(monkeypatch):
+    monkeypatch.setattr(mq_module, 'PAYLOAD_TRANSPORT', 'stdin')
+    mq = get_mq()
+    envelope = mq.build_envelope('A"B\x03', 'C1', datetime.datetime(2026, 10, 17))
+
+    args, stdin, temp_path = mq._MQ__get_payload_transport(envelope)
+
+    assert args == ['-'] and stdin == envelope
+    assert json.loads(stdin)['payload'].endswith('A"B\x03=\x03')
+
+def test_restart_count_resets_on_submit_ack(standin):
+    mq = get_mq()
+    mq.start_bridge()
+    bridge = mq.get_bridge()
+    envelope = mq.build_envelope('MSG', 'C1', datetime.datetime.now())
+
+    try:
+        ## More crashes than maximum_restarts over the session, each followed by a successful submit
+        for _ in range(mq_module.BRIDGE_MAXIMUM_RESTARTS + 2):
+            bridge.kill()
+            assert bridge.submit(envelope).result(5) == ('OK', '')
+    finally:
+        mq.stop_bridge()
+
+def test_probe_reports_timings(standin):
+    result = get_mq(probe_queue_name='PROBE.Q').probe(timeout=10)
+
+    assert result['status'] == 'OK', result['error']
+    assert result['correlationId'].startswith('ConnectivityProbe-')
+    assert result['queue'] == result['replyQueue'] == 'PROBE.Q'
+    assert result['connect_ms'] == 12.5
+    assert result['jvm_start_ms'] >= 0
+    for name in ['put_ms', 'get_ms', 'round_trip_ms']:
+        assert result[name] > 0
+    assert result['round_trip_ms'] >= result['put_ms'] + result['get_ms']
+
+def test_probe_reports_errors(standin):
+    standin.setenv('MQ_STANDIN_FAIL', 'GET')
+    result = get_mq(probe_queue_name='PROBE.Q').probe(timeout=10)
+
+    assert result['status'] == 'ERROR'
+    assert 'GET failed' in result['error']
+    assert result['put_ms'] > 0
+    assert result['get_ms'] > 0
+    assert result['round_trip_ms'] is None
+
+    ## Nothing was put on the reply queue
+    standin.delenv('MQ_STANDIN_FAIL')
+    result = get_mq(probe_queue_name='PROBE.Q').probe(reply_queue_name='REPLY.Q', timeout=10)
+
+    assert result['status'] == 'ERROR'
+    assert 'no message for ' + result['correlationId'] in result['error']
+
+def test_probe_reports_timeout(standin):
+    standin.setenv('MQ_STANDIN_SLOW', 'ConnectivityProbe-')
+    standin.setenv('MQ_STANDIN_DELAY', '3')
+    result = get_mq(probe_queue_name='PROBE.Q').probe(timeout=1)
+
+    assert result['status'] == 'ERROR'
+    assert result['error'] == 'Timeout after 1s.'
+    assert result['connect_ms'] == 12.5
+    assert result['put_ms'] is None
+
+def test_probe_requires_queue(standin):
+    with pytest.raises(ValueError):
+        get_mq().probe()
@@ -0,0 +1,43 @@
+from utils.outbox import Outbox
+
+class _MQ():
+    ### Records sent correlationIds, fails those listed once
+    def __init__(self, failures = ()):
+        self.sent = []
+        self.failures = set(failures)
+
+    def callback_many(self, rows):
+        outcomes = []
+        for payload, correlation_id in rows:
+            self.sent.append(correlation_id)
+            status = 'ERROR' if correlation_id in self.failures else 'OK'
+            self.failures.discard(correlation_id)
+            outcomes.append({'correlationId': correlation_id, 'status': status, 'error': ''})
+
+        return outcomes
+
+def test_re_extracted_pending_message_is_sent_once(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    mq = _MQ(failures=['B'])
+
+    ## First run: B fails and stays pending
+    assert outbox.append_many([('PA', 'A'), ('PB', 'B')]) == 2
+    outbox.publish(mq)
+
+    ## Second run re-extracts B (and a new A2)
+    mq.sent = []
+    assert outbox.append_many([('PB', 'B'), ('PA2', 'A2'), ('PA2', 'A2')]) == 1
+    outbox.publish(mq)
+
+    assert mq.sent == ['B', 'A2']
+    assert outbox.count_pending() == 0
+    outbox.close()
+
+def test_acked_correlation_id_can_be_appended_again(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    first = outbox.append('PA', 'A')
+
+    assert outbox.append('PA', 'A') == first
+    outbox.ack([first])
+    assert outbox.append('PA', 'A') != first
+    outbox.close()
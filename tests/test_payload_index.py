@@ -0,0 +1,37 @@
+import datetime
+
+import pandas as pd
+
+from utils.payload_index import PayloadIndex, get_latest_per_leg, get_payload_hash
+
+def test_rebuild_keeps_latest_message_per_leg(tmp_path):
+    datop_chn = datetime.date(2026, 10, 20)
+    history = pd.DataFrame({
+        'FLTID': ['UO123', 'UO123', 'UO123', 'UO456'],
+        'DATOP_CHN': [datop_chn] * 4,
+        'correlationId': ['OpmLegChangeAsmCon-UO123-261017090000', 'OpmLegChangeAsmCon-UO123-261017100000',
+                          'OpmLegChangeAsmCon-UO123-261016090000', 'OpmLegChangeAsmCon-UO456-261017090000'],
+        'payload': ['P2', 'P3', 'P1', 'Q1']
+    })
+    index = PayloadIndex(str(tmp_path / 'index.db'))
+
+    assert index.rebuild(history) == 2
+
+    ## The leg changed back to an older payload: still a change against the latest (P3)
+    extract = pd.DataFrame({'FLTID': ['UO123', 'UO456'], 'DATOP_CHN': [datop_chn] * 2, 'payload': ['P2', 'Q1']})
+    assert list(index.filter_changed(extract)['payload']) == ['P2']
+    index.close()
+
+def test_latest_per_leg_by_src_updated_time():
+    rows = pd.DataFrame({
+        'FLTID': ['UO123', 'UO123'],
+        'DATOP_CHN': ['2026-10-20', '2026-10-20'],
+        'SRC_UPDATED_TIME': [datetime.datetime(2026, 10, 17, 10), datetime.datetime(2026, 10, 17, 9)],
+        'payload': ['NEW', 'OLD']
+    })
+
+    latest = get_latest_per_leg(rows)
+
+    assert list(latest['payload']) == ['NEW']
+    assert list(latest.columns) == list(rows.columns)
+    assert get_payload_hash('NEW') != get_payload_hash('OLD')
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from utils.pipeline import run_asm_con_projects
+
+class _BigQuery():
+    def select_pages_by_standard_sql(self, sql, query_parameters = None, page_size = None):
+        yield pd.DataFrame({'correlationId': ['A', 'B'], 'payload': ['P1', 'P2']})
+        yield pd.DataFrame({'correlationId': ['C'], 'payload': ['P3']})
+
+class _MQ():
+    def get_bridge(self):
+        return None
+
+    def get_bridge_class(self):
+        return ''
+
+    def build_envelopes(self, page, message_generation_time):
+        return list(page['correlationId'])
+
+    def publish_envelopes(self, envelopes, message_generation_time):
+        ### The second page fails after the first one is published
+        if 'C' in envelopes:
+            raise ConnectionError('publish failed')
+        return [{'correlationId': envelope, 'status': 'ERROR' if envelope == 'B' else 'OK'} for envelope in envelopes]
+
+def test_failed_project_keeps_partial_summary():
+    summaries, totals = run_asm_con_projects([{'project_id': 'dml-prod', 'bigquery': _BigQuery(), 'mq': _MQ(), 'sql': 'SELECT 1'}])
+
+    assert summaries[0]['status'] == 'ERROR'
+    assert 'publish failed' in summaries[0]['error']
+    assert (summaries[0]['sent'], summaries[0]['failed']) == (1, 1)
+    assert (totals['sent'], totals['failed'], totals['failed_projects']) == (1, 1, 1)
@@ -0,0 +1,175 @@
+import os
+import time
+import types
+
+import pytest
+
+import sftp_standin
+from utils import sftp as sftp_module
+from utils.sftp import SFTP, _Connection, _SFTPFileDownloader, _SFTPFileUploader, download_file, upload_file, write_checkpoint, get_paramiko_transport, get_sftp_client
+
+FILE_SIZE = 3 * 1024 * 1024
+### Past the first window of pipelined requests (48 x 32KB), so some data is written before the drop
+DROP_OFFSET = 5 * 512 * 1024
+
+class _Time():
+    ### No reconnect back-off in tests
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def sleep(self, seconds):
+        pass
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    root = tmp_path / 'remote'
+    root.mkdir()
+    monkeypatch.setattr(sftp_module, 'time', _Time())
+    monkeypatch.setattr(sftp_module, 'CHECKPOINT_SIZE', 256 * 1024)
+    monkeypatch.setattr(sftp_module, 'CHECKPOINT_PATH', str(tmp_path / 'checkpoints'))
+
+    return types.SimpleNamespace(port=sftp_standin.serve(root), root=root, local=tmp_path)
+
+def connect(server):
+    return get_sftp_client(get_paramiko_transport('127.0.0.1', server.port, 'user', 'secret'))
+
+def drop_once(monkeypatch, transfer, at):
+    ### Close the transport once, when a request at offset >= at is sent. Return the offsets the transfer started from
+    method = '_sftp_async_read_request' if transfer is _SFTPFileDownloader else '_sftp_async_write_request'
+    request = getattr(transfer, method)
+    initialize = transfer.__init__
+    offsets = []
+    dropped = []
+
+    def dropping_request(self, fileobj, file_handle, offset, **kwargs):
+        if offset >= at and not dropped:
+            dropped.append(offset)
+            sftp_client = self.f_in.sftp if transfer is _SFTPFileDownloader else self.f_out.sftp
+            sftp_client.get_channel().get_transport().close()
+        return request(self, fileobj, file_handle, offset, **kwargs)
+
+    def recording_initialize(self, *args, **kwargs):
+        initialize(self, *args, **kwargs)
+        offsets.append(self.offset)
+
+    monkeypatch.setattr(transfer, method, dropping_request)
+    monkeypatch.setattr(transfer, '__init__', recording_initialize)
+
+    return offsets
+
+def test_download_resumes_after_dropped_connection(server, monkeypatch):
+    content = os.urandom(FILE_SIZE)
+    (server.root / 'big.bin').write_bytes(content)
+    local_path = str(server.local / 'big.bin')
+    offsets = drop_once(monkeypatch, _SFTPFileDownloader, DROP_OFFSET)
+    sftp_client = connect(server)
+    connection = _Connection(sftp_client, 'user', 'secret')
+
+    try:
+        assert download_file(sftp_client, '/big.bin', local_path, connection=connection) is connection.client
+    finally:
+        connection.close()
+
+    assert offsets[0] == 0 and len(offsets) == 2 and 0 < offsets[1] < FILE_SIZE
+    assert open(local_path, 'rb').read() == content
+    assert not os.path.exists(local_path + '.part') and not os.path.exists(local_path + '.part.json')
+
+def test_download_discards_stale_partial_of_changed_remote(server):
+    ### An old partial of the previous remote version and its checkpoint are left on disk
+    content = os.urandom(2000)
+    (server.root / 'new.bin').write_bytes(content)
+    os.utime(str(server.root / 'new.bin'), (200, 200))
+    local_path = str(server.local / 'new.bin')
+    open(local_path + '.part', 'wb').write(b'x' * 300)
+    write_checkpoint(local_path + '.part.json', '/new.bin', 1000, 100, 300)
+
+    class _DroppedClient():
+        def open(self, path, mode):
+            raise EOFError('connection dropped')
+
+    sftp_client = connect(server)
+    connection = types.SimpleNamespace(reconnect=lambda: sftp_client)
+
+    download_file(_DroppedClient(), '/new.bin', local_path, file_size=2000, mtime=200, connection=connection)
+
+    assert open(local_path, 'rb').read() == content
+
+def test_upload_resumes_unchanged_local_file(server, monkeypatch):
+    content = os.urandom(FILE_SIZE)
+    local_path = server.local / 'up.bin'
+    local_path.write_bytes(content)
+    offsets = drop_once(monkeypatch, _SFTPFileUploader, DROP_OFFSET)
+
+    ## No connection: the dropped upload fails, the partial and its local checkpoint are kept
+    with pytest.raises(Exception):
+        upload_file(connect(server), str(local_path), '/up.bin')
+    assert os.listdir(sftp_module.CHECKPOINT_PATH)
+
+    upload_file(connect(server), str(local_path), '/up.bin')
+
+    assert offsets[0] == 0 and 0 < offsets[1] < FILE_SIZE
+    assert (server.root / 'up.bin').read_bytes() == content
+    assert not (server.root / 'up.bin.part').exists()
+    assert not os.listdir(sftp_module.CHECKPOINT_PATH)
+
+def test_upload_restarts_rewritten_local_file(server, monkeypatch):
+    local_path = server.local / 'up.bin'
+    local_path.write_bytes(os.urandom(FILE_SIZE))
+    offsets = drop_once(monkeypatch, _SFTPFileUploader, DROP_OFFSET)
+
+    with pytest.raises(Exception):
+        upload_file(connect(server), str(local_path), '/up.bin')
+
+    ## Same size, new content; the remote partial looks newer than the local file to a clock comparison
+    content = os.urandom(FILE_SIZE)
+    local_path.write_bytes(content)
+    os.utime(str(server.root / 'up.bin.part'), (time.time() + 3600, time.time() + 3600))
+
+    upload_file(connect(server), str(local_path), '/up.bin')
+
+    assert offsets == [0, 0]
+    assert (server.root / 'up.bin').read_bytes() == content
+
+def test_upload_reconnects_after_dropped_connection(server, monkeypatch):
+    content = os.urandom(FILE_SIZE)
+    local_path = server.local / 'up.bin'
+    local_path.write_bytes(content)
+    offsets = drop_once(monkeypatch, _SFTPFileUploader, DROP_OFFSET)
+    sftp_client = connect(server)
+    connection = _Connection(sftp_client, 'user', 'secret')
+
+    try:
+        upload_file(sftp_client, str(local_path), '/up.bin', connection=connection)
+    finally:
+        connection.close()
+
+    assert len(offsets) == 2 and 0 < offsets[1] < FILE_SIZE
+    assert (server.root / 'up.bin').read_bytes() == content
+
+def test_sftp_adopts_reconnected_transport(server, monkeypatch):
+    monkeypatch.setattr(sftp_module, 'PIPELINED_UPLOAD_SIZE', 1024 * 1024)
+    monkeypatch.setattr(sftp_module, 'LARGE_FILE_SIZE', 1024 * 1024)
+    content = os.urandom(FILE_SIZE)
+    local_path = server.local / 'up.bin'
+    local_path.write_bytes(content)
+    (server.local / 'download').mkdir()
+    sftp = SFTP('127.0.0.1', server.port, 'user', 'secret')
+    sftp.connect()
+
+    try:
+        for transfer, call in [
+                (_SFTPFileUploader, lambda: sftp.put_file(str(local_path), '/dir/up.bin')),
+                (_SFTPFileDownloader, lambda: sftp.get('/dir/', str(server.local / 'download')))]:
+            transport = sftp._SFTP__transport
+            with monkeypatch.context() as patch:
+                drop_once(patch, transfer, DROP_OFFSET)
+                call()
+
+            ## The dropped transport is replaced and closed once, the new one stays in use
+            assert sftp._SFTP__transport is not transport and sftp._SFTP__transport.is_active()
+            assert not transport.is_active()
+            assert sftp.list_dir('/dir') == ['up.bin']
+    finally:
+        sftp.close()
+
+    assert (server.local / 'download' / 'up.bin').read_bytes() == content
@@ -0,0 +1,150 @@
+"""
+    Name:
+        asm.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Vectorized ASM CON message builder from raw leg columns (sqls.asm_con.RAW_LEG_COLUMNS).
+        Output is identical to the payload/correlationId expressions of the msg_payload query,
+        so messages can be generated, tested and benchmarked offline.
+        Accept pyarrow.RecordBatch/Table, pandas.Dataframe or a dict of NumPy arrays.
+        Library only, the extract paths (mq.py, pipeline.py) still build messages in the msg_payload query;
+        parity with the SQL is checked by tests/test_asm.py.
+    Note:
+        20261017 - Init commit
+"""
+
+import numpy as np
+
+### SERVICE_TYPE_ID -> service type letter, index 0 and unknown ids map to 'J'
+SERVICE_TYPES = np.array(['J', 'C', 'D', 'E', 'F', 'J', 'K', 'L', 'M', 'O', 'P', 'Q', 'S', 'T', 'X', 'Z', 'T'])
+### ACTYPE -> IATA aircraft type, otherwise ACTYPE itself
+AIRCRAFT_TYPES = {'A321': '321', 'A320': '320', 'A21N': '32Q'}
+### FORMAT_DATETIME %b is locale independent in BigQuery
+MONTHS = np.array(['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'])
+
+def get_column(batch, name):
+    column = batch[name]
+
+    if hasattr(column, 'to_numpy'):
+        try:
+            return column.to_numpy(zero_copy_only=False)
+        except TypeError:
+            return column.to_numpy()
+
+    return np.asarray(column)
+
+def get_null_mask(values):
+    if values.dtype.kind == 'M':
+        return np.isnat(values)
+    elif values.dtype.kind == 'f':
+        return np.isnan(values)
+    elif values.dtype.kind == 'O':
+        return np.equal(values, None) | (values != values)
+
+    return np.zeros(len(values), dtype=bool)
+
+def to_string(values):
+    ## Nulls become '', the null mask is applied to the final result
+    if values.dtype.kind == 'O':
+        values = np.where(get_null_mask(values), '', values)
+
+    return values.astype(str)
+
+def zfill(values, width = 2):
+    return np.char.zfill(values.astype(np.int64).astype(str), width)
+
+def to_minutes(values):
+    return np.asarray(values, dtype='datetime64[s]').astype('datetime64[m]')
+
+def format_date(values):
+    ### UPPER(FORMAT_DATETIME("%d%b%y", values))
+    month = values.astype('datetime64[M]')
+    day = (values.astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64) + 1
+    year = values.astype('datetime64[Y]').astype(np.int64) + 1970
+
+    return np.char.add(np.char.add(zfill(day), MONTHS[month.astype(np.int64) % 12]), zfill(year % 100))
+
+def format_day_time(values):
+    ### FORMAT_DATETIME("%d%H%M", values)
+    month = values.astype('datetime64[M]')
+    day = (values.astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64) + 1
+    minutes = (values - values.astype('datetime64[D]')).astype(np.int64)
+
+    return np.char.add(np.char.add(zfill(day), zfill(minutes // 60)), zfill(minutes % 60))
+
+def format_updated_time(values):
+    ### UPPER(FORMAT_DATETIME("-%y%m%d%H%M%S", values))
+    values = np.asarray(values, dtype='datetime64[s]')
+    month = values.astype('datetime64[M]')
+    year = values.astype('datetime64[Y]').astype(np.int64) + 1970
+    day = (values.astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64) + 1
+    seconds = (values - values.astype('datetime64[D]')).astype(np.int64)
+
+    parts = [zfill(year % 100), zfill(month.astype(np.int64) % 12 + 1), zfill(day),
+             zfill(seconds // 3600), zfill(seconds // 60 % 60), zfill(seconds % 60)]
+    result = np.full(len(values), '-', dtype='U1')
+    for part in parts:
+        result = np.char.add(result, part)
+
+    return result
+
+def concat(*parts):
+    result = parts[0]
+    for part in parts[1:]:
+        result = np.char.add(result, part)
+
+    return result
+
+def build_asm_con(batch):
+    ### Return {'correlationId', 'msgType', 'payload'} NumPy object arrays for a batch of raw leg columns.
+    ### Like SQL concatenation, a null in any concatenated column gives a null (None) message
+    datop = to_minutes(get_column(batch, 'DATOP'))
+    std = to_minutes(get_column(batch, 'STD'))
+    sta = to_minutes(get_column(batch, 'STA'))
+    updated_time = get_column(batch, 'SRC_UPDATED_TIME')
+    service_type_id = get_column(batch, 'SERVICE_TYPE_ID')
+    actype = get_column(batch, 'ACTYPE')
+    strings = {name: get_column(batch, name) for name in ['FLTID', 'ACOWN', 'SRC_FLIGHT_NO', 'LONG_REG', 'DEPSTN', 'ARRSTN']}
+
+    payload_nulls = get_null_mask(datop) | get_null_mask(std) | get_null_mask(sta) | get_null_mask(actype)
+    for name in ['ACOWN', 'SRC_FLIGHT_NO', 'LONG_REG', 'DEPSTN', 'ARRSTN']:
+        payload_nulls = payload_nulls | get_null_mask(strings[name])
+
+    ## Service type letter, nulls and unknown ids fall back to 'J'
+    service_type_nulls = get_null_mask(service_type_id)
+    service_type_id = np.where(service_type_nulls, 0, service_type_id).astype(np.int64)
+    service_type_id = np.where((service_type_id < 0) | (service_type_id >= len(SERVICE_TYPES)), 0, service_type_id)
+    service_type = SERVICE_TYPES[service_type_id]
+
+    actype = to_string(actype)
+    aircraft_type = actype.copy()
+    for name, iata in AIRCRAFT_TYPES.items():
+        aircraft_type = np.where(actype == name, iata, aircraft_type)
+
+    date = format_date(np.where(np.isnat(datop), np.datetime64(0, 'm'), datop))
+    payload = concat(
+        'ASM\r\nUTC\r\n', date, '001E001\r\n',
+        'CON\r\n',
+        to_string(strings['ACOWN']), to_string(strings['SRC_FLIGHT_NO']), '/', date, '\r\n',
+        service_type, ' ', aircraft_type, ' . ', to_string(strings['LONG_REG']), '\r\n',
+        to_string(strings['DEPSTN']), format_day_time(np.where(np.isnat(std), np.datetime64(0, 'm'), std)), ' ',
+        to_string(strings['ARRSTN']), format_day_time(np.where(np.isnat(sta), np.datetime64(0, 'm'), sta)), '\r\n')
+
+    updated_time = np.asarray(updated_time, dtype='datetime64[s]')
+    correlation_nulls = get_null_mask(strings['FLTID']) | np.isnat(updated_time)
+    correlation_id = concat(
+        'OpmLegChangeAsmCon-',
+        to_string(strings['FLTID']),
+        format_updated_time(np.where(np.isnat(updated_time), np.datetime64(0, 's'), updated_time)))
+
+    payload = payload.astype(object)
+    payload[payload_nulls] = None
+    correlation_id = correlation_id.astype(object)
+    correlation_id[correlation_nulls] = None
+
+    return {
+        'correlationId': correlation_id,
+        'msgType': np.full(len(payload), 'ASM', dtype=object),
+        'payload': payload
+    }
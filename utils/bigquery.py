@@ -22,15 +22,53 @@
         20231012 - Update wordings
         20240205 - Remove get_service_account, Code refactor, not backward compatible
         20240215 - Update Descriptions, allow multiple type (path/json string/json object) for service_account_json
+        20261017 - Support query parameters
+        20261017 - Add page iterator
+        20261017 - Add load job from JSON rows
+        20261017 - Add streaming Arrow iterator on the Storage Read API; fetch result once
+        20261017 - Add opt-in on-disk query result cache
+        20261017 - Add concurrent job submission (submit/gather) with job stats
+        20261017 - Shared lazy client registry per service account; import google.cloud.bigquery on first use
+        20261017 - Size-aware INSERT, large Dataframe by parallel Parquet load jobs
+        20261017 - Add dry-run cost estimate and in-memory query stats
+        20261017 - Add DDL/DML execution
+        20261017 - Bugfix: raise the dry run validation error as is
+        20261017 - Bugfix: INSERT returns Google's error list format for loaded Dataframe too
+        20261017 - Bugfix: load Dataframe with the destination table schema
+        20261017 - Bugfix: unreadable cache entries are misses; cache key of the exact SQL and the client scope
 '''
 
-from google.cloud import bigquery
 import os.path
+import sys
 import json
+import time
+import hashlib
+import datetime
+import threading
+import collections
+import concurrent.futures
 
 from .logging import Logging
 LOG = Logging(__name__)
 
+### google.cloud.bigquery, imported on first use by import_bigquery()
+bigquery = None
+
+### Query result cache DEFAULTs
+if not os.environ.get('BIGQUERY_CACHE_DIR'): os.environ['BIGQUERY_CACHE_DIR'] = os.path.join(os.getcwd(), 'cache', 'bigquery').replace('\\', '/')
+if not os.environ.get('BIGQUERY_CACHE_TTL'): os.environ['BIGQUERY_CACHE_TTL'] = '900'
+if not os.environ.get('BIGQUERY_CACHE_MAX_BYTES'): os.environ['BIGQUERY_CACHE_MAX_BYTES'] = str(512 * 1024 * 1024)
+
+### Concurrent job collection DEFAULT
+if not os.environ.get('BIGQUERY_MAXIMUM_JOBS'): os.environ['BIGQUERY_MAXIMUM_JOBS'] = '8'
+
+### INSERT DEFAULTs: Dataframe above BIGQUERY_STREAM_MAX_ROWS rows are loaded by Parquet load jobs of BIGQUERY_LOAD_CHUNK_ROWS rows
+if not os.environ.get('BIGQUERY_STREAM_MAX_ROWS'): os.environ['BIGQUERY_STREAM_MAX_ROWS'] = '5000'
+if not os.environ.get('BIGQUERY_LOAD_CHUNK_ROWS'): os.environ['BIGQUERY_LOAD_CHUNK_ROWS'] = '200000'
+
+### Query stats DEFAULT, most recent records kept in memory
+if not os.environ.get('BIGQUERY_STATS_MAX_RECORDS'): os.environ['BIGQUERY_STATS_MAX_RECORDS'] = '1000'
+
 class Exception():
     def client_not_found():
         err_msg = 'Client not found!\nCalled BigQuery Operation without creating the connection client(section). Please constuct by BigQuery.connect(service_account_key) to establish the connection.'
@@ -71,7 +109,7 @@ class Exception():
     def exception_insert_sql(job_history):
         err_msg = 'Failed to INSERT Dataframe to BigQuery, mostly due to SQL Exception.\nBigQuery Job Summary:\n{}\n'.format(str(job_history))
         LOG.error(err_msg)
-        LOG.error(job_history)
+        LOG.error(str(job_history))
         raise AssertionError(__name__, err_msg)
     
     def system_error_insert_sql():
@@ -79,97 +117,716 @@ class Exception():
         LOG.error(err_msg)
         raise SystemError(__name__, err_msg)
 
-def connect_bigquery(service_account_json):
-    ### Connect to BigQuery, create section, return the connection client, accept os.PathLike or service account json
+    def exception_load_chunks(table_id, failures, count):
+        err_msg = '[Error 1] Failed to LOAD {} of {} chunk(s) to BigQuery Table - {}\n{}'.format(
+            len(failures), count, table_id,
+            '\n'.join('Chunk {} (rows {}-{}), job {}: {}'.format(
+                failure['chunk'], failure['start'], failure['end'], failure['job_id'], failure['errors']) for failure in failures))
+        LOG.error(err_msg)
+        raise AssertionError(__name__, err_msg)
+
+    def timeout_gather(count, timeout):
+        err_msg = '[Error 1] {} BigQuery job(s) not finished within {}s.'.format(count, timeout)
+        LOG.error(err_msg)
+        raise TimeoutError(__name__, err_msg)
+
+def import_bigquery():
+    global bigquery
+
+    if bigquery is None:
+        from google.cloud import bigquery as module
+        bigquery = module
+
+    return bigquery
+
+def load_service_account_json(service_account_json):
+    ### Parse the service account, accept os.PathLike, json string, json object (dict) or file object
     try:
-        if os.path.isfile(service_account_json):
-            io = open(service_account_json)
-            service_account_json = json.load(io)
-            io.close()
-        elif isinstance(service_account_json, str):
-            service_account_json = json.loads(service_account_json.replace("'", "\""))
+        if isinstance(service_account_json, dict):
+            return service_account_json
+        elif isinstance(service_account_json, str) and service_account_json.lstrip().startswith('{'):
+            return json.loads(service_account_json.replace("'", "\""))
+        elif isinstance(service_account_json, (str, os.PathLike)):
+            with open(service_account_json) as io:
+                return json.load(io)
         else:
-            service_account_json = json.load(service_account_json)
-            
-        LOG.info('Establish connection: ' + service_account_json['project_id'])
-        
-        client = bigquery.Client.from_service_account_info(service_account_json)
-        
-        LOG.info('Session created. ' + client.project.title())
-        
-        return client
-    except FileNotFoundError:
+            return json.load(service_account_json)
+    except (FileNotFoundError, TypeError):
         Exception.service_account_key_not_found()
+    except ValueError:
+        Exception.invalid_service_account_json()
+
+def get_service_account_identity(service_account_info):
+    try:
+        return (service_account_info['project_id'], service_account_info['client_email'])
     except KeyError:
         Exception.invalid_service_account_json()
+
+class _ClientRegistry():
+    """
+    Process-wide bigquery.Client per service account identity (project_id, client_email).
+    A client is created on first use and shared by every thread; bigquery.Client is thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self.__clients = {}
+        self.__lock = threading.Lock()
+
+    def get(self, service_account_info):
+        identity = get_service_account_identity(service_account_info)
+
+        with self.__lock:
+            client = self.__clients.get(identity)
+
+            if client is None:
+                LOG.info('Establish connection: ' + identity[0])
+
+                try:
+                    client = import_bigquery().Client.from_service_account_info(service_account_info)
+                except:
+                    LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+                    Exception.exception_connection_client()
+
+                LOG.info('Session created. ' + client.project.title())
+                self.__clients[identity] = client
+
+        return client
+
+    def clear(self):
+        with self.__lock:
+            self.__clients = {}
+
+CLIENTS = _ClientRegistry()
+
+def connect_bigquery(service_account_json):
+    ### Connect to BigQuery, return the shared connection client of the service account, accept os.PathLike or service account json
+    return CLIENTS.get(load_service_account_json(service_account_json))
+
+def get_query_parameter(name, value):
+    ### Map a python value to a BigQuery ScalarQueryParameter, type inferred from the value
+    bigquery = import_bigquery()
+
+    if isinstance(value, bigquery.ScalarQueryParameter):
+        return value
+    elif isinstance(value, bool):
+        return bigquery.ScalarQueryParameter(name, 'BOOL', value)
+    elif isinstance(value, int):
+        return bigquery.ScalarQueryParameter(name, 'INT64', value)
+    elif isinstance(value, float):
+        return bigquery.ScalarQueryParameter(name, 'FLOAT64', value)
+    elif isinstance(value, datetime.datetime):
+        return bigquery.ScalarQueryParameter(name, 'TIMESTAMP' if value.tzinfo is not None else 'DATETIME', value)
+    elif isinstance(value, datetime.date):
+        return bigquery.ScalarQueryParameter(name, 'DATE', value)
+    else:
+        return bigquery.ScalarQueryParameter(name, 'STRING', None if value is None else str(value))
+
+def get_query_job_config(query_parameters = None, dry_run = False):
+    if not query_parameters and not dry_run:
+        return None
+
+    job_config = import_bigquery().QueryJobConfig(
+        query_parameters=[get_query_parameter(name, value) for name, value in (query_parameters or {}).items()])
+
+    if dry_run:
+        job_config.dry_run = True
+        job_config.use_query_cache = False
+
+    return job_config
+
+def get_sql_hash(sql):
+    ### Short digest of the normalized SQL text, groups stats of the same query across runs
+    return hashlib.sha256(' '.join(str(sql).split()).encode('utf-8')).hexdigest()[:16]
+
+def get_job_stats(response, rows = None):
+    ### Timing, bytes processed and slot-ms of a finished query job
+    elapsed = None
+    if response.ended and response.started:
+        elapsed = (response.ended - response.started).total_seconds()
+
+    return {
+        'job_id': response.job_id,
+        'sql_hash': get_sql_hash(response.query),
+        'started': response.started,
+        'ended': response.ended,
+        'elapsed_seconds': elapsed,
+        'total_bytes_processed': response.total_bytes_processed,
+        'total_bytes_billed': response.total_bytes_billed,
+        'slot_millis': response.slot_millis,
+        'cache_hit': response.cache_hit,
+        'rows': rows
+    }
+
+class _QueryStats():
+    """
+    Process-wide record of finished query jobs (get_job_stats), most recent max_records kept.
+    """
+
+    def __init__(self, max_records) -> None:
+        self.__records = collections.deque(maxlen=int(max_records))
+        self.__lock = threading.Lock()
+
+    def record(self, job_stats):
+        with self.__lock:
+            self.__records.append(job_stats)
+
+        return job_stats
+
+    def get_records(self):
+        with self.__lock:
+            return list(self.__records)
+
+    def clear(self):
+        with self.__lock:
+            self.__records.clear()
+
+    def to_dataframe(self):
+        import pandas
+        return pandas.DataFrame(self.get_records())
+
+    def export(self, path):
+        ### Append the records as JSON lines, return the number of records written
+        records = self.get_records()
+
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+        LOG.info('Exported {} query stats record(s) - "{}"'.format(len(records), path))
+
+        return len(records)
+
+QUERY_STATS = _QueryStats(os.environ.get('BIGQUERY_STATS_MAX_RECORDS'))
+
+def dry_run_query(client, sql, query_parameters = None):
+    ### Validate Standard SQL without running it, return the estimate:
+    ### bytes processed, referenced tables and bytes processed over the bytes of the referenced tables
+    LOG.info('Dry run SQL on {}:\n{}\n'.format(client.project.title(), sql))
+
+    try:
+        response = client.query(sql, job_config=get_query_job_config(query_parameters, dry_run=True))
     except:
-        Exception.exception_connection_client()
+        ## The validation error (e.g. BadRequest) is the result of a failed dry run, raise it as is
+        LOG.error('Dry run failed - {}'.format(getattr(sys.exc_info()[1], 'message', None) or str(sys.exc_info()[1])))
+        raise
 
-def select_rows_by_standard_sql(client, sql):
-    ### Select rows by execute Standard SQL on BigQuery, return pandas.Dataframe()
-    response = None
-    
+    tables = []
+    for reference in response.referenced_tables or []:
+        table_id = '{}.{}.{}'.format(reference.project, reference.dataset_id, reference.table_id)
+        try:
+            table = client.get_table(reference)
+            tables.append({
+                'table_id': table_id,
+                'num_bytes': table.num_bytes,
+                'partitioned': table.time_partitioning is not None or table.range_partitioning is not None,
+                'clustered': bool(table.clustering_fields)
+            })
+        except:
+            ## Views and tables without metadata access are still listed
+            tables.append({'table_id': table_id, 'num_bytes': None, 'partitioned': None, 'clustered': None})
+
+    table_bytes = sum(table['num_bytes'] or 0 for table in tables)
+    estimate = {
+        'sql_hash': get_sql_hash(sql),
+        'total_bytes_processed': response.total_bytes_processed,
+        'referenced_tables': tables,
+        'table_bytes': table_bytes,
+        ## Column projection and partition pruning together, not a partition pruning signal on its own
+        'processed_bytes_ratio': round(response.total_bytes_processed / table_bytes, 4) if table_bytes else None
+    }
+
+    LOG.info('Dry run - {} bytes to process over {} table(s), processed bytes ratio: {}'.format(
+        estimate['total_bytes_processed'], len(tables), estimate['processed_bytes_ratio']))
+
+    return estimate
+
+def submit_query(client, sql, query_parameters = None):
+    ### Submit a query job without waiting for its result, return the QueryJob
     LOG.info('Execute SQL on {}:\n{}\n'.format(client.project.title(), sql))
-    
+    if query_parameters:
+        LOG.info('Query parameters: {}'.format(str(query_parameters)))
+
+    try:
+        return client.query(sql, job_config=get_query_job_config(query_parameters))
+    except:
+        Exception.exception_select_sql(None)
+
+def collect_query(response):
+    ### Wait for a submitted query job, return (pandas.Dataframe(), job stats)
     try:
-        response = client.query(sql)
-        if response.ended and response.started:
-            LOG.info('SQL executed. Timelapsed: ' + str(response.ended - response.started))
-            
         df = response.result().to_dataframe()
-            
-        LOG.info('Retrieved {} rows.\n'.format(len(df)))
+    except:
+        Exception.exception_select_sql(response)
+
+    job_stats = QUERY_STATS.record(get_job_stats(response, len(df)))
+    LOG.info('SQL executed - {}. Timelapsed: {}s, {} bytes processed, {} slot-ms.'.format(
+        job_stats['job_id'], job_stats['elapsed_seconds'], job_stats['total_bytes_processed'], job_stats['slot_millis']))
+    LOG.info('Retrieved {} rows.\n'.format(len(df)))
+
+    return df, job_stats
+
+def select_rows_by_standard_sql(client, sql, query_parameters = None):
+    ### Select rows by execute Standard SQL on BigQuery, return pandas.Dataframe(). query_parameters: {name: value} for @name
+    df, job_stats = collect_query(submit_query(client, sql, query_parameters))
+
+    if os.environ.get('LOG_LEVEL') == 'DEBUG':
         LOG.debug('\n{}\n'.format(df.to_string()))
 
-        return response.result().to_dataframe()
-    except: 
+    return df
+
+def execute_by_standard_sql(client, sql, query_parameters = None):
+    ### Execute a DDL/DML statement (CREATE, MERGE, ...) on BigQuery and wait, return the number of affected rows (None for DDL)
+    response = submit_query(client, sql, query_parameters)
+
+    try:
+        response.result()
+    except:
         Exception.exception_select_sql(response)
 
-def insert_rows_by_dataframe(client, table_id, dataframe):
-    ### Insert many rows from pandas Dataframe to Google BigQuery, return the job history(Google's format)
-    
+    QUERY_STATS.record(get_job_stats(response, response.num_dml_affected_rows))
+    LOG.info('SQL executed - {}. Affected rows: {}'.format(response.job_id, response.num_dml_affected_rows))
+
+    return response.num_dml_affected_rows
+
+def get_bqstorage_client(client):
+    ### BigQuery Storage Read API client sharing the credentials of the BigQuery client, None if unavailable
+    try:
+        from google.cloud import bigquery_storage
+
+        return bigquery_storage.BigQueryReadClient(credentials=client._credentials)
+    except:
+        LOG.warning('BigQuery Storage Read API unavailable, fallback to REST pagination.\nDEBUG - {} {}'.format(
+            str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+        return None
+
+def select_rows_iter(client, sql, query_parameters = None, page_size = 10000, bqstorage_client = None, as_arrow = True):
+    ### Execute Standard SQL, stream the result without materializing it.
+    ### Yield pyarrow.RecordBatch (as_arrow) or one tuple per row, in the column order of the result
+    response = None
+
+    LOG.info('Execute SQL on {} (stream, page size = {}):\n{}\n'.format(client.project.title(), page_size, sql))
+    if query_parameters:
+        LOG.info('Query parameters: {}'.format(str(query_parameters)))
+
+    try:
+        response = client.query(sql, job_config=get_query_job_config(query_parameters))
+        rows = response.result(page_size=page_size)
+        QUERY_STATS.record(get_job_stats(response, rows.total_rows))
+        if response.ended and response.started:
+            LOG.info('SQL executed. Timelapsed: ' + str(response.ended - response.started))
+
+        LOG.info('Streaming {} rows.\n'.format(rows.total_rows))
+    except:
+        Exception.exception_select_sql(response)
+
+    for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+        if as_arrow:
+            yield batch
+        else:
+            yield from zip(*[column.to_pylist() for column in batch.columns])
+
+def select_pages_by_standard_sql(client, sql, query_parameters = None, page_size = 10000, bqstorage_client = None):
+    ### Select rows by execute Standard SQL on BigQuery, yield one pandas.Dataframe() per result page
+    response = None
+
+    LOG.info('Execute SQL on {} (page size = {}):\n{}\n'.format(client.project.title(), page_size, sql))
+    if query_parameters:
+        LOG.info('Query parameters: {}'.format(str(query_parameters)))
+
+    try:
+        response = client.query(sql, job_config=get_query_job_config(query_parameters))
+        rows = response.result(page_size=page_size)
+        QUERY_STATS.record(get_job_stats(response, rows.total_rows))
+        if response.ended and response.started:
+            LOG.info('SQL executed. Timelapsed: ' + str(response.ended - response.started))
+
+        LOG.info('Retrieving {} rows.\n'.format(rows.total_rows))
+    except:
+        Exception.exception_select_sql(response)
+
+    yield from rows.to_dataframe_iterable(bqstorage_client=bqstorage_client)
+
+def insert_rows_by_dataframe(client, table_id, dataframe, stream_max_rows = None):
+    ### Insert many rows from pandas Dataframe to Google BigQuery, return the job history(Google's format).
+    ### Above stream_max_rows rows, load by Parquet load jobs instead of the Stream API, one empty error list per load job.
+    ### Use load_rows_by_dataframe for the load jobs themselves
+    if stream_max_rows is None:
+        stream_max_rows = int(os.environ.get('BIGQUERY_STREAM_MAX_ROWS'))
+
+    if len(dataframe) > stream_max_rows:
+        ## Failed load jobs are raised, so every error list is empty
+        return [[] for response in load_rows_by_dataframe(client, table_id, dataframe)]
+
     job_history = [[]]  #Google's format. [[]] means OK
     
     LOG.info('INSERT {} rows of Dataframe to BigQuery Table - {}'.format(
         str(len(dataframe)),
         table_id))
     
-    LOG.debug('\n' + dataframe.to_string())
+    if os.environ.get('LOG_LEVEL') == 'DEBUG':
+        LOG.debug('\n' + dataframe.to_string())
         
     try:
         job_history = client.insert_rows_from_dataframe(client.get_table(table_id), dataframe)
+    except:
+        Exception.system_error_insert_sql()
+
+    ## One report over every streamed chunk
+    if any(len(errors) > 0 for errors in job_history):
+        Exception.exception_insert_sql([error for errors in job_history for error in errors])
+
+    LOG.info('INSERT instruction sent to Stream API.')
+    LOG.info(job_history) #Google's format. [[]] means OK
+
+    return job_history
+
+def load_chunk_by_parquet(client, table_id, dataframe, schema):
+    ### Append a pandas Dataframe by one Parquet load job and wait. Return the job, failed or not.
+    ### Columns are converted to the destination schema, not pandas' inferred types (object, None-only, NaN in int...)
+    bigquery = import_bigquery()
+
+    response = client.load_table_from_dataframe(
+        dataframe,
+        table_id,
+        job_config=bigquery.LoadJobConfig(
+            schema=schema,
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND))
+
+    try:
+        response.result()
+    except:
+        ## Reported by response.error_result
+        pass
 
-        if (len(job_history[0]) > 0 ):
-            Exception.exception_insert_sql(job_history)
+    return response
+
+def load_rows_by_dataframe(client, table_id, dataframe, chunk_rows = None, max_workers = None):
+    ### Append a large pandas Dataframe by Parquet load jobs of chunk_rows rows, uploaded in parallel.
+    ### Every chunk is attempted; failures are raised together in one report. Return the load jobs
+    if chunk_rows is None:
+        chunk_rows = int(os.environ.get('BIGQUERY_LOAD_CHUNK_ROWS'))
+    if max_workers is None:
+        max_workers = int(os.environ.get('BIGQUERY_MAXIMUM_JOBS'))
+
+    chunks = [(start, min(start + chunk_rows, len(dataframe))) for start in range(0, len(dataframe), chunk_rows)]
+    schema = client.get_table(table_id).schema
+
+    LOG.info('LOAD {} rows of Dataframe to BigQuery Table - {}, {} chunk(s) in Parquet'.format(
+        str(len(dataframe)), table_id, len(chunks)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix='bigquery-load') as executor:
+        futures = [executor.submit(load_chunk_by_parquet, client, table_id, dataframe.iloc[start:end], schema) for start, end in chunks]
+
+    responses = []
+    failures = []
+    for chunk, (future, (start, end)) in enumerate(zip(futures, chunks)):
+        try:
+            response = future.result()
+        except:
+            ## Serialization or upload failed, no job
+            failures.append({'chunk': chunk, 'start': start, 'end': end, 'job_id': None, 'errors': str(sys.exc_info()[1])})
+            continue
+
+        if response.error_result:
+            failures.append({'chunk': chunk, 'start': start, 'end': end, 'job_id': response.job_id, 'errors': response.errors or response.error_result})
         else:
-            LOG.info('INSERT instruction sent to Stream API.')
-            LOG.info(job_history) #Google's format. [[]] means OK
+            responses.append(response)
+
+    if failures:
+        Exception.exception_load_chunks(table_id, failures, len(chunks))
+
+    LOG.info('LOAD jobs completed - {}, output rows: {}'.format(
+        ', '.join(response.job_id for response in responses), sum(response.output_rows or 0 for response in responses)))
+
+    return responses
+
+def load_rows_by_json(client, table_id, rows):
+    ### Append JSON rows (list of dict) to a BigQuery table by one load job, no streaming insert quota. Return the job
+    response = None
+    bigquery = import_bigquery()
+
+    LOG.info('LOAD {} rows to BigQuery Table - {}'.format(str(len(rows)), table_id))
+
+    try:
+        response = client.load_table_from_json(
+            rows,
+            table_id,
+            job_config=bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND))
+        response.result()
+
+        LOG.info('LOAD job completed - {}, output rows: {}'.format(response.job_id, str(response.output_rows)))
     except:
+        if response is not None and response.errors:
+            Exception.exception_insert_sql(response.errors)
         Exception.system_error_insert_sql()
 
-    return job_history
+    return response
+
+class _QueryCache():
+    """
+    On-disk query result cache. Key: client scope (project, service account) + SQL text as written + parameters, value: Parquet file.
+    Entries expire after ttl seconds; least recently used entries are evicted above max_bytes.
+    """
+
+    def __init__(self, cache_dir, ttl, max_bytes) -> None:
+        self.__cache_dir = cache_dir
+        self.__ttl = int(ttl)
+        self.__max_bytes = int(max_bytes)
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_key(self, sql, query_parameters = None, scope = None):
+        ### SQL is not normalized, whitespace inside string literals is significant
+        return hashlib.sha256(json.dumps([scope, sql, query_parameters or {}], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.__cache_dir, key + '.parquet')
+
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime > self.__ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+
+            import pandas
+            dataframe = pandas.read_parquet(path)
+            ## Access time drives LRU eviction, modification time drives TTL
+            os.utime(path, (time.time(), mtime))
+        except (OSError, ValueError):
+            ## Missing, expired, or truncated/corrupt (e.g. pyarrow.ArrowInvalid after a crash) entries are misses
+            if sys.exc_info()[0] is not FileNotFoundError and os.path.exists(path):
+                LOG.warning('Drop unreadable cache entry - {}\nDEBUG - {} {}'.format(key, str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self.__lock:
+                self.misses = self.misses + 1
+            return None
+
+        with self.__lock:
+            self.hits = self.hits + 1
+
+        return dataframe
+
+    def put(self, key, dataframe):
+        path = os.path.join(self.__cache_dir, key + '.parquet')
+        temp_path = path + '.{}.tmp'.format(threading.get_ident())
+
+        try:
+            dataframe.to_parquet(temp_path, index=False)
+            os.replace(temp_path, path)
+        except:
+            LOG.warning('Failed to cache query result.\nDEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        with self.__lock:
+            entries = []
+            for name in os.listdir(self.__cache_dir):
+                if name.endswith('.parquet'):
+                    stat = os.stat(os.path.join(self.__cache_dir, name))
+                    entries.append((stat.st_atime, stat.st_size, name))
+
+            total_bytes = sum(entry[1] for entry in entries)
+            for atime, size, name in sorted(entries):
+                if total_bytes <= self.__max_bytes:
+                    break
+                os.remove(os.path.join(self.__cache_dir, name))
+                total_bytes = total_bytes - size
+
+    def get_stats(self):
+        entries = [os.path.join(self.__cache_dir, name) for name in os.listdir(self.__cache_dir) if name.endswith('.parquet')]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(os.path.getsize(path) for path in entries)
+        }
 
 class BigQuery():
     __client = None
+    __bqstorage_client = None
+    __cache = None
+    __executor = None
+    __service_account_info = None
 
-    def __init__(self, client = None) -> None:
+    def __init__(self, client = None, service_account_info = None) -> None:
         self.__client = client
+        self.__service_account_info = service_account_info
+        self.__bqstorage_client = None
+        self.__cache = None
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+
+    def enable_cache(self,
+                     cache_dir = os.environ.get('BIGQUERY_CACHE_DIR'),
+                     ttl = int(os.environ.get('BIGQUERY_CACHE_TTL')),
+                     max_bytes = int(os.environ.get('BIGQUERY_CACHE_MAX_BYTES'))):
+        ### Opt-in: cache select_rows_by_standard_sql() results on disk
+        self.__cache = _QueryCache(cache_dir, ttl, max_bytes)
+        LOG.info('Query result cache enabled - "{}", TTL {}s, max {} bytes'.format(cache_dir, ttl, max_bytes))
+        return self
+
+    def disable_cache(self):
+        self.__cache = None
+
+    def get_cache_stats(self):
+        if self.__cache is None:
+            return {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0}
+
+        return self.__cache.get_stats()
+
+    def get_bqstorage_client(self):
+        if self.__bqstorage_client is None:
+            self.__bqstorage_client = get_bqstorage_client(self.get_client())
+
+        return self.__bqstorage_client
+
+    def get_client(self):
+        ### The connection client, taken from the shared registry on first use
+        if self.__client is None:
+            if self.__service_account_info is None:
+                Exception.client_not_found()
+
+            self.__client = CLIENTS.get(self.__service_account_info)
+
+        return self.__client
 
     @classmethod
     def connect(cls, service_account_json : str):
-        return cls(
-            connect_bigquery(service_account_json)
-        )
+        ### The client is created (or reused) when the first query runs
+        service_account_info = load_service_account_json(service_account_json)
+        get_service_account_identity(service_account_info)
 
-    def select_rows_by_standard_sql(self, sql):
-        if self.__client is None:
-            Exception.client_not_found()
+        return cls(service_account_info=service_account_info)
+
+    def get_cache_scope(self):
+        ### Cached results are not shared across projects or service accounts
+        if self.__service_account_info is not None:
+            return list(get_service_account_identity(self.__service_account_info))
+
+        return [self.get_client().project, None]
+
+    def select_rows_by_standard_sql(self, sql, query_parameters = None, bypass_cache = False):
+        if self.__cache is not None and not bypass_cache:
+            key = self.__cache.get_key(sql, query_parameters, self.get_cache_scope())
+            dataframe = self.__cache.get(key)
 
-        return select_rows_by_standard_sql(self.__client, sql)
+            if dataframe is not None:
+                LOG.info('Cache hit, retrieved {} rows - {}'.format(len(dataframe), key))
+                return dataframe
+
+        dataframe = select_rows_by_standard_sql(self.get_client(), sql, query_parameters)
+
+        if self.__cache is not None:
+            self.__cache.put(self.__cache.get_key(sql, query_parameters, self.get_cache_scope()), dataframe)
+
+        return dataframe
+
+    def dry_run(self, sql, query_parameters = None):
+        ### Validate a query and estimate its cost without running it
+        return dry_run_query(self.get_client(), sql, query_parameters)
+
+    def get_query_stats(self):
+        ### Stats of every finished query job of the process (bytes billed, slot-ms, cache hit, duration, rows)
+        return QUERY_STATS.get_records()
+
+    def export_query_stats(self, path):
+        return QUERY_STATS.export(path)
+
+    def submit(self, sql, query_parameters = None, bypass_cache = False):
+        ### Submit a query job now and collect its result in the background, return a concurrent.futures.Future of pandas.Dataframe().
+        ### future.job_id is set on submission, future.job_stats once the job is done
+        future = concurrent.futures.Future()
+
+        if self.__cache is not None and not bypass_cache:
+            dataframe = self.__cache.get(self.__cache.get_key(sql, query_parameters, self.get_cache_scope()))
+
+            if dataframe is not None:
+                LOG.info('Cache hit, retrieved {} rows.'.format(len(dataframe)))
+                future.job_id = None
+                future.job_stats = None
+                future.set_result(dataframe)
+                return future
+
+        response = submit_query(self.get_client(), sql, query_parameters)
+        future.job_id = response.job_id
+        future.job_stats = None
+
+        def collect():
+            try:
+                dataframe, future.job_stats = collect_query(response)
+            except BaseException as e:
+                future.set_exception(e)
+                return
+
+            if self.__cache is not None:
+                self.__cache.put(self.__cache.get_key(sql, query_parameters, self.get_cache_scope()), dataframe)
+            future.set_result(dataframe)
+
+        future.set_running_or_notify_cancel()
+        self.__get_executor().submit(collect)
+
+        return future
+
+    def gather(self, *futures, timeout = None):
+        ### Wait for futures from submit(), return their pandas.Dataframe() in submission order.
+        ### All jobs are waited for before the first failure is raised; use concurrent.futures.as_completed to handle them as they finish
+        if len(futures) == 1 and isinstance(futures[0], (list, tuple)):
+            futures = futures[0]
+
+        done, not_done = concurrent.futures.wait(futures, timeout)
+        if not_done:
+            Exception.timeout_gather(len(not_done), timeout)
+
+        job_stats = [future.job_stats for future in futures if future.exception() is None and future.job_stats is not None]
+        LOG.info('Gathered {} job(s): {} bytes processed, {} slot-ms.'.format(
+            len(futures),
+            sum(stats['total_bytes_processed'] or 0 for stats in job_stats),
+            sum(stats['slot_millis'] or 0 for stats in job_stats)))
+
+        return [future.result() for future in futures]
+
+    def __get_executor(self):
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('BIGQUERY_MAXIMUM_JOBS')), thread_name_prefix='bigquery')
+
+        return self.__executor
+
+    def execute_by_standard_sql(self, sql, query_parameters = None):
+        return execute_by_standard_sql(self.get_client(), sql, query_parameters)
+
+    def select_pages_by_standard_sql(self, sql, query_parameters = None, page_size = 10000):
+        return select_pages_by_standard_sql(self.get_client(), sql, query_parameters, page_size, self.get_bqstorage_client())
+
+    def select_rows_iter(self, sql, query_parameters = None, page_size = 10000, as_arrow = True):
+        return select_rows_iter(self.get_client(), sql, query_parameters, page_size, self.get_bqstorage_client(), as_arrow)
 
     ### Insert many rows from pandas Dataframe to Google BigQuery
-    def insert_rows_by_dataframe(self, table_id, dataframe):
-        if self.__client is None:
-            Exception.client_not_found()
+    def insert_rows_by_dataframe(self, table_id, dataframe, stream_max_rows = None):
+        return insert_rows_by_dataframe(self.get_client(), table_id, dataframe, stream_max_rows)
+
+    ### Append a large pandas Dataframe to Google BigQuery by parallel Parquet load jobs, return the load jobs
+    def load_rows_by_dataframe(self, table_id, dataframe, chunk_rows = None, max_workers = None):
+        return load_rows_by_dataframe(self.get_client(), table_id, dataframe, chunk_rows, max_workers)
 
-        return insert_rows_by_dataframe(self.__client, table_id, dataframe)
\ No newline at end of file
+    ### Append many JSON rows to Google BigQuery by one load job
+    def load_rows_by_json(self, table_id, rows):
+        return load_rows_by_json(self.get_client(), table_id, rows)
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+    Name:
+        history.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Buffered writer of sent ASM_CON messages into the history table (sql.get_msg_history_table_id).
+        Rows are spooled to a local JSON-lines file first, then flushed in size- or time-bounded batches by one
+        BigQuery load job, so pending rows survive a crash and no streaming-insert quota is used.
+        Optionally keeps the latest message per correlationId (sql.get_msg_latest_table_id) up to date on every flush.
+    Note:
+        20261017 - Init commit
+        20261017 - Maintain the latest state table on flush
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import datetime
+import threading
+
+from .logging import Logging
+from .payload_index import get_payload_hash
+
+LOG = Logging(__name__)
+
+HISTORY_COLUMNS = ['ID', 'FLTID', 'DATOP_CHN', 'correlationId', 'msgType', 'payload']
+
+if os.environ.get('HISTORY_FLUSH_ROWS'):
+    FLUSH_ROWS = int(os.environ.get('HISTORY_FLUSH_ROWS'))
+else:
+    FLUSH_ROWS = 5000
+
+if os.environ.get('HISTORY_FLUSH_SECONDS'):
+    FLUSH_SECONDS = int(os.environ.get('HISTORY_FLUSH_SECONDS'))
+else:
+    FLUSH_SECONDS = 60
+
+if os.environ.get('HISTORY_LATEST_CHUNK_ROWS'):
+    LATEST_CHUNK_ROWS = int(os.environ.get('HISTORY_LATEST_CHUNK_ROWS'))
+else:
+    LATEST_CHUNK_ROWS = 5000
+
+if not os.environ.get('HISTORY_SPOOL_PATH'):
+    os.environ['HISTORY_SPOOL_PATH'] = os.path.join(os.getcwd(), 'spool', 'asm_con_history.jsonl').replace('\\', '/')
+
+def to_json_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    elif hasattr(value, 'item'):
+        ## numpy scalar
+        return value.item()
+
+    return value
+
+### Message date of an ASM payload, '%d%b%y' before '001E001'
+PAYLOAD_DATE_PATTERN = re.compile(r'(\d{2})([A-Z]{3})(\d{2})001E001')
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+def get_payload_date(payload):
+    ### Same as PARSE_DATE('%d%b%y', ...) of sql.get_select_msg_history, None if not found
+    match = PAYLOAD_DATE_PATTERN.search(str(payload))
+    if match is None or match.group(2) not in MONTHS:
+        return None
+
+    year = int(match.group(3))
+    try:
+        return datetime.date(year + (2000 if year < 69 else 1900), MONTHS.index(match.group(2)) + 1, int(match.group(1)))
+    except ValueError:
+        return None
+
+def get_latest_state(rows):
+    ### Reduce history rows (dict of HISTORY_COLUMNS) to the latest message per correlationId, later rows win a tie
+    latest = {}
+
+    for row in rows:
+        latest_date = get_payload_date(row.get('payload'))
+        if row.get('correlationId') is None or latest_date is None:
+            continue
+
+        current = latest.get(row['correlationId'])
+        if current is None or latest_date.isoformat() >= current['latestDate']:
+            latest[row['correlationId']] = {
+                'correlationId': row['correlationId'],
+                'FLTID': None if row.get('FLTID') is None else str(row['FLTID']),
+                'DATOP_CHN': None if row.get('DATOP_CHN') is None else str(row['DATOP_CHN'])[:10],
+                'msgType': row.get('msgType'),
+                'latestDate': latest_date.isoformat(),
+                'payloadHash': get_payload_hash(row['payload'])
+            }
+
+    return list(latest.values())
+
+def merge_latest_state(bigquery, merge_sql, rows, chunk_rows = LATEST_CHUNK_ROWS):
+    ### Upsert the latest state of history rows by the msg_latest_merge statement (@rows: JSON array), return the number of correlationIds
+    latest = get_latest_state(rows)
+
+    for i in range(0, len(latest), chunk_rows):
+        bigquery.execute_by_standard_sql(merge_sql, {'rows': json.dumps(latest[i:i + chunk_rows])})
+
+    LOG.info('[History] Latest state updated for {} correlationId(s)'.format(len(latest)))
+
+    return len(latest)
+
+class HistoryWriter():
+    __table_id = ""
+    __spool_path = ""
+
+    def __init__(self, bigquery, table_id, spool_path = None, flush_rows = FLUSH_ROWS, flush_seconds = FLUSH_SECONDS, latest_sql = None) -> None:
+        self.__bigquery = bigquery
+        self.__table_id = table_id
+        self.__latest_sql = latest_sql
+        self.__spool_path = spool_path or os.environ.get('HISTORY_SPOOL_PATH')
+        self.__flush_rows = int(flush_rows)
+        self.__flush_seconds = int(flush_seconds)
+        self.__lock = threading.RLock()
+        self.__pending = 0
+        self.__last_flush = time.monotonic()
+        self.__closed = threading.Event()
+
+        if os.path.dirname(self.__spool_path) and not os.path.exists(os.path.dirname(self.__spool_path)):
+            os.makedirs(os.path.dirname(self.__spool_path))
+
+        self.__spool = open(self.__spool_path, 'a', encoding='utf-8')
+
+        ## Rows left by a previous (crashed) run are flushed first
+        if os.path.exists(self.get_flushing_path()) or os.path.getsize(self.__spool_path) > 0:
+            LOG.info('[History] Found pending rows in spool "{}", flush.'.format(self.__spool_path))
+            self.flush()
+
+        threading.Thread(target=self.__flush_periodically, daemon=True).start()
+
+    def get_spool_path(self):
+        return self.__spool_path
+
+    def get_flushing_path(self):
+        return self.__spool_path + '.flushing'
+
+    def get_pending(self):
+        return self.__pending
+
+    def write(self, dataframe):
+        ### Spool the history columns of a pandas.Dataframe, flush when the size bound is reached
+        rows = dataframe[HISTORY_COLUMNS].to_dict('records')
+
+        with self.__lock:
+            for row in rows:
+                self.__spool.write(json.dumps({key: to_json_value(value) for key, value in row.items()}) + '\n')
+            self.__spool.flush()
+            os.fsync(self.__spool.fileno())
+            self.__pending = self.__pending + len(rows)
+
+            if self.__pending >= self.__flush_rows:
+                self.flush()
+
+        return len(rows)
+
+    def flush(self):
+        ### Load every spooled row by one load job. On failure the rows stay spooled for the next flush
+        with self.__lock:
+            flushing_path = self.get_flushing_path()
+
+            ## Rotate the spool, rows of an earlier failed flush are merged in
+            self.__spool.close()
+            with open(self.__spool_path, 'r', encoding='utf-8') as f:
+                spooled = f.read()
+            if spooled:
+                with open(flushing_path, 'a', encoding='utf-8') as f:
+                    f.write(spooled)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.__spool = open(self.__spool_path, 'w', encoding='utf-8')
+            self.__pending = 0
+            self.__last_flush = time.monotonic()
+
+            if not os.path.exists(flushing_path):
+                return 0
+
+            with open(flushing_path, 'r', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+
+            if not rows:
+                os.remove(flushing_path)
+                return 0
+
+            try:
+                self.__bigquery.load_rows_by_json(self.__table_id, rows)
+            except:
+                LOG.error('[History] Failed to load {} row(s) to {}, kept in spool "{}"'.format(len(rows), self.__table_id, flushing_path))
+                LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+                return 0
+
+            os.remove(flushing_path)
+            LOG.info('[History] Flushed {} row(s) to {}'.format(len(rows), self.__table_id))
+
+            if self.__latest_sql is not None:
+                try:
+                    merge_latest_state(self.__bigquery, self.__latest_sql, rows)
+                except:
+                    ## History is already loaded and not reloaded; the latest state of these legs lags until they are sent again
+                    LOG.error('[History] Failed to update latest state of {} row(s)'.format(len(rows)))
+                    LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+
+            return len(rows)
+
+    def close(self):
+        self.__closed.set()
+
+        with self.__lock:
+            self.flush()
+            self.__spool.close()
+
+    def __flush_periodically(self):
+        while not self.__closed.wait(1):
+            if self.__pending > 0 and time.monotonic() - self.__last_flush >= self.__flush_seconds:
+                self.flush()
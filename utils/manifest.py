@@ -0,0 +1,115 @@
+"""
+    Name:
+        manifest.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Persist the size/mtime (and optional hash) of every file transferred by a directory sync,
+        grouped by namespace (e.g. 'sftp://host:port/remote_path'), so the next run transfers only new or changed files.
+        Stored as a small JSON file, replaced atomically on every save.
+    Note:
+        20261017 - Init commit
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+from .logging import Logging
+
+LOG = Logging(__name__)
+
+### Read size for hashing local files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def get_file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def get_local_attributes(path, checksum = False):
+    attribute = os.stat(path)
+
+    return {
+        'size': attribute.st_size,
+        'mtime': int(attribute.st_mtime),
+        'hash': get_file_hash(path) if checksum else None
+    }
+
+def is_changed(record, size, mtime, hash = None):
+    ### True if a file is not recorded or its size/mtime/hash differ from the record, hash is compared only if given
+    if record is None:
+        return True
+    if record.get('size') != size or record.get('mtime') != mtime:
+        return True
+    if hash is not None and record.get('hash') != hash:
+        return True
+
+    return False
+
+class Manifest():
+    __path = ""
+    __namespace = ""
+
+    def __init__(self, path, namespace) -> None:
+        self.__path = path
+        self.__namespace = namespace
+        self.__lock = threading.Lock()
+        self.__records = self.__read().get(namespace, {})
+
+    def get_path(self):
+        return self.__path
+
+    def get_namespace(self):
+        return self.__namespace
+
+    def get(self, key):
+        return self.__records.get(key)
+
+    def keys(self):
+        return list(self.__records.keys())
+
+    def set(self, key, size, mtime, hash = None):
+        with self.__lock:
+            self.__records[key] = {'size': size, 'mtime': mtime, 'hash': hash}
+
+    def remove(self, key):
+        with self.__lock:
+            self.__records.pop(key, None)
+
+    def save(self):
+        ### Merge into the file so other namespaces are kept
+        with self.__lock:
+            manifests = self.__read()
+            manifests[self.__namespace] = self.__records
+            self.__write(manifests)
+
+        LOG.info('Manifest saved - {}: {} item(s) >>> "{}"'.format(self.__namespace, len(self.__records), self.__path))
+
+    def __len__(self):
+        return len(self.__records)
+
+    def __read(self):
+        if not os.path.exists(self.__path):
+            return {}
+
+        with open(self.__path, 'r') as f:
+            return json.loads(f.read() or '{}')
+
+    def __write(self, manifests):
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            f.write(json.dumps(manifests, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(f.name, self.__path)
@@ -19,6 +19,17 @@
         20230524 - Opt Out tfns
         20240618 - Bug Fix
         20240705 - Stop using logging.debug
+        20261017 - Add persistent Java bridge (one JVM per MQ profile)
+        20261017 - Add callback_many() for batch publishing
+        20261017 - Add asyncio publisher, acallback() and publish_all()
+        20261017 - Compiled, escaped envelope encoder; payload via stdin/file
+        20261017 - Add round-trip latency probe
+        20261017 - Bugfix: late bridge ACK after a timeout killed the reader thread
+        20261017 - Bugfix: argv payload transport sends the legacy unescaped envelope again
+        20261017 - Bugfix: reset the bridge restart count on every successful ACK
+        20261017 - Bugfix: a timeout fails only its own frame, drain in-flight frames before restarting a stuck worker
+        20261017 - Bugfix: callback() on the bridge times out after MQ_BRIDGE_SEND_TIMEOUT
+        20261017 - Bugfix: per-message timeout in publish_envelopes()
 """
 
 import os
@@ -26,10 +37,373 @@ import json
 import datetime
 import subprocess
 import sys
+import tempfile
+import time
+import uuid
+import threading
+import asyncio
+import concurrent.futures
 from .logging import Logging
 
 LOG = Logging(__name__)
 
+if os.environ.get('MQ_BRIDGE_READY_TIMEOUT'):
+    BRIDGE_READY_TIMEOUT = int(os.environ.get('MQ_BRIDGE_READY_TIMEOUT'))
+else:
+    BRIDGE_READY_TIMEOUT = 60
+
+if os.environ.get('MQ_BRIDGE_MAXIMUM_RESTARTS'):
+    BRIDGE_MAXIMUM_RESTARTS = int(os.environ.get('MQ_BRIDGE_MAXIMUM_RESTARTS'))
+else:
+    BRIDGE_MAXIMUM_RESTARTS = 3
+
+### Seconds a frame may wait for its ACK; also the time frames in flight behind a timed-out frame get to be acknowledged
+if os.environ.get('MQ_BRIDGE_SEND_TIMEOUT'):
+    BRIDGE_SEND_TIMEOUT = float(os.environ.get('MQ_BRIDGE_SEND_TIMEOUT'))
+else:
+    BRIDGE_SEND_TIMEOUT = 60
+
+if os.environ.get('MQ_MAXIMUM_IN_FLIGHT'):
+    MAXIMUM_IN_FLIGHT = int(os.environ.get('MQ_MAXIMUM_IN_FLIGHT'))
+else:
+    MAXIMUM_IN_FLIGHT = 8
+
+### Java launcher, can point to a local stand-in of the MQ client
+if os.environ.get('MQ_JAVA'):
+    JAVA = os.environ.get('MQ_JAVA')
+else:
+    JAVA = 'java'
+
+### argv (default, legacy Main, unescaped envelope) | stdin | file (escaped JSON envelope)
+if os.environ.get('MQ_PAYLOAD_TRANSPORT'):
+    PAYLOAD_TRANSPORT = os.environ.get('MQ_PAYLOAD_TRANSPORT')
+else:
+    PAYLOAD_TRANSPORT = 'argv'
+
+class _EnvelopeEncoder():
+    """
+    JSON envelope encoder, compiled once per MQ profile.
+    Static fields (sender, msgType, connection) are pre-serialized; only msgGenTime, payload and correlationId
+    are escaped per message, into a reusable per-thread buffer.
+    """
+
+    def __init__(self, sender, message_type, address_line_1, address_line_2,
+                 host, port, queue_manager_name, channel, queue_producer_name, user_name, password) -> None:
+        dumps = self.dumps
+        self.__head = ('{"sender": ' + dumps(sender) + ', "msgGenTime": "').encode('utf-8')
+        self.__message_type = ('", "msgType": ' + dumps(message_type) + ', "payload": ').encode('utf-8')
+        self.__correlation_id = ', "correlationId": '.encode('utf-8')
+        self.__tail = (
+            ', "host": ' + dumps(host) +
+            ', "port": ' + dumps(port) +
+            ', "queueManagerName": ' + dumps(queue_manager_name) +
+            ', "channel": ' + dumps(channel) +
+            ', "queueBsmSendName": ' + dumps(queue_producer_name) +
+            ', "userName": ' + dumps(user_name) +
+            ', "password": ' + dumps(password) +
+            '}').encode('utf-8')
+        self.__address = "\r\n\x01{}\r\n{} ".format(address_line_1, address_line_2)
+        self.__local = threading.local()
+
+    def dumps(self, value):
+        return json.dumps(str(value), ensure_ascii=False)
+
+    def encode(self, message, correlation_id, message_generation_time):
+        buffer = getattr(self.__local, 'buffer', None)
+        if buffer is None:
+            buffer = self.__local.buffer = bytearray()
+
+        del buffer[:]
+        buffer += self.__head
+        buffer += message_generation_time.strftime("%Y-%m-%dT%H:%M:%S").encode('ascii')
+        buffer += self.__message_type
+        buffer += self.dumps(self.__address + message_generation_time.strftime("%d%m%y") + "\r\n\x02" + str(message) + "=\x03").encode('utf-8')
+        buffer += self.__correlation_id
+        buffer += self.dumps(correlation_id).encode('utf-8')
+        buffer += self.__tail
+
+        return bytes(buffer)
+
+    @staticmethod
+    def to_legacy(envelope):
+        ### Unescaped envelope of the legacy Main (argv), byte-for-byte as before the encoder: field values are concatenated as-is
+        fields = json.loads(envelope)
+
+        return ('{' + ', '.join(
+            '"{}": "{}"'.format(name, fields[name]) for name in [
+                'sender', 'msgGenTime', 'msgType', 'payload', 'correlationId', 'host', 'port',
+                'queueManagerName', 'channel', 'queueBsmSendName', 'userName', 'password']) + '}').encode('utf-8')
+
+class _MQBridge():
+    """
+    Long-lived Java worker which keeps one queue manager connection open for many messages.
+
+    Protocol (stdin/stdout of the worker):
+        Python -> Java: header line "<seq> <op> <length>", then <length> bytes of UTF-8 body.
+            op = PUT: body is the envelope, put to queueBsmSendName
+            op = GET: body is the envelope, get the message with the same correlationId from queueBsmSendName
+        Java -> Python: "READY [connect_ms]" once connected, then one "ACK <seq> <OK|ERROR> [detail]" line per frame.
+            detail of a GET is the payload received.
+        Any other stdout line is forwarded to the log; stderr is logged as warning.
+    The worker is restarted on the next send if it has exited.
+    A frame whose caller timed out is abandoned. Before the next frame, the frames still in flight are given
+    drain_timeout seconds to be acknowledged, then a worker still stuck on the abandoned frame is restarted;
+    frames unacknowledged by then are UNKNOWN (possibly delivered), not ERROR.
+    """
+    __command = []
+    __environ = None
+    __cwd = None
+    __process = None
+    __pending = {}
+    __seq = 0
+    __restarts = 0
+
+    def __init__(self, command, environ = None, cwd = None, ready_timeout = BRIDGE_READY_TIMEOUT, maximum_restarts = BRIDGE_MAXIMUM_RESTARTS, drain_timeout = BRIDGE_SEND_TIMEOUT) -> None:
+        self.__command = command
+        self.__environ = environ
+        self.__cwd = cwd
+        self.__ready_timeout = ready_timeout
+        self.__maximum_restarts = maximum_restarts
+        self.__drain_timeout = drain_timeout
+        self.__lock = threading.Lock()
+        self.__pending_lock = threading.Lock()
+        ## Notified whenever a pending frame is resolved or abandoned
+        self.__settled = threading.Condition(self.__pending_lock)
+        self.__abandoned = set()
+        self.__closed = threading.Event()
+        self.__process = None
+        self.__pending = {}
+        self.__seq = 0
+        self.__restarts = 0
+        self.__start_timings = {}
+
+    def get_start_timings(self):
+        ### {'jvm_start_ms', 'connect_ms'} of the current worker, connect_ms is None if the worker does not report it
+        return self.__start_timings
+
+    def is_alive(self):
+        return self.__process is not None and self.__process.poll() is None and not self.__closed.is_set()
+
+    def start(self):
+        with self.__lock:
+            self.__start()
+
+    def stop(self, timeout = 10):
+        with self.__lock:
+            process = self.__process
+            self.__process = None
+
+            if process is None:
+                return
+
+            LOG.info('[MQ Bridge] Stop worker, pid = {}'.format(process.pid))
+            try:
+                process.stdin.close()
+                process.wait(timeout)
+            except:
+                process.kill()
+                process.wait()
+
+    def kill(self):
+        ### Kill a worker stuck on a frame: its pending frames fail, the next submit restarts it
+        with self.__lock:
+            self.__kill()
+
+    def abandon(self, future):
+        ### The caller of a frame gave up (timeout): only this frame fails, the worker is checked before the next frame.
+        ### Return False if the frame was acknowledged meanwhile, its result is then set by the reader thread
+        with self.__settled:
+            seqs = [seq for seq, pending_future in self.__pending.items() if pending_future is future]
+            if not seqs:
+                return False
+
+            self.__abandoned.update(seqs)
+            future.cancel()
+            self.__settled.notify_all()
+
+        return True
+
+    def submit(self, body, op = 'PUT'):
+        ### Write one frame, return a concurrent.futures.Future resolved with (status, detail) by the reader thread.
+        ### Blocks while a worker stuck on an abandoned frame is drained and restarted, call it off the event loop
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        with self.__lock:
+            if self.__abandoned:
+                self.__drain()
+
+            self.__seq = self.__seq + 1
+            seq = self.__seq
+            future = concurrent.futures.Future()
+            frame = '{} {} {}\n'.format(seq, op, len(body)).encode('ascii') + body
+
+            try:
+                self.__write(seq, future, frame)
+            except OSError:
+                ## Worker died between frames, restart once and re-send
+                self.__write(seq, future, frame)
+
+        return future
+
+    def send(self, body, op = 'PUT', timeout = None):
+        future = self.submit(body, op)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            if self.abandon(future):
+                raise
+            return future.result()
+
+    def __drain(self):
+        ## Give the frames in flight behind an abandoned one up to drain_timeout to be acknowledged
+        deadline = time.monotonic() + self.__drain_timeout
+        with self.__settled:
+            while not self.__closed.is_set() and any(seq not in self.__abandoned for seq in self.__pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__settled.wait(remaining)
+
+            ## Abandoned frames acknowledged late: the worker is not stuck, keep it
+            stuck = [seq for seq in self.__abandoned if seq in self.__pending]
+            unknown = [future for seq, future in self.__pending.items() if seq not in self.__abandoned] if stuck else []
+            if stuck:
+                self.__pending.clear()
+            self.__abandoned = set()
+
+        if not stuck:
+            return
+
+        for future in unknown:
+            self.__set_result(future, ('UNKNOWN', 'MQ Java Bridge restarted before acknowledging message, delivery unknown.'))
+        self.__kill()
+
+    def __kill(self):
+        if self.__process is not None and self.__process.poll() is None:
+            LOG.warning('[MQ Bridge] Kill unresponsive worker, pid = {}'.format(self.__process.pid))
+            self.__process.kill()
+            self.__process.wait()
+
+    def __write(self, seq, future, frame):
+        if not self.is_alive():
+            self.__restart()
+
+        with self.__pending_lock:
+            self.__pending[seq] = future
+
+        try:
+            self.__process.stdin.write(frame)
+            self.__process.stdin.flush()
+        except OSError:
+            with self.__pending_lock:
+                self.__pending.pop(seq, None)
+            self.__closed.set()
+            raise
+
+    def __start(self):
+        LOG.info('[MQ Bridge] Start worker - {}'.format(self.__command[-1]))
+
+        ready = threading.Event()
+        timings = {'spawned': time.perf_counter()}
+        self.__closed = threading.Event()
+        self.__pending = {}
+        self.__abandoned = set()
+        process = subprocess.Popen(
+            self.__command,
+            env = self.__environ,
+            stdin = subprocess.PIPE,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.PIPE,
+            cwd = self.__cwd or None
+        )
+        self.__process = process
+
+        threading.Thread(target=self.__read_stdout, args=(process, ready, self.__closed, self.__pending, timings), daemon=True).start()
+        threading.Thread(target=self.__read_stderr, args=(process,), daemon=True).start()
+
+        if not ready.wait(self.__ready_timeout) or self.__closed.is_set():
+            process.kill()
+            err_msg = '[Error 1] MQ Java Bridge not ready within {}s.'.format(self.__ready_timeout)
+            LOG.critical(err_msg)
+            raise ConnectionError(__name__, err_msg)
+
+        ready_ms = (timings['ready'] - timings['spawned']) * 1000
+        self.__start_timings = {
+            'jvm_start_ms': ready_ms - timings['connect_ms'] if timings.get('connect_ms') is not None else ready_ms,
+            'connect_ms': timings.get('connect_ms')
+        }
+
+        LOG.info('[MQ Bridge] Worker ready, pid = {}, {}'.format(process.pid, str(self.__start_timings)))
+
+    def __restart(self):
+        if self.__process is not None:
+            self.__restarts = self.__restarts + 1
+            LOG.warning('[MQ Bridge] Worker exited with code {}, restart {} of {}'.format(
+                self.__process.poll(), self.__restarts, self.__maximum_restarts))
+
+            if self.__restarts > self.__maximum_restarts:
+                err_msg = '[Error 1] MQ Java Bridge reached maximum {} restarts.'.format(self.__maximum_restarts)
+                LOG.critical(err_msg)
+                raise ConnectionError(__name__, err_msg)
+
+            self.__process.kill()
+
+        self.__start()
+
+    def __read_stdout(self, process, ready, closed, pending, timings):
+        for line in iter(process.stdout.readline, b''):
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+
+            if line.startswith('READY'):
+                timings['ready'] = time.perf_counter()
+                try:
+                    timings['connect_ms'] = float(line.split(' ')[1])
+                except (IndexError, ValueError):
+                    timings['connect_ms'] = None
+                ready.set()
+            elif line.startswith('ACK '):
+                parts = line.split(' ', 3)
+                if parts[2] == 'OK':
+                    ## maximum_restarts counts consecutive crashes, whichever of send()/submit() was used
+                    self.__restarts = 0
+                with self.__settled:
+                    future = pending.pop(int(parts[1]), None)
+                    self.__settled.notify_all()
+                if future is not None:
+                    self.__set_result(future, (parts[2], parts[3] if len(parts) > 3 else ''))
+            else:
+                LOG.info(line)
+
+        ## EOF: fail everything still waiting on this worker
+        with self.__settled:
+            closed.set()
+            futures = list(pending.values())
+            pending.clear()
+            self.__settled.notify_all()
+
+        for future in futures:
+            self.__set_result(future, ('ERROR', 'MQ Java Bridge exited before acknowledging message.'))
+        ready.set()
+
+    def __set_result(self, future, result):
+        ## A late ACK of a frame whose caller gave up (cancelled) is dropped, the reader thread must keep running
+        try:
+            future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            LOG.warning('[MQ Bridge] Late {} dropped, caller no longer waiting.'.format(result[0]))
+
+    def __read_stderr(self, process):
+        for line in iter(process.stderr.readline, b''):
+            LOG.warning(line.decode('utf-8', 'replace').rstrip('\r\n'))
+
+def iter_message_rows(rows):
+    ### Accept pandas.DataFrame (payload, correlationId columns) or iterable of (payload, correlationId) pairs
+    if hasattr(rows, 'columns'):
+        return zip(rows['payload'], rows['correlationId'])
+
+    return iter(rows)
+
 class MQ():
     __client_path = ""
     __class_path = ""
@@ -55,6 +429,11 @@ class MQ():
 
     __payload = ""
 
+    __bridge_class = ""
+    __bridge = None
+    __encoder = None
+    __probe_queue_name = ""
+
     def __init__( 
             self, 
             client_path = "", 
@@ -74,7 +453,9 @@ class MQ():
             message_type = "",
             message_generation_time = datetime.datetime.now(),
             correlation_id = "",
-            message = ""
+            message = "",
+            bridge_class = "",
+            probe_queue_name = ""
     ) -> None:
         self.__client_path = client_path
         self.__class_path = class_path
@@ -94,6 +475,10 @@ class MQ():
         self.__message_generation_time = message_generation_time
         self.__correlation_id = correlation_id
         self.__message = message
+        self.__bridge_class = bridge_class
+        self.__bridge = None
+        self.__encoder = None
+        self.__probe_queue_name = probe_queue_name
 
     @classmethod
     def from_json_config(cls, json_config_path, message_type = ''):
@@ -117,7 +502,9 @@ class MQ():
             json_config['address_ln1'],
             json_config['address_ln2'],
             json_config['sender'],
-            message_type
+            message_type,
+            bridge_class = json_config.get('bridge_class', ''),
+            probe_queue_name = json_config.get('probe_queue_name', '')
         )
 
     @classmethod
@@ -129,7 +516,9 @@ class MQ():
             address_ln1 = '',
             address_ln2 = '',
             sender = '',
-            message_type = ''):
+            message_type = '',
+            bridge_class = '',
+            probe_queue_name = ''):
         return cls(
             path_client,
             path_java_archives,
@@ -145,11 +534,14 @@ class MQ():
             address_ln1,
             address_ln2,
             sender,
-            message_type
+            message_type,
+            bridge_class = bridge_class,
+            probe_queue_name = probe_queue_name
         )
 
     def set_message_type(self, message_type):
         self.__message_type = message_type
+        self.__encoder = None
     
     def set_message(self, message):
         self.__message = message
@@ -159,9 +551,11 @@ class MQ():
 
     def set_address_line_1(self, address_line_1):
         self.__address_line_1 = address_line_1
+        self.__encoder = None
 
     def set_address_line_2(self, address_line_2):
         self.__address_line_2 = address_line_2
+        self.__encoder = None
 
     def set_payload(self, payload):
         self.__payload = payload
@@ -206,44 +600,365 @@ class MQ():
         )
     
     def to_byte(self):
-        return (
-            '{\"sender\": \"' + self.__sender + 
-            '\", \"msgGenTime\": \"'+ self.__message_generation_time.strftime("%Y-%m-%dT%H:%M:%S") +
-            '\", \"msgType\": \"'+ self.__message_type  +
-            '\", \"payload\": \"'+ "\r\n\x01{}\r\n{} {}\r\n\x02{}=\x03".format(
+        return self.build_envelope(self.__message, self.__correlation_id, self.__message_generation_time)
+
+    def get_encoder(self):
+        ### Compile the envelope encoder once per profile, reset when a static field changes
+        if self.__encoder is None:
+            self.__encoder = _EnvelopeEncoder(
+                self.__sender,
+                self.__message_type,
                 self.__address_line_1,
                 self.__address_line_2,
-                self.__message_generation_time.strftime("%d%m%y"),
-                self.__message) +
-            '\", \"correlationId\": \"'+ self.__correlation_id +
-            '\", \"host\": \"' + self.__host +
-            '\", \"port\": \"' + self.__port +
-            '\", \"queueManagerName\": \"' + self.__queue_manager_name +
-            '\", \"channel\": \"' + self.__channel +
-            '\", \"queueBsmSendName\": \"' + self.__queue_producer_name +
-            '\", \"userName\": \"' + self.__user_name +
-            '\", \"password\": \"' + self.__password +
-            '\"}'
-        ).encode("utf-8")
+                self.__host,
+                self.__port,
+                self.__queue_manager_name,
+                self.__channel,
+                self.__queue_producer_name,
+                self.__user_name,
+                self.__password)
 
-    def callback(self, message_generation_time = datetime.datetime.now()):
-        ## Variable Declaration
-        self.__message_generation_time = message_generation_time
-        self.set_payload(self.to_byte())
-        
+        return self.__encoder
+
+    def build_envelope(self, message, correlation_id, message_generation_time):
+        return self.get_encoder().encode(message, correlation_id, message_generation_time)
+
+    def get_java_environ(self):
         environ = os.environ.copy()
         environ["CLASSPATH"] = self.__class_path
-        command = [
-            'java', '-Djavax.net.ssl.trustStoreType=jks',
+        return environ
+
+    def get_java_command(self, main_class, *args):
+        return [
+            JAVA, '-Djavax.net.ssl.trustStoreType=jks',
             f'-Djavax.net.ssl.keyStore={self.__trust_store_path}',
             f'-Djavax.net.ssl.keyStorePassword={self.__trust_store_password}',
             f'-Djavax.net.ssl.trustStore={self.__trust_store_path}',  
             f'-Djavax.net.ssl.trustStorePassword={self.__trust_store_password}', 
             '-Dcom.ibm.mq.cfg.useIBMCipherMappings=false', 
-            'Main', f'{self.__payload}', '2>&1'
+            main_class, *args
         ]
 
-        LOG.debug(str(type(self.__payload)) + ' ' + str(self.__payload))
+    def start_bridge(self, bridge_class = None):
+        ### Start one long-lived Java worker for this MQ profile, callback() will be routed to it
+        if bridge_class is not None:
+            self.__bridge_class = bridge_class
+
+        if not self.__bridge_class:
+            err_msg = '[Error 1] MQ Java Bridge class is not configured.'
+            LOG.error(err_msg)
+            raise ValueError(__name__, err_msg)
+
+        if self.__bridge is None:
+            self.__bridge = _MQBridge(
+                self.get_java_command(self.__bridge_class),
+                self.get_java_environ(),
+                self.__client_path)
+
+        try:
+            self.__bridge.start()
+        except FileNotFoundError:
+            self.__bridge = None
+            err_msg = '[Error 1] Failed to start MQ Java Bridge. Missing Library from ' + self.__client_path
+            LOG.error(err_msg)
+            raise ImportError(__name__, err_msg)
+
+        return self
+
+    def stop_bridge(self):
+        if self.__bridge is not None:
+            self.__bridge.stop()
+            self.__bridge = None
+
+    def get_bridge(self):
+        return self.__bridge
+
+    def get_bridge_class(self):
+        return self.__bridge_class
+
+    def probe(self, probe_queue_name = None, reply_queue_name = None, timeout = 30):
+        ### Put a tagged heartbeat and get it back (loopback, or from reply_queue_name), return latencies in ms
+        put_queue_name = probe_queue_name or self.__probe_queue_name
+        get_queue_name = reply_queue_name or put_queue_name
+        correlation_id = 'ConnectivityProbe-' + uuid.uuid4().hex[:12].upper()
+        message_generation_time = datetime.datetime.now()
+        result = {
+            'correlationId': correlation_id,
+            'host': self.__host,
+            'queue': put_queue_name,
+            'replyQueue': get_queue_name,
+            'jvm_start_ms': None,
+            'connect_ms': None,
+            'put_ms': None,
+            'get_ms': None,
+            'round_trip_ms': None,
+            'status': 'ERROR',
+            'error': ''
+        }
+
+        if not put_queue_name or not self.__bridge_class:
+            err_msg = '[Error 1] MQ probe requires bridge_class and probe_queue_name.'
+            LOG.error(err_msg)
+            raise ValueError(__name__, err_msg)
+
+        def get_encoder(queue_name):
+            return _EnvelopeEncoder(
+                self.__sender, self.__message_type, self.__address_line_1, self.__address_line_2,
+                self.__host, self.__port, self.__queue_manager_name, self.__channel, queue_name,
+                self.__user_name, self.__password)
+
+        message = 'PROBE {}'.format(message_generation_time.strftime("%Y-%m-%dT%H:%M:%S"))
+        put_envelope = get_encoder(put_queue_name).encode(message, correlation_id, message_generation_time)
+        get_envelope = get_encoder(get_queue_name).encode('', correlation_id, message_generation_time)
+
+        ## A dedicated worker, so JVM start and connect are part of the measurement
+        bridge = _MQBridge(
+            self.get_java_command(self.__bridge_class),
+            self.get_java_environ(),
+            self.__client_path,
+            ready_timeout = timeout,
+            maximum_restarts = 0)
+
+        LOG.info('==== [START] MQ Probe - {} ===='.format(correlation_id))
+
+        try:
+            bridge.start()
+            result.update(bridge.get_start_timings())
+
+            started = time.perf_counter()
+            status, detail = bridge.send(put_envelope, 'PUT', timeout)
+            result['put_ms'] = (time.perf_counter() - started) * 1000
+            if status != 'OK':
+                raise AssertionError(__name__, 'PUT failed - ' + detail)
+
+            got = time.perf_counter()
+            status, detail = bridge.send(get_envelope, 'GET', timeout)
+            result['get_ms'] = (time.perf_counter() - got) * 1000
+            if status != 'OK':
+                raise AssertionError(__name__, 'GET failed - ' + detail)
+
+            result['round_trip_ms'] = (time.perf_counter() - started) * 1000
+            result['status'] = 'OK'
+        except concurrent.futures.TimeoutError:
+            result['error'] = 'Timeout after {}s.'.format(timeout)
+        except:
+            result['error'] = str(sys.exc_info()[1])
+        finally:
+            bridge.stop()
+
+        if result['status'] == 'OK':
+            LOG.info('[Success 0] MQ Probe: {}'.format(str(result)))
+        else:
+            LOG.critical('[Error 1] MQ Probe failed: {}'.format(str(result)))
+
+        LOG.info('==== [END] MQ Probe - {} ===='.format(correlation_id))
+
+        return result
+
+    def callback(self, message_generation_time = datetime.datetime.now()):
+        ## Variable Declaration
+        self.__message_generation_time = message_generation_time
+        self.set_payload(self.to_byte())
+
+        if self.__bridge is not None:
+            return self.__callback_bridge()
+
+        self.__callback_subprocess(self.__payload, self.__correlation_id)
+
+        return self.__message_generation_time
+
+    def callback_many(self, rows, message_generation_time = None, timeout = None):
+        ### Publish many messages in one client session, return per-message outcomes instead of raising on the first error
+        if message_generation_time is None:
+            message_generation_time = datetime.datetime.now()
+
+        envelopes = self.build_envelopes(rows, message_generation_time)
+
+        return self.publish_envelopes(envelopes, message_generation_time, timeout)
+
+    def build_envelopes(self, rows, message_generation_time):
+        ### Return [(correlationId, envelope)] for a DataFrame (payload, correlationId) or iterable of pairs
+        return [
+            (str(correlation_id), self.build_envelope(str(message), str(correlation_id), message_generation_time))
+            for message, correlation_id in iter_message_rows(rows)]
+
+    def publish_envelopes(self, envelopes, message_generation_time, timeout = None):
+        ### Send pre-built [(correlationId, envelope)] in one client session, return per-message outcomes.
+        ### timeout: seconds a message may wait for its ACK on the bridge, default MQ_BRIDGE_SEND_TIMEOUT
+        if timeout is None:
+            timeout = BRIDGE_SEND_TIMEOUT
+        outcomes = []
+
+        LOG.info('==== [START] MQ Batch - {} message(s) ===='.format(len(envelopes)))
+
+        ## Prefer one bridge session for the whole batch; a bridge started here is stopped afterwards
+        owned_bridge = self.__bridge is None and bool(self.__bridge_class)
+        if owned_bridge:
+            self.start_bridge()
+
+        try:
+            if self.__bridge is not None:
+                futures = []
+                for correlation_id, envelope in envelopes:
+                    try:
+                        futures.append(self.__bridge.submit(envelope))
+                    except:
+                        futures.append(sys.exc_info()[1])
+
+                ## After a first timeout the worker is presumed stuck, the frames behind it share one more timeout window
+                deadline = None
+                for (correlation_id, envelope), future in zip(envelopes, futures):
+                    if isinstance(future, BaseException):
+                        status, detail = 'ERROR', str(future)
+                    else:
+                        try:
+                            status, detail = future.result(timeout if deadline is None else max(0, deadline - time.monotonic()))
+                        except concurrent.futures.TimeoutError:
+                            if self.__bridge.abandon(future):
+                                status, detail = 'ERROR', 'Timeout after {}s.'.format(timeout)
+                                deadline = deadline or time.monotonic() + timeout
+                            else:
+                                status, detail = future.result()
+                    outcomes.append(self.__outcome(correlation_id, message_generation_time, status, detail))
+            else:
+                for correlation_id, envelope in envelopes:
+                    try:
+                        self.__callback_subprocess(envelope, correlation_id)
+                        outcomes.append(self.__outcome(correlation_id, message_generation_time, 'OK', ''))
+                    except:
+                        outcomes.append(self.__outcome(correlation_id, message_generation_time, 'ERROR', str(sys.exc_info()[1])))
+        finally:
+            if owned_bridge:
+                self.stop_bridge()
+
+        failed = [outcome for outcome in outcomes if outcome['status'] != 'OK']
+        if failed:
+            LOG.warning('[MQ Batch] {} of {} message(s) failed:\n{}'.format(
+                len(failed), len(outcomes), '\n'.join('{} - {}'.format(i['correlationId'], i['error']) for i in failed)))
+
+        LOG.info('==== [END] MQ Batch - {} sent, {} failed ===='.format(len(outcomes) - len(failed), len(failed)))
+
+        return outcomes
+
+    async def acallback(self, message, correlation_id, message_generation_time = None, timeout = None):
+        ### asyncio version of callback(), raise on failure
+        if message_generation_time is None:
+            message_generation_time = datetime.datetime.now()
+
+        envelope = self.build_envelope(str(message), str(correlation_id), message_generation_time)
+        status, detail = await self.__asend(envelope, timeout)
+
+        if status != 'OK':
+            LOG.critical(detail)
+            raise AssertionError(__name__, detail)
+
+        LOG.info('[Success 0] Message: ' + str(correlation_id) + ' successfully sent to remote side.')
+
+        return message_generation_time
+
+    async def publish_all(self, rows, concurrency = MAXIMUM_IN_FLIGHT, timeout = None, message_generation_time = None):
+        ### asyncio version of callback_many(), at most `concurrency` messages in flight, per-message timeout
+        if message_generation_time is None:
+            message_generation_time = datetime.datetime.now()
+
+        rows = enumerate(iter_message_rows(rows))
+        outcomes = {}
+
+        async def worker():
+            for i, (message, correlation_id) in rows:
+                correlation_id = str(correlation_id)
+                envelope = self.build_envelope(str(message), correlation_id, message_generation_time)
+                try:
+                    status, detail = await self.__asend(envelope, timeout)
+                except asyncio.TimeoutError:
+                    status, detail = 'ERROR', 'Timeout after {}s.'.format(timeout)
+                except:
+                    status, detail = 'ERROR', str(sys.exc_info()[1])
+                outcomes[i] = self.__outcome(correlation_id, message_generation_time, status, detail)
+
+        LOG.info('==== [START] MQ Async Publish - concurrency = {} ===='.format(concurrency))
+
+        await asyncio.gather(*[worker() for _ in range(max(1, int(concurrency)))])
+        outcomes = [outcomes[i] for i in sorted(outcomes)]
+
+        failed = [outcome for outcome in outcomes if outcome['status'] != 'OK']
+        if failed:
+            LOG.warning('[MQ Async Publish] {} of {} message(s) failed:\n{}'.format(
+                len(failed), len(outcomes), '\n'.join('{} - {}'.format(i['correlationId'], i['error']) for i in failed)))
+
+        LOG.info('==== [END] MQ Async Publish - {} sent, {} failed ===='.format(len(outcomes) - len(failed), len(failed)))
+
+        return outcomes
+
+    async def __asend(self, envelope, timeout = None):
+        ## Bridge: await the ack future; otherwise one asyncio subprocess per message
+        if self.__bridge is not None:
+            ## A pipe write, a drain or a (re)start can block, keep submit off the event loop
+            future = await asyncio.get_running_loop().run_in_executor(None, self.__bridge.submit, envelope)
+
+            try:
+                ## shield: a timeout must not cancel the future the reader thread resolves
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                ## Only this frame fails, the bridge checks the worker before the next frame
+                if self.__bridge.abandon(future):
+                    raise
+                return future.result()
+
+        args, stdin, temp_path = self.__get_payload_transport(envelope)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.get_java_command('Main', *args),
+                env = self.get_java_environ(),
+                stdin = asyncio.subprocess.PIPE if stdin is not None else None,
+                stdout = asyncio.subprocess.PIPE,
+                stderr = asyncio.subprocess.PIPE,
+                cwd = self.__client_path or None)
+
+            try:
+                output, error = await asyncio.wait_for(process.communicate(stdin), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+        if output:
+            LOG.info(output.decode('utf-8', 'replace'))
+
+        if error:
+            return 'ERROR', error.decode('utf-8', 'replace')
+
+        return 'OK', ''
+
+    def __outcome(self, correlation_id, message_generation_time, status, detail):
+        return {
+            'correlationId': correlation_id,
+            'msgGenTime': message_generation_time,
+            'status': status,
+            'error': detail if status != 'OK' else ''
+        }
+
+    def __get_payload_transport(self, payload):
+        ## Return (arguments, stdin bytes, temp file path) for MQ_PAYLOAD_TRANSPORT; stdin/file avoid ARG_MAX on large messages
+        if PAYLOAD_TRANSPORT == 'stdin':
+            return ['-'], payload, None
+        elif PAYLOAD_TRANSPORT == 'file':
+            with tempfile.NamedTemporaryFile('wb', prefix='mq-', suffix='.json', delete=False) as f:
+                f.write(payload)
+            return ['@' + f.name], None, f.name
+        else:
+            ## The legacy Main reads the unescaped envelope, only stdin/file/bridge take the escaped one
+            return [f'{_EnvelopeEncoder.to_legacy(payload)}', '2>&1'], None, None
+
+    def __callback_subprocess(self, payload, correlation_id):
+        environ = self.get_java_environ()
+        args, stdin, temp_path = self.__get_payload_transport(payload)
+        command = self.get_java_command('Main', *args)
+
+        LOG.debug(str(type(payload)) + ' ' + str(payload))
 
         ## Call MQ Java Object
         try:
@@ -252,10 +967,11 @@ class MQ():
                 command,
                 universal_newlines = True,
                 env = environ,
+                stdin = subprocess.PIPE if stdin is not None else None,
                 stdout = subprocess.PIPE,
                 stderr = subprocess.PIPE,
                 cwd = self.__client_path
-            ).communicate()
+            ).communicate(stdin.decode('utf-8') if stdin is not None else None)
             
             LOG.info(output)
 
@@ -263,7 +979,7 @@ class MQ():
                 LOG.critical(error)
                 raise AssertionError(__name__, error)
             else:
-                LOG.info('[Success 0] Message: ' + self.__correlation_id + ' successfully sent to remote side.')
+                LOG.info('[Success 0] Message: ' + correlation_id + ' successfully sent to remote side.')
 
             LOG.info("==== [END] MQ Java Subprocess ====")
 
@@ -277,5 +993,34 @@ class MQ():
             LOG.critical(err_msg)
             LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
             raise AssertionError(__name__, err_msg)
-        
-        return self.__message_generation_time
\ No newline at end of file
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def __callback_bridge(self):
+        ## Call MQ Java Bridge, the worker is restarted by the bridge if it has exited
+        LOG.info("==== [START] MQ Java Bridge ====")
+
+        try:
+            ## A worker hung on the frame is restarted before the next frame
+            status, detail = self.__bridge.send(self.__payload, timeout=BRIDGE_SEND_TIMEOUT)
+        except ConnectionError:
+            raise
+        except concurrent.futures.TimeoutError:
+            err_msg = '[Error 1] MQ Java Bridge did not acknowledge message within {}s.'.format(BRIDGE_SEND_TIMEOUT)
+            LOG.critical(err_msg)
+            raise AssertionError(__name__, err_msg)
+        except:
+            err_msg = '[Error 1] Unknown Exception when calling MQ Java Bridge.'
+            LOG.critical(err_msg)
+            LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+            raise AssertionError(__name__, err_msg)
+
+        if status != 'OK':
+            LOG.critical(detail)
+            raise AssertionError(__name__, detail)
+
+        LOG.info('[Success 0] Message: ' + self.__correlation_id + ' successfully sent to remote side.')
+        LOG.info("==== [END] MQ Java Bridge ====")
+
+        return self.__message_generation_time
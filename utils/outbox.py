@@ -0,0 +1,236 @@
+"""
+    Name:
+        outbox.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Durable on-disk outbox between the BigQuery extract and the MQ publisher.
+        Messages are appended with their correlationId, marked acked after a successful send
+        and replayed from the first un-acked offset on restart.
+        Backed by SQLite (WAL), commits are batched so fsync is paid once per batch.
+    Note:
+        20261017 - Init commit
+        20261017 - Bugfix: a correlationId is pending at most once, re-extracted messages are not appended again
+"""
+
+import os
+import sys
+import sqlite3
+import datetime
+import threading
+
+from .logging import Logging
+from .mq import iter_message_rows
+
+LOG = Logging(__name__)
+
+if os.environ.get('OUTBOX_SYNC_EVERY'):
+    SYNC_EVERY = int(os.environ.get('OUTBOX_SYNC_EVERY'))
+else:
+    SYNC_EVERY = 500
+
+if os.environ.get('OUTBOX_BATCH_SIZE'):
+    BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE'))
+else:
+    BATCH_SIZE = 500
+
+class _Exception():
+    def __init__(self) -> None:
+        pass
+
+    def outbox_unavailable(path):
+        err_msg = '[Error 1] Failed to open outbox - "{}"'.format(path)
+        LOG.error(err_msg)
+        raise IOError(__name__, err_msg)
+
+class Outbox():
+    __path = ""
+    __connection = None
+    __sync_every = SYNC_EVERY
+    __unsynced = 0
+
+    def __init__(self, path, sync_every = SYNC_EVERY) -> None:
+        self.__path = path
+        self.__sync_every = int(sync_every)
+        self.__unsynced = 0
+        self.__lock = threading.RLock()
+
+        try:
+            if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            self.__connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self.__connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.__connection.execute('PRAGMA journal_mode = WAL')
+            self.__connection.execute('PRAGMA synchronous = FULL')
+            self.__connection.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    offset INTEGER PRIMARY KEY AUTOINCREMENT,
+                    correlation_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_time TEXT NOT NULL,
+                    acked_time TEXT
+                )''')
+            self.__connection.execute('CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (offset) WHERE acked_time IS NULL')
+            ## Outboxes written before the unique index may hold duplicates, keep the first
+            self.__connection.execute('''
+                DELETE FROM outbox WHERE acked_time IS NULL AND offset NOT IN (
+                    SELECT MIN(offset) FROM outbox WHERE acked_time IS NULL GROUP BY correlation_id
+                )''')
+            self.__connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS outbox_pending_correlation_id ON outbox (correlation_id) WHERE acked_time IS NULL')
+            self.__connection.execute('BEGIN')
+        except sqlite3.Error:
+            _Exception.outbox_unavailable(path)
+
+        LOG.info('Outbox opened - "{}", {} pending message(s).'.format(path, self.count_pending()))
+
+    def get_path(self):
+        return self.__path
+
+    def append(self, payload, correlation_id):
+        ### Append one message, return its offset (of the pending one if the correlationId is already pending). Durable after the next sync
+        with self.__lock:
+            cursor = self.__connection.execute(
+                'INSERT OR IGNORE INTO outbox (correlation_id, payload, created_time) VALUES (?, ?, ?)',
+                (str(correlation_id), str(payload), datetime.datetime.now().isoformat()))
+
+            if cursor.rowcount == 0:
+                return self.__connection.execute(
+                    'SELECT offset FROM outbox WHERE correlation_id = ? AND acked_time IS NULL', (str(correlation_id),)).fetchone()[0]
+
+            self.__written(1)
+
+            return cursor.lastrowid
+
+    def append_many(self, rows):
+        ### Append a DataFrame (payload, correlationId) or iterable of pairs, synced once at the end.
+        ### correlationIds already pending are skipped, return the number appended
+        appended = 0
+        total = 0
+
+        with self.__lock:
+            batch = []
+            for payload, correlation_id in iter_message_rows(rows):
+                batch.append((str(correlation_id), str(payload), datetime.datetime.now().isoformat()))
+
+                if len(batch) >= self.__sync_every:
+                    total = total + len(batch)
+                    appended = appended + self.__insert(batch)
+                    batch = []
+
+            total = total + len(batch)
+            appended = appended + self.__insert(batch)
+            self.sync()
+
+        LOG.info('Outbox appended {} message(s), {} already pending.'.format(appended, total - appended))
+
+        return appended
+
+    def ack(self, offsets):
+        ### Mark messages as delivered
+        offsets = list(offsets)
+
+        with self.__lock:
+            acked_time = datetime.datetime.now().isoformat()
+            self.__connection.executemany(
+                'UPDATE outbox SET acked_time = ? WHERE offset = ? AND acked_time IS NULL',
+                [(acked_time, offset) for offset in offsets])
+            self.__written(len(offsets))
+
+    def sync(self):
+        ### Commit (and fsync) everything written since the last sync
+        with self.__lock:
+            self.__connection.execute('COMMIT')
+            self.__connection.execute('BEGIN')
+            self.__unsynced = 0
+
+    def pending(self, batch_size = BATCH_SIZE):
+        ### Yield (offset, payload, correlation_id) of un-acked messages in order, one page at a time
+        offset = 0
+
+        while True:
+            with self.__lock:
+                rows = self.__connection.execute(
+                    'SELECT offset, payload, correlation_id FROM outbox WHERE acked_time IS NULL AND offset > ? ORDER BY offset LIMIT ?',
+                    (offset, int(batch_size))).fetchall()
+
+            if not rows:
+                break
+
+            yield from rows
+            offset = rows[-1][0]
+
+    def count_pending(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM outbox WHERE acked_time IS NULL').fetchone()[0]
+
+    def publish(self, mq, batch_size = BATCH_SIZE):
+        ### Replay all un-acked messages through mq.callback_many(), ack the successful ones, return outcomes
+        outcomes = []
+        batch = []
+
+        LOG.info('[Outbox] Replay {} pending message(s) from "{}"'.format(self.count_pending(), self.__path))
+
+        for row in self.pending(batch_size):
+            batch.append(row)
+
+            if len(batch) >= batch_size:
+                outcomes.extend(self.__publish_batch(mq, batch))
+                batch = []
+
+        if batch:
+            outcomes.extend(self.__publish_batch(mq, batch))
+
+        return outcomes
+
+    def compact(self):
+        ### Drop acknowledged messages and return the freed pages to the file system
+        with self.__lock:
+            self.sync()
+            removed = self.__connection.execute('DELETE FROM outbox WHERE acked_time IS NOT NULL').rowcount
+            self.__connection.execute('COMMIT')
+            self.__connection.execute('PRAGMA incremental_vacuum')
+            self.__connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self.__connection.execute('BEGIN')
+
+        LOG.info('Outbox compacted, removed {} acknowledged message(s).'.format(removed))
+
+        return removed
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.execute('COMMIT')
+                self.__connection.close()
+                self.__connection = None
+
+        LOG.info('Outbox closed - "{}"'.format(self.__path))
+
+    def __insert(self, batch):
+        if not batch:
+            return 0
+
+        cursor = self.__connection.executemany(
+            'INSERT OR IGNORE INTO outbox (correlation_id, payload, created_time) VALUES (?, ?, ?)', batch)
+        self.__unsynced = self.__unsynced + cursor.rowcount
+
+        return cursor.rowcount
+
+    def __written(self, count):
+        self.__unsynced = self.__unsynced + count
+
+        if self.__unsynced >= self.__sync_every:
+            self.sync()
+
+    def __publish_batch(self, mq, batch):
+        try:
+            outcomes = mq.callback_many([(payload, correlation_id) for offset, payload, correlation_id in batch])
+        except:
+            LOG.error('[Outbox] Failed to publish {} message(s), kept for replay.'.format(len(batch)))
+            LOG.info('DEBUG - {} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+            return []
+
+        self.ack([row[0] for row, outcome in zip(batch, outcomes) if outcome['status'] == 'OK'])
+        self.sync()
+
+        return outcomes
@@ -0,0 +1,167 @@
+"""
+    Name:
+        payload_index.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Persistent index of the last payload sent per flight leg (FLTID, DATOP_CHN).
+        Stores a hash of the payload only, used to skip re-sending unchanged ASM_CON messages.
+        Backed by SQLite, rebuildable in bulk from sql.get_select_msg_history or the msg_latest template.
+    Note:
+        20261017 - Init commit
+        20261017 - Accept precomputed payloadHash (msg_latest)
+        20261017 - Bugfix: keep the latest message per leg when several are marked at once
+"""
+
+import os
+import sqlite3
+import hashlib
+import datetime
+import threading
+
+from .logging import Logging
+
+LOG = Logging(__name__)
+
+### SQLite default SQLITE_MAX_VARIABLE_NUMBER is 999 on older builds
+LOOKUP_CHUNK_SIZE = 900
+
+def get_leg_key(fltid, datop_chn):
+    if isinstance(datop_chn, (datetime.datetime, datetime.date)):
+        datop_chn = datop_chn.strftime('%Y-%m-%d')
+
+    return '{}|{}'.format(fltid, str(datop_chn)[:10])
+
+def get_payload_hash(payload):
+    return hashlib.blake2b(str(payload).encode('utf-8'), digest_size=16).hexdigest()
+
+def get_correlation_updated_time(correlation_id):
+    ### 'OpmLegChangeAsmCon-{FLTID}-%y%m%d%H%M%S' -> '%y%m%d%H%M%S' (SRC_UPDATED_TIME), sortable as text
+    return str(correlation_id).rsplit('-', 1)[-1]
+
+def get_latest_per_leg(dataframe):
+    ### One row per leg (FLTID, DATOP_CHN): the latest message by latestDate, then SRC_UPDATED_TIME
+    ### (msg_history/msg_latest have none, the update time is taken from the correlationId)
+    if len(dataframe) == 0:
+        return dataframe
+
+    ordered = dataframe.assign(_leg_key=[get_leg_key(fltid, datop_chn) for fltid, datop_chn in zip(dataframe['FLTID'], dataframe['DATOP_CHN'])])
+    sort_columns = ['latestDate'] if 'latestDate' in dataframe else []
+
+    if 'SRC_UPDATED_TIME' in dataframe:
+        sort_columns.append('SRC_UPDATED_TIME')
+    elif 'correlationId' in dataframe:
+        ordered['_updated_time'] = [get_correlation_updated_time(correlation_id) for correlation_id in dataframe['correlationId']]
+        sort_columns.append('_updated_time')
+
+    if sort_columns:
+        ordered = ordered.sort_values(sort_columns, kind='stable', na_position='first')
+
+    latest = ordered.drop_duplicates('_leg_key', keep='last')
+
+    return latest.drop(columns=[column for column in ['_leg_key', '_updated_time'] if column in latest])
+
+class _Exception():
+    def __init__(self) -> None:
+        pass
+
+    def index_unavailable(path):
+        err_msg = '[Error 1] Failed to open payload index - "{}"'.format(path)
+        LOG.error(err_msg)
+        raise IOError(__name__, err_msg)
+
+class PayloadIndex():
+    __path = ""
+    __connection = None
+
+    def __init__(self, path) -> None:
+        self.__path = path
+        self.__lock = threading.Lock()
+
+        try:
+            if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            self.__connection = sqlite3.connect(path, check_same_thread=False)
+            self.__connection.execute('PRAGMA journal_mode = WAL')
+            self.__connection.execute('''
+                CREATE TABLE IF NOT EXISTS payload_index (
+                    leg_key TEXT PRIMARY KEY,
+                    payload_hash TEXT NOT NULL,
+                    updated_time TEXT NOT NULL
+                ) WITHOUT ROWID''')
+            self.__connection.commit()
+        except sqlite3.Error:
+            _Exception.index_unavailable(path)
+
+    def get_path(self):
+        return self.__path
+
+    def count(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM payload_index').fetchone()[0]
+
+    def filter_changed(self, dataframe):
+        ### Return the rows of a pandas.Dataframe (FLTID, DATOP_CHN, payload) whose payload differs from the last one sent
+        if len(dataframe) == 0:
+            return dataframe
+
+        keys = [get_leg_key(fltid, datop_chn) for fltid, datop_chn in zip(dataframe['FLTID'], dataframe['DATOP_CHN'])]
+        hashes = [get_payload_hash(payload) for payload in dataframe['payload']]
+        sent = self.__lookup(keys)
+
+        changed = [sent.get(key) != payload_hash for key, payload_hash in zip(keys, hashes)]
+        LOG.info('Payload index: {} of {} leg(s) changed since last sent.'.format(sum(changed), len(changed)))
+
+        return dataframe[changed]
+
+    def mark_sent(self, dataframe):
+        ### Record the payload hash of the latest row per leg of a pandas.Dataframe (FLTID, DATOP_CHN, payload or payloadHash) as sent
+        dataframe = get_latest_per_leg(dataframe)
+        updated_time = datetime.datetime.now().isoformat()
+        if 'payloadHash' in dataframe:
+            hashes = dataframe['payloadHash']
+        else:
+            hashes = [get_payload_hash(payload) for payload in dataframe['payload']]
+
+        rows = [
+            (get_leg_key(fltid, datop_chn), payload_hash, updated_time)
+            for fltid, datop_chn, payload_hash in zip(dataframe['FLTID'], dataframe['DATOP_CHN'], hashes)]
+
+        with self.__lock:
+            self.__connection.executemany(
+                'INSERT INTO payload_index (leg_key, payload_hash, updated_time) VALUES (?, ?, ?) '
+                'ON CONFLICT (leg_key) DO UPDATE SET payload_hash = excluded.payload_hash, updated_time = excluded.updated_time',
+                rows)
+            self.__connection.commit()
+
+        return len(rows)
+
+    def rebuild(self, dataframe):
+        ### Replace the whole index from the result of sql.get_select_msg_history or the msg_latest template
+        with self.__lock:
+            self.__connection.execute('DELETE FROM payload_index')
+            self.__connection.commit()
+
+        count = self.mark_sent(dataframe)
+        LOG.info('Payload index rebuilt with {} leg(s) - "{}"'.format(count, self.__path))
+
+        return count
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __lookup(self, keys):
+        sent = {}
+
+        with self.__lock:
+            for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+                sent.update(self.__connection.execute(
+                    'SELECT leg_key, payload_hash FROM payload_index WHERE leg_key IN ({})'.format(','.join('?' * len(chunk))),
+                    chunk).fetchall())
+
+        return sent
@@ -0,0 +1,344 @@
+"""
+    Name:
+        pipeline.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Streaming stage runner. Every stage is a generator function (iterable -> iterable) running on its own thread,
+        connected by bounded queues for backpressure, so all stages overlap and memory stays flat.
+        Includes the ASM_CON chain: BigQuery pages >>> envelope builder >>> MQ publisher >>> history writer,
+        and a fan-out runner of the chain over many projects.
+    Note:
+        20261017 - Init commit
+        20261017 - Add per-project rate limit and multi-project fan-out
+        20261017 - Bugfix: keep the partial summary of a failed project
+"""
+
+import os
+import sys
+import time
+import queue
+import datetime
+import threading
+import concurrent.futures
+
+from .logging import Logging
+from .history import HistoryWriter
+
+LOG = Logging(__name__)
+
+if os.environ.get('PIPELINE_QUEUE_SIZE'):
+    QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE'))
+else:
+    QUEUE_SIZE = 4
+
+if os.environ.get('PIPELINE_PAGE_SIZE'):
+    PAGE_SIZE = int(os.environ.get('PIPELINE_PAGE_SIZE'))
+else:
+    PAGE_SIZE = 1000
+
+if os.environ.get('PIPELINE_MAXIMUM_PROJECTS'):
+    MAXIMUM_PROJECTS = int(os.environ.get('PIPELINE_MAXIMUM_PROJECTS'))
+else:
+    MAXIMUM_PROJECTS = 4
+
+_END = object()
+
+class _Stopped(BaseException):
+    pass
+
+def get_row_count(item):
+    ### Rows carried by a stage item: a DataFrame/list, or the first element of a (page, ...) tuple
+    if isinstance(item, tuple) and item:
+        item = item[0]
+
+    return len(item) if hasattr(item, '__len__') else 1
+
+class StageCounter():
+    ### Per-stage throughput counter
+    name : str
+    items : int
+    rows : int
+    busy : float
+
+    def __init__(self, name) -> None:
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.started = None
+        self.ended = None
+
+    def get_elapsed(self):
+        if self.started is None:
+            return 0.0
+
+        return (self.ended or time.perf_counter()) - self.started
+
+    def to_dict(self):
+        elapsed = self.get_elapsed()
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'rows': self.rows,
+            'busy_seconds': round(self.busy, 3),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed > 0 else 0.0
+        }
+
+class RateLimiter():
+    ### Token bucket of rate tokens per second, burst up to one second of tokens
+    rate : float
+
+    def __init__(self, rate) -> None:
+        self.rate = float(rate)
+        self.__tokens = self.rate
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def get_burst(self):
+        return max(1, int(self.rate))
+
+    def acquire(self, tokens = 1):
+        ### Block until tokens are available, tokens above the burst size are taken in one go after waiting
+        with self.__lock:
+            while True:
+                now = time.monotonic()
+                self.__tokens = min(self.rate, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+
+                if self.__tokens >= min(tokens, self.rate):
+                    self.__tokens = self.__tokens - tokens
+                    return
+
+                time.sleep((min(tokens, self.rate) - self.__tokens) / self.rate)
+
+class Pipeline():
+    __queue_size = QUEUE_SIZE
+
+    def __init__(self, queue_size = QUEUE_SIZE) -> None:
+        self.__queue_size = int(queue_size)
+        self.__counters = []
+        self.__stop = threading.Event()
+        self.__errors = []
+
+    def get_counters(self):
+        return [counter.to_dict() for counter in self.__counters]
+
+    def run(self, source, *stages):
+        ### Run source >>> stages[0] >>> ... >>> stages[-1], drain the last stage, return the per-stage counters
+        self.__counters = [StageCounter('source')] + [StageCounter(getattr(stage, '__name__', str(stage))) for stage in stages]
+        self.__stop.clear()
+        self.__errors = []
+
+        queues = [queue.Queue(self.__queue_size) for _ in range(len(stages) + 1)]
+        threads = [threading.Thread(target=self.__feed, args=(iter(source), None, queues[0], self.__counters[0]), daemon=True)]
+        threads.extend([
+            threading.Thread(target=self.__feed, args=(stage, queues[i], queues[i + 1], self.__counters[i + 1]), daemon=True)
+            for i, stage in enumerate(stages)])
+
+        LOG.info('[Pipeline] Start: {}'.format(' >>> '.join(counter.name for counter in self.__counters)))
+
+        [thread.start() for thread in threads]
+        try:
+            for item in self.__iterate(queues[-1]):
+                pass
+        except _Stopped:
+            pass
+        [thread.join() for thread in threads]
+
+        LOG.info('[Pipeline] End, stage counters:\n{}'.format('\n'.join(str(counter) for counter in self.get_counters())))
+
+        if self.__errors:
+            name, error = self.__errors[0]
+            err_msg = '[Error 1] Pipeline stage "{}" failed - {}'.format(name, error)
+            LOG.error(err_msg)
+            raise AssertionError(__name__, err_msg)
+
+        return self.get_counters()
+
+    def __feed(self, stage, inbound, outbound, counter):
+        counter.started = time.perf_counter()
+
+        try:
+            iterator = stage if inbound is None else iter(stage(self.__iterate(inbound, counter)))
+
+            while True:
+                started = time.perf_counter()
+                waiting = counter.waiting
+                item = next(iterator, _END)
+                counter.busy = counter.busy + time.perf_counter() - started - (counter.waiting - waiting)
+
+                if item is _END:
+                    break
+
+                counter.items = counter.items + 1
+                counter.rows = counter.rows + get_row_count(item)
+                self.__put(outbound, item)
+        except _Stopped:
+            pass
+        except:
+            self.__errors.append((counter.name, sys.exc_info()[1]))
+            LOG.error('[Pipeline] Stage "{}" failed, stop pipeline.'.format(counter.name))
+            self.__stop.set()
+        finally:
+            counter.ended = time.perf_counter()
+            try:
+                self.__put(outbound, _END)
+            except _Stopped:
+                pass
+
+    def __put(self, outbound, item):
+        while True:
+            if self.__stop.is_set() and item is not _END:
+                raise _Stopped()
+            try:
+                outbound.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self.__stop.is_set():
+                    raise _Stopped()
+
+    def __iterate(self, inbound, counter = None):
+        ## Upstream waits are not counted as busy time of the consuming stage
+        while True:
+            started = time.perf_counter()
+            try:
+                item = inbound.get(timeout=0.5)
+            except queue.Empty:
+                if self.__stop.is_set():
+                    raise _Stopped()
+                continue
+            finally:
+                if counter is not None:
+                    counter.waiting = counter.waiting + time.perf_counter() - started
+
+            if item is _END:
+                return
+
+            yield item
+
+def run_asm_con(bigquery, mq, project_id, sql, query_parameters = None, page_size = PAGE_SIZE, history_table_id = None, message_generation_time = None, history_spool_path = None, latest_sql = None, rate_limit = None, summary = None):
+    ### Streaming extract >>> publish >>> record for one project, return (outcomes summary, stage counters).
+    ### latest_sql: msg_latest_merge statement, keeps the latest state table up to date on every history flush
+    ### rate_limit: maximum messages per second published, None for unlimited
+    ### summary: dict updated in place, so the caller keeps the counts of pages published before a failure
+    if message_generation_time is None:
+        message_generation_time = datetime.datetime.now()
+
+    history_writer = HistoryWriter(bigquery, history_table_id, history_spool_path, latest_sql=latest_sql) if history_table_id is not None else None
+    rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    if summary is None:
+        summary = {}
+    summary.update({'project_id': project_id, 'sent': 0, 'failed': 0, 'publish_seconds': 0.0})
+
+    def build_envelopes(pages):
+        for page in pages:
+            yield page, mq.build_envelopes(page, message_generation_time)
+
+    def publish(batches):
+        for page, envelopes in batches:
+            ## Rate limited pages are published in chunks of one burst
+            chunk_size = rate_limiter.get_burst() if rate_limiter is not None else max(1, len(envelopes))
+            sent = []
+
+            for i in range(0, len(envelopes), chunk_size):
+                chunk = envelopes[i:i + chunk_size]
+                if rate_limiter is not None:
+                    rate_limiter.acquire(len(chunk))
+
+                started = time.perf_counter()
+                outcomes = mq.publish_envelopes(chunk, message_generation_time)
+                summary['publish_seconds'] = summary['publish_seconds'] + time.perf_counter() - started
+
+                chunk_sent = [outcome['correlationId'] for outcome in outcomes if outcome['status'] == 'OK']
+                summary['sent'] = summary['sent'] + len(chunk_sent)
+                summary['failed'] = summary['failed'] + len(outcomes) - len(chunk_sent)
+                sent.extend(chunk_sent)
+
+            yield page[page['correlationId'].isin(sent)]
+
+    def record_history(pages):
+        for page in pages:
+            if history_writer is not None and len(page) > 0:
+                history_writer.write(page)
+            yield page
+
+    ## Keep one bridge session for the whole run instead of one per page
+    owned_bridge = mq.get_bridge() is None and bool(mq.get_bridge_class())
+    if owned_bridge:
+        mq.start_bridge()
+
+    try:
+        counters = Pipeline().run(
+            bigquery.select_pages_by_standard_sql(sql, query_parameters, page_size),
+            build_envelopes,
+            publish,
+            record_history)
+    finally:
+        if owned_bridge:
+            mq.stop_bridge()
+        if history_writer is not None:
+            history_writer.close()
+
+    LOG.info('[Pipeline] {} - {} sent, {} failed.'.format(project_id, summary['sent'], summary['failed']))
+
+    return summary, counters
+
+def get_project_spool_path(project_id, spool_path = None):
+    ### One history spool per project, concurrent runs must not share a spool file
+    root, ext = os.path.splitext(spool_path or os.environ.get('HISTORY_SPOOL_PATH'))
+    return '{}.{}{}'.format(root, project_id, ext)
+
+def run_asm_con_projects(profiles, maximum_projects = MAXIMUM_PROJECTS):
+    ### Run run_asm_con for many projects concurrently. A profile is a dict of run_asm_con arguments
+    ### (project_id, bigquery, mq, sql, query_parameters, rate_limit, history_table_id, latest_sql, ...).
+    ### A failed project does not stop the others. Return the per-project summaries and the totals
+    def run(profile):
+        started = time.perf_counter()
+        project_id = profile['project_id']
+        summary = {'project_id': project_id, 'sent': 0, 'failed': 0, 'publish_seconds': 0.0}
+        counters = []
+
+        arguments = dict(profile, summary=summary)
+        if arguments.get('history_table_id') is not None:
+            arguments['history_spool_path'] = get_project_spool_path(project_id, arguments.get('history_spool_path'))
+
+        try:
+            ## On failure, summary keeps the messages published before it
+            summary, counters = run_asm_con(**arguments)
+            summary['status'] = 'OK'
+            summary['error'] = ''
+        except:
+            LOG.error('[Pipeline] Project {} failed - {}'.format(project_id, str(sys.exc_info()[1])))
+            summary['status'] = 'ERROR'
+            summary['error'] = str(sys.exc_info()[1])
+
+        summary['extracted'] = counters[0]['rows'] if counters else 0
+        summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        messages = summary['sent'] + summary['failed']
+        summary['latency_ms'] = round(summary['publish_seconds'] * 1000 / messages, 1) if messages else 0.0
+        summary['messages_per_second'] = round(messages / summary['elapsed_seconds'], 1) if summary['elapsed_seconds'] > 0 else 0.0
+        summary['publish_seconds'] = round(summary['publish_seconds'], 3)
+
+        return summary
+
+    LOG.info('[Pipeline] Fan-out over {} project(s): {}'.format(len(profiles), ', '.join(profile['project_id'] for profile in profiles)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(int(maximum_projects), len(profiles))), thread_name_prefix='project') as executor:
+        summaries = list(executor.map(run, profiles))
+
+    totals = {
+        'projects': len(summaries),
+        'failed_projects': sum(1 for summary in summaries if summary['status'] != 'OK'),
+        'extracted': sum(summary['extracted'] for summary in summaries),
+        'sent': sum(summary['sent'] for summary in summaries),
+        'failed': sum(summary['failed'] for summary in summaries)
+    }
+
+    LOG.info('[Pipeline] Fan-out summary:\n{}\n{}'.format(
+        '\n'.join(str(summary) for summary in summaries), str(totals)))
+
+    return summaries, totals
@@ -16,19 +16,85 @@
     202404 - Enchancement
     20240417 - Update log
     20240522 - Bugfix: Allow maximum 4GB single file size before SSH Connection down
+    20261017 - Add parallel recursive download over multiple channels/transports
+    20261017 - Add pipelined large file uploader
+    20261017 - Add remote tree snapshot, reuse listed attributes instead of stat()
+    20261017 - Add incremental sync mode with a local manifest
+    20261017 - Resumable large file transfers, reconnect on a dropped transport, remove the 4GB single file limit
+    20261017 - Bugfix: download_dir stays serial by default, parallel download opt-in by SFTP_DOWNLOAD_WORKERS
+    20261017 - Bugfix: never resume on a stale partial download, resume uploads by a local checkpoint
     
 """
 
 import paramiko
 from stat import S_ISDIR
 
-import sys, os, stat, time, json
+import sys, os, stat, time, json, queue, threading, socket, tempfile, hashlib
 sys.path.append('../../')
 from . import logging
+from .manifest import Manifest, get_local_attributes, get_file_hash, is_changed
 
 LOG = logging.Logging(__name__)
 WINDOWS_FORBIDDEN_CHAR = ['<', '>', '"', '|', '?', '*']
 
+### Files above LARGE_FILE_SIZE (bytes) are transferred by the pipelined, resumable downloader
+LARGE_FILE_SIZE = 300000000
+
+### Partial transfers are written to '{path}.part', download checkpoints to '{path}.part.json'
+PARTIAL_SUFFIX = '.part'
+
+if os.environ.get('SFTP_PIPELINED_UPLOAD_SIZE'):
+    PIPELINED_UPLOAD_SIZE = int(os.environ.get('SFTP_PIPELINED_UPLOAD_SIZE'))
+else:
+    PIPELINED_UPLOAD_SIZE = 32 * 1024 * 1024
+
+if os.environ.get('SFTP_WORKERS'):
+    WORKERS = int(os.environ.get('SFTP_WORKERS'))
+else:
+    WORKERS = 8
+
+### Default workers of SFTP.download_dir, serial unless opted in
+if os.environ.get('SFTP_DOWNLOAD_WORKERS'):
+    DOWNLOAD_WORKERS = int(os.environ.get('SFTP_DOWNLOAD_WORKERS'))
+else:
+    DOWNLOAD_WORKERS = 1
+
+if os.environ.get('SFTP_PROGRESS_SECONDS'):
+    PROGRESS_SECONDS = int(os.environ.get('SFTP_PROGRESS_SECONDS'))
+else:
+    PROGRESS_SECONDS = 10
+
+if os.environ.get('SFTP_CHECKPOINT_SIZE'):
+    CHECKPOINT_SIZE = int(os.environ.get('SFTP_CHECKPOINT_SIZE'))
+else:
+    CHECKPOINT_SIZE = 64 * 1024 * 1024
+
+if os.environ.get('SFTP_RESUME_RETRIES'):
+    RESUME_RETRIES = int(os.environ.get('SFTP_RESUME_RETRIES'))
+else:
+    RESUME_RETRIES = 5
+
+### Bytes before paramiko renegotiates keys; a transfer dropped by a failed rekey is resumed on a new connection
+if os.environ.get('SFTP_REKEY_BYTES'):
+    REKEY_BYTES = int(os.environ.get('SFTP_REKEY_BYTES'))
+else:
+    REKEY_BYTES = pow(2, 31)
+
+### Errors of a dropped connection, the transfer reconnects and resumes (any OSError once the channel is closed)
+RESUMABLE_ERRORS = (EOFError, ConnectionError, socket.timeout, paramiko.SSHException)
+
+### Sync manifest, shared by every synced directory (one namespace each)
+if os.environ.get('SFTP_MANIFEST_PATH'):
+    MANIFEST_PATH = os.environ.get('SFTP_MANIFEST_PATH')
+else:
+    MANIFEST_PATH = '.sftp_manifest.json'
+
+### Local sidecar checkpoints of remote partial uploads, one file per (server, local file, remote file)
+if os.environ.get('SFTP_CHECKPOINT_PATH'):
+    CHECKPOINT_PATH = os.environ.get('SFTP_CHECKPOINT_PATH')
+else:
+    CHECKPOINT_PATH = '.sftp_checkpoints'
+
 """
 https://gist.github.com/vznncv/cb454c21d901438cc228916fbe6f070f
 The section contains example of the paramiko usage for large file downloading.
@@ -43,7 +109,7 @@ import typing
 from os.path import join, dirname
 
 from paramiko import SFTPClient, SFTPFile, Message, SFTPError, Transport
-from paramiko.sftp import CMD_STATUS, CMD_READ, CMD_DATA
+from paramiko.sftp import CMD_STATUS, CMD_READ, CMD_DATA, CMD_WRITE
 
 logger = logging.Logging(__name__)
 
@@ -55,19 +121,23 @@ class _SFTPFileDownloader:
     _DOWNLOAD_MAX_REQUESTS = 48
     _DOWNLOAD_MAX_CHUNK_SIZE = 0x8000
 
-    def __init__(self, f_in: SFTPFile, f_out: typing.BinaryIO, callback=None):
+    def __init__(self, f_in: SFTPFile, f_out: typing.BinaryIO, callback=None, file_size=None, offset=0, checkpoint=None):
         self.f_in = f_in
         self.f_out = f_out
         self.callback = callback
+        self.file_size = file_size
+        self.offset = offset
+        self.checkpoint = checkpoint
 
         self.requested_chunks = {}
         self.received_chunks = {}
         self.saved_exception = None
 
     def download(self):
-        file_size = self.f_in.stat().st_size
-        requested_size = 0
-        received_size = 0
+        file_size = self.file_size if self.file_size is not None else self.f_in.stat().st_size
+        requested_size = self.offset
+        received_size = self.offset
+        checkpoint_size = self.offset
 
         while True:
             # send read requests
@@ -100,6 +170,13 @@ class _SFTPFileDownloader:
 
                 received_size += chunk_size
 
+            # flush and report the written size every CHECKPOINT_SIZE bytes
+            if self.checkpoint is not None and received_size - checkpoint_size >= CHECKPOINT_SIZE:
+                self.f_out.flush()
+                os.fsync(self.f_out.fileno())
+                self.checkpoint(received_size)
+                checkpoint_size = received_size
+
             # check transfer status
             if received_size >= file_size:
                 break
@@ -160,29 +237,366 @@ class _SFTPFileDownloader:
             raise x
 
 
-def download_file(sftp_client: SFTPClient, remote_path: str, local_path: str, callback=None):
+def is_connection_lost(sftp_client, e):
+    if isinstance(e, RESUMABLE_ERRORS):
+        return True
+
+    channel = sftp_client.get_channel()
+    return isinstance(e, OSError) and (channel is None or channel.closed or not channel.get_transport().is_active())
+
+def get_checkpoint_offset(partial_path, checkpoint_path, remote_path, file_size, mtime):
+    ### Bytes of the partial file to keep: the last checkpoint of the same remote file (path, size, mtime), otherwise 0
+    if not os.path.exists(partial_path) or not os.path.exists(checkpoint_path):
+        return 0
+
+    try:
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.loads(f.read() or '{}')
+    except ValueError:
+        return 0
+
+    if [checkpoint.get('remote_path'), checkpoint.get('size'), checkpoint.get('mtime')] != [remote_path, file_size, mtime]:
+        LOG.info('Checkpoint outdated, remote file changed - "{}"'.format(remote_path))
+        return 0
+
+    return min(int(checkpoint.get('offset', 0)), os.path.getsize(partial_path))
+
+def write_checkpoint(checkpoint_path, remote_path, file_size, mtime, offset, **kwargs):
+    directory = os.path.dirname(os.path.abspath(checkpoint_path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+        f.write(json.dumps(dict(kwargs, remote_path=remote_path, size=file_size, mtime=mtime, offset=offset)))
+
+    os.replace(f.name, checkpoint_path)
+
+def download_file(sftp_client: SFTPClient, remote_path: str, local_path: str, callback=None, file_size=None, mtime=None, connection=None, retries=RESUME_RETRIES):
     """
     Helper function to download remote file via sftp.
     It contains a fix for a bug that prevents a large file downloading with :meth:`paramiko.SFTPClient.get`
     Note: this function relies on some private paramiko API and has been tested with paramiko 2.7.1.
           So it may not work with other paramiko versions.
+    Data is written to '{local_path}.part' and checkpointed to '{local_path}.part.json' every CHECKPOINT_SIZE bytes,
+    a later download of the same remote file (size, mtime) resumes from the checkpoint instead of byte zero.
     :param sftp_client: paramiko sftp client
     :param remote_path: remote file path
     :param local_path: local file path
     :param callback: optional data callback
+    :param file_size: remote file size if already known (RemoteTree), saves a stat() round-trip
+    :param mtime: remote file mtime if already known (RemoteTree)
+    :param connection: optional :class:`_Connection`, to reconnect and resume after a dropped transport (e.g. failed rekey)
+    :param retries: reconnect attempts
+    :return: sftp client in use, a new one if the connection was re-established
     """
-    remote_file_size = sftp_client.stat(remote_path).st_size
+    if file_size is None or mtime is None:
+        attribute = sftp_client.stat(remote_path)
+        file_size, mtime = attribute.st_size, attribute.st_mtime
+
+    partial_path = local_path + PARTIAL_SUFFIX
+    checkpoint_path = partial_path + '.json'
+    attempt = 0
+
+    while True:
+        offset = get_checkpoint_offset(partial_path, checkpoint_path, remote_path, file_size, mtime)
+        if offset:
+            LOG.info('Resume "{}" from {}MB / {}MB'.format(remote_path, str(offset // (1024 ** 2)), str(file_size/1024/1024)))
+        else:
+            ## Nothing to resume, a stale partial must not be checkpointed for this remote file
+            for path in [checkpoint_path, partial_path]:
+                if os.path.exists(path):
+                    os.remove(path)
 
-    with sftp_client.open(remote_path, 'rb') as f_in, open(local_path, 'wb') as f_out:
-        _SFTPFileDownloader(
-            f_in=f_in,
-            f_out=f_out,
-            callback=callback
-        ).download()
+        opened = False
+        try:
+            with sftp_client.open(remote_path, 'rb') as f_in, open(partial_path, 'r+b' if offset else 'wb') as f_out:
+                f_out.truncate(offset)
+                f_out.seek(offset)
+                opened = True
+                _SFTPFileDownloader(
+                    f_in=f_in,
+                    f_out=f_out,
+                    callback=callback,
+                    file_size=file_size,
+                    offset=offset,
+                    checkpoint=lambda size: write_checkpoint(checkpoint_path, remote_path, file_size, mtime, size)
+                ).download()
+            break
+        except Exception as e:
+            ## Data is written in order, everything written by this attempt is kept
+            if opened and os.path.exists(partial_path):
+                write_checkpoint(checkpoint_path, remote_path, file_size, mtime, os.path.getsize(partial_path))
+            attempt += 1
+            if connection is None or attempt > retries or not is_connection_lost(sftp_client, e):
+                raise
+
+            LOG.warning('[SFTP] Connection lost during "{}" ({}), reconnect and resume, attempt {} of {}'.format(remote_path, str(e), attempt, retries))
+            time.sleep(min(2 ** attempt, 30))
+            sftp_client = connection.reconnect()
+
+    local_file_size = os.path.getsize(partial_path)
+    if file_size != local_file_size:
+        raise IOError(f"file size mismatch: {file_size} != {local_file_size}")
+
+    os.replace(partial_path, local_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
-    local_file_size = os.path.getsize(local_path)
-    if remote_file_size != local_file_size:
-        raise IOError(f"file size mismatch: {remote_file_size} != {local_file_size}")
+    return sftp_client
+
+class _SFTPFileUploader:
+    """
+    Helper class to upload large file with paramiko sftp client with a bounded window of concurrent write requests.
+    Counterpart of :class:`_SFTPFileDownloader`, :meth:`paramiko.SFTPClient.put` is latency-bound on large files.
+    """
+
+    _UPLOAD_MAX_REQUESTS = 48
+    _UPLOAD_MAX_CHUNK_SIZE = 0x8000
+
+    def __init__(self, f_in: typing.BinaryIO, f_out: SFTPFile, callback=None, max_requests=None, chunk_size=None, offset=0, checkpoint=None):
+        self.f_in = f_in
+        self.f_out = f_out
+        self.callback = callback
+        self.max_requests = max_requests or self._UPLOAD_MAX_REQUESTS
+        self.chunk_size = chunk_size or self._UPLOAD_MAX_CHUNK_SIZE
+        self.offset = offset
+        self.checkpoint = checkpoint
+
+        self.requested_chunks = {}
+        self.requested_size = offset
+        self.acknowledged_size = 0
+        self.saved_exception = None
+
+    def get_safe_offset(self):
+        """offset below which every write request is acknowledged, resume point after a dropped connection"""
+        if self.requested_chunks:
+            return min(offset for offset, _ in self.requested_chunks.values())
+
+        return self.requested_size
+
+    def upload(self):
+        file_size = os.fstat(self.f_in.fileno()).st_size
+        requested_size = self.offset
+        checkpoint_size = self.offset
+        self.f_in.seek(self.offset)
+
+        while True:
+            # send write requests
+            while len(self.requested_chunks) < self.max_requests and requested_size < file_size:
+                data = self.f_in.read(min(self.chunk_size, file_size - requested_size))
+                if not data:
+                    raise IOError(f"Local file shrank during upload: {requested_size} of {file_size} bytes read")
+
+                request_id = self._sftp_async_write_request(
+                    fileobj=self,
+                    file_handle=self.f_out.handle,
+                    offset=requested_size,
+                    data=data
+                )
+                self.requested_chunks[request_id] = (requested_size, len(data))
+                requested_size += len(data)
+                self.requested_size = requested_size
+
+            # check transfer status
+            if not self.requested_chunks:
+                break
+
+            # receive acknowledgements
+            # note: the _async_response is invoked
+            self.f_out.sftp._read_response()
+            self._check_exception()
+
+            # report the acknowledged offset every CHECKPOINT_SIZE bytes
+            if self.checkpoint is not None and self.get_safe_offset() - checkpoint_size >= CHECKPOINT_SIZE:
+                checkpoint_size = self.get_safe_offset()
+                self.checkpoint(checkpoint_size)
+
+        return self.acknowledged_size
+
+    def _sftp_async_write_request(self, fileobj, file_handle, offset, data):
+        sftp_client = self.f_out.sftp
+
+        with sftp_client._lock:
+            num = sftp_client.request_number
+
+            msg = Message()
+            msg.add_int(num)
+            msg.add_string(file_handle)
+            msg.add_int64(offset)
+            msg.add_string(data)
+
+            sftp_client._expecting[num] = fileobj
+            sftp_client.request_number += 1
+
+        sftp_client._send_packet(CMD_WRITE, msg)
+        return num
+
+    def _async_response(self, t, msg, num):
+        chunk_data = self.requested_chunks.pop(num, None)
+
+        if t != CMD_STATUS:
+            raise SFTPError("Expected status")
+        try:
+            self.f_out.sftp._convert_status(msg)
+        except Exception as e:
+            # save exception and re-raise it on next file operation
+            self.saved_exception = e
+            return
+
+        if chunk_data is None:
+            return
+
+        _, size = chunk_data
+        self.acknowledged_size += size
+        if self.callback is not None:
+            self.callback(size)
+
+    def _check_exception(self):
+        """if there's a saved exception, raise & clear it"""
+        if self.saved_exception is not None:
+            x = self.saved_exception
+            self.saved_exception = None
+            raise x
+
+
+def get_upload_checkpoint_path(sftp_client, local_path, remote_path):
+    host, port = sftp_client.get_channel().getpeername()[:2]
+    key = 'sftp://{}:{}/{}\n{}'.format(host, port, remote_path, os.path.abspath(local_path))
+
+    return os.path.join(CHECKPOINT_PATH, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest() + '.json')
+
+def get_upload_offset(sftp_client, partial_path, checkpoint_path, local_path, remote_path):
+    ### Resume point of a remote partial upload: the acknowledged offset of the local checkpoint,
+    ### only if the local file (size, mtime) is unchanged since and the remote partial still holds that many bytes.
+    ### Local attributes only, the clocks of the two hosts are not compared
+    if not os.path.exists(checkpoint_path):
+        return 0
+
+    try:
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.loads(f.read() or '{}')
+    except ValueError:
+        return 0
+
+    local_attribute = os.stat(local_path)
+    if [checkpoint.get('local_path'), checkpoint.get('remote_path'), checkpoint.get('size'), checkpoint.get('mtime')] != \
+            [os.path.abspath(local_path), remote_path, local_attribute.st_size, local_attribute.st_mtime_ns]:
+        LOG.info('Checkpoint outdated, local file changed - "{}"'.format(local_path))
+        return 0
+
+    try:
+        attribute = sftp_client.stat(partial_path)
+    except IOError:
+        return 0
+
+    offset = int(checkpoint.get('offset', 0))
+    return offset if attribute.st_size >= offset else 0
+
+def upload_file(sftp_client: SFTPClient, local_path: str, remote_path: str, callback=None, max_requests=None, chunk_size=None, connection=None, retries=RESUME_RETRIES):
+    """
+    Helper function to upload a large local file via sftp with :class:`_SFTPFileUploader`.
+    Data is written to '{remote_path}.part' and renamed on completion. The acknowledged offset is checkpointed
+    to a local sidecar in CHECKPOINT_PATH, a partial upload is resumed only if the local file (size, mtime) is unchanged.
+    :param callback: optional callback of the acknowledged bytes per chunk
+    :param connection: optional :class:`_Connection`, to reconnect and resume after a dropped transport (e.g. failed rekey)
+    :param retries: reconnect attempts
+    :return: SFTPAttributes of the remote file, as :meth:`paramiko.SFTPClient.put`
+    """
+    local_attribute = os.stat(local_path)
+    local_file_size = local_attribute.st_size
+    max_requests = max_requests or _SFTPFileUploader._UPLOAD_MAX_REQUESTS
+    chunk_size = chunk_size or _SFTPFileUploader._UPLOAD_MAX_CHUNK_SIZE
+    partial_path = remote_path + PARTIAL_SUFFIX
+    checkpoint_path = get_upload_checkpoint_path(sftp_client, local_path, remote_path)
+    attempt = 0
+
+    def checkpoint(offset):
+        write_checkpoint(checkpoint_path, remote_path, local_file_size, local_attribute.st_mtime_ns, offset, local_path=os.path.abspath(local_path))
+
+    while True:
+        uploader = None
+        offset = get_upload_offset(sftp_client, partial_path, checkpoint_path, local_path, remote_path)
+        if offset:
+            LOG.info('Resume "{}" from {}MB / {}MB'.format(local_path, str(offset // (1024 ** 2)), str(local_file_size/1024/1024)))
+        elif os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        try:
+            with open(local_path, 'rb') as f_in, sftp_client.open(partial_path, 'r+b' if offset else 'wb') as f_out:
+                uploader = _SFTPFileUploader(
+                    f_in=f_in,
+                    f_out=f_out,
+                    callback=callback,
+                    max_requests=max_requests,
+                    chunk_size=chunk_size,
+                    offset=offset,
+                    checkpoint=checkpoint
+                )
+                uploader.upload()
+            break
+        except Exception as e:
+            ## Acknowledged writes of this attempt are kept
+            if uploader is not None:
+                checkpoint(uploader.get_safe_offset())
+            attempt += 1
+            if connection is None or attempt > retries or not is_connection_lost(sftp_client, e):
+                raise
+
+            LOG.warning('[SFTP] Connection lost during "{}" ({}), reconnect and resume, attempt {} of {}'.format(local_path, str(e), attempt, retries))
+            time.sleep(min(2 ** attempt, 30))
+            sftp_client = connection.reconnect()
+
+    try:
+        sftp_client.posix_rename(partial_path, remote_path)
+    except IOError:
+        ## posix-rename extension not supported, rename does not overwrite
+        try:
+            sftp_client.remove(remote_path)
+        except IOError:
+            pass
+        sftp_client.rename(partial_path, remote_path)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    attribute = sftp_client.stat(remote_path)
+    if attribute.st_size != local_file_size:
+        raise IOError(f"file size mismatch: {local_file_size} != {attribute.st_size}")
+
+    return attribute
+
+class _Connection():
+    """
+    SFTP client of a transfer loop, replaced on reconnect() after a dropped transport.
+    Read .client after a transfer, it may be a new one.
+    """
+
+    def __init__(self, sftp_client, username = "", password = "") -> None:
+        self.client = sftp_client
+        self.host = str(sftp_client.get_channel().getpeername()[0])
+        self.port = str(sftp_client.get_channel().getpeername()[1])
+        self.username = username
+        self.password = password
+        self.transport = None
+
+    def reconnect(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        if self.transport is not None:
+            self.transport.close()
+
+        self.transport = get_paramiko_transport(self.host, self.port, self.username, self.password)
+        self.client = get_sftp_client(self.transport)
+
+        return self.client
+
+    def close(self):
+        ### Close the transport opened by reconnect(), if any
+        if self.transport is not None:
+            self.client.close()
+            self.transport.close()
 
 # References: https://stackoverflow.com/questions/14819681/upload-files-using-sftp-in-python-but-create-directories-if-path-doesnt-exist
 ### [Recursive] Given a remote location, create all the directory toward the bottom
@@ -231,18 +645,79 @@ def ls_dir(local_path):
             all_items.append(item_name)
     return all_items
 
-def ls_remote_dir(sftp_client, remote_path):
-    all_items = []
-    remote_attr = sftp_client.listdir_attr(remote_path)
+class RemoteEntry():
+    ### One listed remote item, attributes as returned by listdir_attr
+    path : str
+    size : int
+    mtime : int
+    mode : int
 
-    for i, attr in enumerate(remote_attr):
-        mode = attr.st_mode
+    def __init__(self, path, size, mtime, mode) -> None:
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
 
-        if S_ISDIR(mode):
-            all_items.extend(ls_remote_dir(sftp_client, '{}/{}'.format(remote_path, attr.filename)))
-        else:
-            all_items.append('{}/{}'.format(remote_path, attr.filename))
-    return all_items
+    def get_name(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def is_dir(self):
+        return S_ISDIR(self.mode or 0)
+
+    def __repr__(self):
+        return 'RemoteEntry({}, {}B)'.format(self.path, self.size)
+
+class RemoteTree():
+    """
+    Snapshot of a remote directory: size, mtime and mode of every entry from one listdir_attr call per directory.
+    Paths are '{remote_path}/{name}', as ls_remote_dir.
+    """
+
+    def __init__(self, remote_path, entries) -> None:
+        self.remote_path = remote_path
+        self.entries = list(entries)
+        self.__index = {entry.path: entry for entry in self.entries}
+
+    @classmethod
+    def scan(cls, sftp_client, remote_path, recursive = True):
+        entries = []
+
+        ## Depth-first, in listing order
+        def scan_dir(directory):
+            for attr in sftp_client.listdir_attr(directory):
+                entry = RemoteEntry('{}/{}'.format(directory, attr.filename), attr.st_size, attr.st_mtime, attr.st_mode)
+                entries.append(entry)
+
+                if recursive and entry.is_dir():
+                    scan_dir(entry.path)
+
+        scan_dir(remote_path)
+
+        return cls(remote_path, entries)
+
+    def get(self, path):
+        return self.__index.get(path)
+
+    def files(self):
+        return [entry for entry in self.entries if not entry.is_dir()]
+
+    def dirs(self):
+        return [entry for entry in self.entries if entry.is_dir()]
+
+    def filter(self, predicate):
+        return RemoteTree(self.remote_path, [entry for entry in self.entries if predicate(entry)])
+
+    def get_total_size(self):
+        return sum(entry.size or 0 for entry in self.files())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+def ls_remote_dir(sftp_client, remote_path):
+    return [entry.path for entry in RemoteTree.scan(sftp_client, remote_path).files()]
 
 def get_paramiko_transport(host, port, username, password):
     LOG.info('Establish connection to {}:{}'.format(host, port))
@@ -250,7 +725,7 @@ def get_paramiko_transport(host, port, username, password):
     transport = paramiko.Transport((host, int(port)))
     # SFTP FIXES
     #transport.default_window_size=paramiko.common.MAX_WINDOW_SIZE
-    transport.packetizer.REKEY_BYTES = pow(2, 31)  # 4GB max
+    transport.packetizer.REKEY_BYTES = REKEY_BYTES  # transfers dropped by a failed rekey are resumed, see download_file/upload_file
     # transport.packetizer.REKEY_PACKETS = pow(2, 22)  # 1TB max, this is a security degradation!
     # / SFTP FIXES
     transport.set_log_channel('{}.{}'.format(LOG.get_classname(), transport.get_log_channel()))
@@ -273,7 +748,8 @@ def sftp_client_list_dir(sftp_client, remote_path):
 
     return remote_files
 
-def sftp_client_put(sftp_client, local_path, remote_path):
+def sftp_client_put(sftp_client, local_path, remote_path, connection = None):
+    ### connection - optional _Connection, large files reconnect and resume on a dropped transport
     if [char for char in WINDOWS_FORBIDDEN_CHAR if char in remote_path]:
         LOG.warning('Windows forbidden character found - "{}", replace to "_"'.format(remote_path))
         for i, character in enumerate(WINDOWS_FORBIDDEN_CHAR):
@@ -281,38 +757,63 @@ def sftp_client_put(sftp_client, local_path, remote_path):
             
     mkdir_p(sftp_client, remote_path)
 
-    attribute = sftp_client.put(local_path, remote_path)
+    file_size = os.path.getsize(local_path)
+    if file_size > PIPELINED_UPLOAD_SIZE:
+        ### Handle large file
+        progress_size = 0
+        total_size = 0
+        step_size = 4 * 1024 * 1024
+
+        def progress_callback(size):
+            nonlocal progress_size, total_size
+            progress_size += size
+            total_size += size
+            while progress_size >= step_size:
+                LOG.info('Uploaded {}MB / {}MB - {} >>> "{}"'.format(
+                    str(total_size // (1024 ** 2)),
+                    str(file_size/1024/1024),
+                    os.path.basename(local_path),
+                    remote_path))
+                progress_size -= step_size
+
+        attribute = upload_file(sftp_client, local_path, remote_path, callback=progress_callback, connection=connection)
+    else:
+        attribute = sftp_client.put(local_path, remote_path)
     
     return attribute
 
 ### [Basic/Lazy] Download all files but not dir from remote to local
-def sftp_client_get(sftp_client, remote_path, local_path):
+def sftp_client_get(sftp_client, remote_path, local_path, connection = None):
+    ### connection - optional _Connection, large files reconnect and resume on a dropped transport
     host = str(sftp_client.get_channel().getpeername()[0])
     port = str(sftp_client.get_channel().getpeername()[1])
-    remote_files = sftp_client_list_dir(sftp_client, remote_path)
+    remote_tree = RemoteTree.scan(sftp_client, remote_path, recursive=False)
+    remote_files = [entry.get_name() for entry in remote_tree]
     downloads = []
 
     LOG.info('[SFTP] Download files "sftp://{}:{}/{}" >>> "{}"\nFound {} item(s):\n{}'.format(host, port, remote_path, local_path, str(len(remote_files)), str(remote_files)))
 
     if remote_files: 
-        for i, base_name in enumerate(remote_files):
+        for i, entry in enumerate(remote_tree):
+            base_name = entry.get_name()
+            file_size = entry.size
             target_path = local_path + '/' + str(base_name)
             timelapsed = time.perf_counter()
 
+            ## Directory, skip
+            if entry.is_dir():
+                LOG.info('"{}" is a directory, skipped.'.format(remote_path + base_name))
+                continue
+
             try:
                 LOG.info('Download {} of {} - {} >>> "{}" ({}KB)'.format(
                     str(i+1),
                     str(len(remote_files)),
                     base_name,
                     target_path,
-                    str(sftp_client.stat(remote_path + base_name).st_size/1024)))
+                    str(file_size/1024)))
                 
-                ## [Lazy] If a files > 4000MB, skip
-                if sftp_client.stat(remote_path + base_name).st_size > 4000000000:
-                    LOG.critical('[SFTP] {} ({}MB) has a large file size (>4000MB).\nSkipped during auto process. Please perform a manual uploads.'.format(
-                        base_name, str(sftp_client.stat(remote_path + base_name).st_size/4000000)))
-                    continue
-                elif sftp_client.stat(remote_path + base_name).st_size > 300000000:
+                if file_size > LARGE_FILE_SIZE:
                     ### Handle large file
                     progress_size = 0
                     total_size = 0
@@ -325,12 +826,13 @@ def sftp_client_get(sftp_client, remote_path, local_path):
                         while progress_size >= step_size:
                             LOG.info('Downloaded {}MB / {}MB - {} >>> "{}"'.format(
                                 str(total_size // (1024 ** 2)),
-                                str(sftp_client.stat(remote_path + base_name).st_size/1024/1024),
+                                str(file_size/1024/1024),
                                 os.path.basename(remote_path + base_name),
                                 target_path))
                             progress_size -= step_size
                     
-                    download_file(sftp_client, remote_path + base_name, target_path, callback=progress_callback)
+                    sftp_client = download_file(sftp_client, remote_path + base_name, target_path, callback=progress_callback,
+                                                file_size=file_size, mtime=entry.mtime, connection=connection)
                 else:
                     sftp_client.get(remote_path + base_name, target_path)
 
@@ -349,17 +851,23 @@ def sftp_client_get(sftp_client, remote_path, local_path):
         return downloads
 
 ### [Recursive] Given a local directory, upload the whole dir and its sub-dir to a remote location
-def sftp_client_upload_dir(sftp_client, local_path, remote_path, username = "", password = ""):
+def get_upload_remote_path(local_path, remote_path, file_path):
+    return remote_path + '/' + os.path.basename(local_path) + '/' + os.path.split(file_path)[-1]
+
+def sftp_client_upload_dir(sftp_client, local_path, remote_path, username = "", password = "", uploads = None, connection = None):
+    ### uploads - subset of files under local_path, default all
+    ### connection - optional _Connection, holds the client in use after a refresh/reconnect
     host = str(sftp_client.get_channel().getpeername()[0])
     port = str(sftp_client.get_channel().getpeername()[1])
-    uploads = ls_dir(local_path)
+    uploads = ls_dir(local_path) if uploads is None else uploads
+    connection = connection or _Connection(sftp_client, username, password)
     attributes = []
 
     LOG.info('[SFTP] Upload (-R) "{}" >>> "sftp://{}:{}/{}"'.format(local_path, host, port, remote_path))
     LOG.info('List Directory - "{}", found {} item(s):\n{}'.format(local_path, str(len(uploads)), str(uploads)))
 
     for i, file_path in enumerate(uploads):
-        target_remote_path = remote_path + '/' + os.path.basename(local_path) + '/' + os.path.split(file_path)[-1]
+        target_remote_path = get_upload_remote_path(local_path, remote_path, file_path)
         timelapsed = time.perf_counter()
 
         LOG.info('Upload {} of {} - {} >>> "{}" ({}KB)'.format(
@@ -372,26 +880,32 @@ def sftp_client_upload_dir(sftp_client, local_path, remote_path, username = "",
         ### Refresh SSH Connection for every 300 files
         if (i % 300 == 0) and (i != 0):
             LOG.info('[SFTP] Reach {} file downloads, refresh SSH Connection'.format(i))
-            sftp_client.close()
-            sftp_client = get_sftp_client(get_paramiko_transport(host, port, username, password))
+            sftp_client = connection.reconnect()
         
-        attributes.append(sftp_client_put(sftp_client, file_path, target_remote_path))
+        attributes.append(sftp_client_put(sftp_client, file_path, target_remote_path, connection))
+        sftp_client = connection.client
         
         LOG.info('OK, timelapsed: {}s'.format(str(time.perf_counter() - timelapsed)))
 
     return attributes
 
-def sftp_client_download_dir(sftp_client, remote_path, local_path, username = "", password = ""):
+def sftp_client_download_dir(sftp_client, remote_path, local_path, username = "", password = "", remote_entries = None, connection = None):
+    ### remote_entries - subset of RemoteTree files under remote_path, default all
+    ### connection - optional _Connection, holds the client in use after a refresh/reconnect
     host = str(sftp_client.get_channel().getpeername()[0])
     port = str(sftp_client.get_channel().getpeername()[1])
-    remote_files = ls_remote_dir(sftp_client, remote_path)
+    remote_entries = RemoteTree.scan(sftp_client, remote_path).files() if remote_entries is None else remote_entries
+    remote_files = [entry.path for entry in remote_entries]
+    connection = connection or _Connection(sftp_client, username, password)
     downloads = []
 
     #LOG.info('[SFTP] Download (-R) "sftp://{}:{}/{}" >>> "{}"'.format(host, port, remote_path, local_path))
     LOG.info('[SFTP] Download (-R) "sftp://{}:{}/{}" >>> "{}"\nFound {} item(s):\n{}'.format(host, port, remote_path, local_path, str(len(remote_files)), str(remote_files)))
     #LOG.info('List Directory - "{}", found {} item(s):\n{}'.format(remote_path, str(len(remote_files)), str(remote_files)))
     
-    for i, file in enumerate(remote_files):
+    for i, entry in enumerate(remote_entries):
+        file = entry.path
+        file_size = entry.size
         target_path = local_path + '/' + str(file).replace(remote_path, '')
         target_dir = os.path.split(target_path)[0]
         downloads.append(target_path)
@@ -405,20 +919,14 @@ def sftp_client_download_dir(sftp_client, remote_path, local_path, username = ""
             str(len(remote_files)),
             os.path.basename(file),
             target_path,
-            str(sftp_client.stat(file).st_size/1024)))
+            str(file_size/1024)))
         
         ### Refresh SSH Connection for every 300 files
         if (i % 300 == 0) and (i != 0):
             LOG.info('[SFTP] Reach {} file downloads, refresh SSH Connection'.format(i))
-            sftp_client.close()
-            sftp_client = get_sftp_client(get_paramiko_transport(host, port, username, password))
+            sftp_client = connection.reconnect()
         
-        if sftp_client.stat(file).st_size > 4000000000:
-            error_msg = '[SFTP] {} ({}MB) has a large file size (>4000MB).\nRaise termination.'.format(
-                file, str(sftp_client.stat(file).st_size/4000000))
-            LOG.critical(error_msg)
-            raise BufferError(error_msg)
-        if sftp_client.stat(file).st_size > 300000000:
+        if file_size > LARGE_FILE_SIZE:
             ### Handle large file
             progress_size = 0
             total_size = 0
@@ -432,12 +940,13 @@ def sftp_client_download_dir(sftp_client, remote_path, local_path, username = ""
                 while progress_size >= step_size:
                     LOG.info('Downloaded {}MB / {}MB - {} >>> "{}"'.format(
                         str(total_size // (1024 ** 2)),
-                        str(str(sftp_client.stat(file).st_size/1024/1024)),
+                        str(file_size/1024/1024),
                         os.path.basename(file),
                         target_path))
                     progress_size -= step_size
             
-            download_file(sftp_client, file, target_path, callback=progress_callback)
+            sftp_client = download_file(sftp_client, file, target_path, callback=progress_callback,
+                                        file_size=file_size, mtime=entry.mtime, connection=connection)
 
         else:
             sftp_client.get(remotepath=file, localpath=target_path)
@@ -448,10 +957,286 @@ def sftp_client_download_dir(sftp_client, remote_path, local_path, username = ""
 
     return downloads
 
+class _TransferProgress():
+    """
+    Aggregate progress/throughput of a multi-file transfer shared by all workers, logged every PROGRESS_SECONDS.
+    """
+
+    def __init__(self, name, total_files, total_bytes = None) -> None:
+        self.name = name
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.__logged = self.started
+        self.__lock = threading.Lock()
+
+    def add_bytes(self, size):
+        with self.__lock:
+            self.bytes += size
+            self.__log_periodically()
+
+    def file_done(self, failed = False):
+        with self.__lock:
+            self.files += 1
+            if failed:
+                self.failed += 1
+            self.__log_periodically()
+
+    def get_elapsed(self):
+        return time.perf_counter() - self.started
+
+    def to_string(self):
+        elapsed = self.get_elapsed()
+        return '[{}] {} / {} file(s), {} failed, {:.1f}MB{}, {:.2f}MB/s, timelapsed: {:.1f}s'.format(
+            self.name,
+            self.files,
+            self.total_files,
+            self.failed,
+            self.bytes / 1024 / 1024,
+            ' / {:.1f}MB'.format(self.total_bytes / 1024 / 1024) if self.total_bytes else '',
+            self.bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0,
+            elapsed)
+
+    def __log_periodically(self):
+        if time.perf_counter() - self.__logged >= PROGRESS_SECONDS:
+            self.__logged = time.perf_counter()
+            LOG.info(self.to_string())
+
+def download_remote_file(sftp_client, remote_file, target_path, file_size, callback = None, mtime = None, connection = None):
+    ### Download one file by size: plain get, or pipelined, resumable _SFTPFileDownloader above LARGE_FILE_SIZE. callback(bytes) per chunk
+    ### Return the sftp client in use, a new one if connection was re-established
+    if file_size > LARGE_FILE_SIZE:
+        return download_file(sftp_client, remote_file, target_path, callback=(lambda data: callback(len(data))) if callback else None,
+                             file_size=file_size, mtime=mtime, connection=connection)
+
+    sftp_client.get(remotepath=remote_file, localpath=target_path)
+    if callback is not None:
+        callback(file_size)
+
+    return sftp_client
+
+### [Recursive][Parallel] Download the whole remote dir, files distributed over workers each with its own SFTP channel
+def sftp_client_download_dir_parallel(sftp_client, remote_path, local_path, username = "", password = "", workers = WORKERS, multi_transport = False, remote_entries = None):
+    """
+    workers - number of concurrent SFTP channels
+    multi_transport - one SSH transport (TCP connection) per worker instead of channels on the transport of sftp_client
+    remote_entries - subset of RemoteTree files under remote_path, default all
+    Errors are collected per file; raised together in file order after every file is attempted.
+    """
+    host = str(sftp_client.get_channel().getpeername()[0])
+    port = str(sftp_client.get_channel().getpeername()[1])
+    transport = sftp_client.get_channel().get_transport()
+    remote_entries = RemoteTree.scan(sftp_client, remote_path).files() if remote_entries is None else remote_entries
+    remote_files = [entry.path for entry in remote_entries]
+    progress = _TransferProgress('Download (-R)', len(remote_files), sum(entry.size or 0 for entry in remote_entries))
+    pending = queue.Queue()
+    downloads = [None] * len(remote_files)
+    errors = {}
+
+    LOG.info('[SFTP] Download (-R) "sftp://{}:{}/{}" >>> "{}", {} worker(s){}\nFound {} item(s):\n{}'.format(
+        host, port, remote_path, local_path, workers, ' on separate transports' if multi_transport else '', str(len(remote_files)), str(remote_files)))
+
+    for i, entry in enumerate(remote_entries):
+        pending.put((i, entry))
+
+    def worker():
+        worker_transport = None
+
+        try:
+            if multi_transport:
+                worker_transport = get_paramiko_transport(host, port, username, password)
+                worker_client = get_sftp_client(worker_transport)
+            else:
+                worker_client = get_sftp_client(transport)
+        except Exception:
+            LOG.error('[SFTP] Failed to open worker connection - {}'.format(str(sys.exc_info()[1])))
+            return
+
+        connection = _Connection(worker_client, username, password)
+
+        try:
+            while True:
+                try:
+                    i, entry = pending.get_nowait()
+                except queue.Empty:
+                    return
+
+                file = entry.path
+                file_size = entry.size
+                target_path = local_path + '/' + str(file).replace(remote_path, '')
+                timelapsed = time.perf_counter()
+
+                try:
+                    os.makedirs(os.path.split(target_path)[0], exist_ok=True)
+                    worker_client = download_remote_file(worker_client, file, target_path, file_size, progress.add_bytes, entry.mtime, connection)
+
+                    downloads[i] = target_path
+                    progress.file_done()
+                    LOG.info('Downloaded {} of {} - {} >>> "{}" ({}KB), timelapsed: {}s'.format(
+                        str(i+1), str(len(remote_files)), os.path.basename(file), target_path, str(file_size/1024), str(time.perf_counter() - timelapsed)))
+                except Exception:
+                    errors[i] = (file, '{} {}'.format(str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+                    progress.file_done(failed=True)
+                    if os.path.exists(target_path): os.remove(target_path)
+        finally:
+            worker_client.close()
+            connection.close()
+            if worker_transport is not None:
+                worker_transport.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(int(workers), len(remote_files))))]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    ## Files left behind by workers which failed to connect
+    for i, file in enumerate(remote_files):
+        if downloads[i] is None and i not in errors:
+            errors[i] = (file, 'Not attempted, no worker connection available.')
+
+    LOG.info(progress.to_string())
+
+    if errors:
+        raise _Exception.transfer_failed([errors[i] for i in sorted(errors)], len(remote_files))
+
+    if len(downloads) > 0: LOG.info('Saved {} items:\n{}\n'.format(len(downloads), '\n'.join(downloads)))
+
+    return downloads
+
+def sftp_client_download_dir_sync(sftp_client, remote_path, local_path, username = "", password = "", manifest_path = MANIFEST_PATH, delete = False, checksum = False, workers = 1, multi_transport = False, connection = None):
+    """
+    Download only files that are new or changed (size/mtime) since the last sync recorded in the manifest,
+    or whose local copy is missing, resized or (checksum) modified.
+    delete - remove local files that vanished from remote_path since the last sync
+    """
+    host = str(sftp_client.get_channel().getpeername()[0])
+    port = str(sftp_client.get_channel().getpeername()[1])
+    sync_manifest = Manifest(manifest_path, 'sftp://{}:{}/{}'.format(host, port, remote_path))
+    remote_entries = RemoteTree.scan(sftp_client, remote_path).files()
+    changes = []
+    local_attributes = {}
+
+    for entry in remote_entries:
+        key = str(entry.path).replace(remote_path, '').lstrip('/')
+        target_path = local_path + '/' + key
+        record = sync_manifest.get(key)
+
+        if not os.path.exists(target_path):
+            changes.append(entry)
+            continue
+
+        local_attributes[key] = os.stat(target_path)
+        if is_changed(record, entry.size, entry.mtime) or local_attributes[key].st_size != entry.size:
+            changes.append(entry)
+        elif checksum and is_changed(record, entry.size, entry.mtime, get_file_hash(target_path)):
+            changes.append(entry)
+
+    remote_keys = set(str(entry.path).replace(remote_path, '').lstrip('/') for entry in remote_entries)
+    removals = [key for key in sync_manifest.keys() if key not in remote_keys]
+
+    LOG.info('[SFTP] Sync "sftp://{}:{}/{}" >>> "{}", {} of {} item(s) new or changed, {} vanished:\n{}'.format(
+        host, port, remote_path, local_path, len(changes), len(remote_entries), len(removals), str([entry.path for entry in changes])))
+
+    try:
+        if changes and int(workers) > 1:
+            downloads = sftp_client_download_dir_parallel(sftp_client, remote_path, local_path, username, password, workers, multi_transport, remote_entries=changes)
+        elif changes:
+            downloads = sftp_client_download_dir(sftp_client, remote_path, local_path, username, password, remote_entries=changes, connection=connection)
+        else:
+            downloads = []
+
+        if delete:
+            for key in removals:
+                target_path = local_path + '/' + key
+                if os.path.exists(target_path):
+                    os.remove(target_path)
+                    LOG.info('Removed vanished item - "{}"'.format(target_path))
+                sync_manifest.remove(key)
+    finally:
+        ## Record every file completed in this run (rewritten to the remote size), a failed run retries only the rest
+        for entry in changes:
+            key = str(entry.path).replace(remote_path, '').lstrip('/')
+            target_path = local_path + '/' + key
+            if not os.path.exists(target_path):
+                continue
+
+            attribute = os.stat(target_path)
+            if attribute.st_size == entry.size and (key not in local_attributes or attribute.st_mtime_ns != local_attributes[key].st_mtime_ns):
+                sync_manifest.set(key, entry.size, entry.mtime, get_file_hash(target_path) if checksum else None)
+
+        sync_manifest.save()
+
+    return downloads
+
+def sftp_client_upload_dir_sync(sftp_client, local_path, remote_path, username = "", password = "", manifest_path = MANIFEST_PATH, delete = False, checksum = False, connection = None):
+    """
+    Upload only files that are new or changed (size/mtime, checksum: hash) since the last sync recorded in the manifest,
+    or whose remote copy is missing or resized.
+    delete - remove remote files whose local file vanished since the last sync
+    """
+    host = str(sftp_client.get_channel().getpeername()[0])
+    port = str(sftp_client.get_channel().getpeername()[1])
+    sync_manifest = Manifest(manifest_path, '{} >>> sftp://{}:{}/{}'.format(os.path.abspath(local_path), host, port, remote_path))
+    target_dir = remote_path + '/' + os.path.basename(local_path)
+    connection = connection or _Connection(sftp_client, username, password)
+
+    def scan_target_dir():
+        try:
+            return RemoteTree.scan(connection.client, target_dir, recursive=False)
+        except IOError:
+            return RemoteTree(target_dir, [])
+
+    remote_tree = scan_target_dir()
+    changes = []
+    local_keys = set()
+
+    for file_path in ls_dir(local_path):
+        key = os.path.relpath(file_path, local_path)
+        attribute = get_local_attributes(file_path, checksum)
+        remote_entry = remote_tree.get(get_upload_remote_path(local_path, remote_path, file_path))
+        local_keys.add(key)
+
+        if remote_entry is None or remote_entry.size != attribute['size'] or is_changed(sync_manifest.get(key), attribute['size'], attribute['mtime'], attribute['hash']):
+            changes.append((file_path, key, attribute))
+
+    removals = [key for key in sync_manifest.keys() if key not in local_keys]
+
+    LOG.info('[SFTP] Sync "{}" >>> "sftp://{}:{}/{}", {} of {} item(s) new or changed, {} vanished:\n{}'.format(
+        local_path, host, port, remote_path, len(changes), len(local_keys), len(removals), str([file_path for file_path, key, attribute in changes])))
+
+    attributes = []
+    try:
+        if changes:
+            attributes = sftp_client_upload_dir(sftp_client, local_path, remote_path, username, password, uploads=[file_path for file_path, key, attribute in changes], connection=connection)
+
+        if delete:
+            for key in removals:
+                target_remote_path = get_upload_remote_path(local_path, remote_path, key)
+                if remote_tree.get(target_remote_path) is not None:
+                    connection.client.remove(target_remote_path)
+                    LOG.info('Removed vanished item - "{}"'.format(target_remote_path))
+                sync_manifest.remove(key)
+    finally:
+        ## Record every file completed in this run (rewritten to the local size), a failed run retries only the rest
+        uploaded_tree = remote_tree if len(attributes) == len(changes) else scan_target_dir()
+        for i, (file_path, key, attribute) in enumerate(changes):
+            target_remote_path = get_upload_remote_path(local_path, remote_path, file_path)
+            before, after = remote_tree.get(target_remote_path), uploaded_tree.get(target_remote_path)
+
+            if i < len(attributes) or (after is not None and after.size == attribute['size'] and (before is None or after.mtime != before.mtime)):
+                sync_manifest.set(key, attribute['size'], attribute['mtime'], attribute['hash'])
+
+        sync_manifest.save()
+
+    return attributes
+
 def sftp_client_remove_dir(sftp_client, remote_dir):
     host = str(sftp_client.get_channel().getpeername()[0])
     port = str(sftp_client.get_channel().getpeername()[1])
-    remote_files = ls_remote_dir(sftp_client, remote_dir)
+    remote_tree = RemoteTree.scan(sftp_client, remote_dir)
+    remote_files = [entry.path for entry in remote_tree.files()]
     removed = []
 
     LOG.info('[SFTP] Remove (-R) "sftp://{}:{}/{}"'.format(host, port, remote_dir))
@@ -473,6 +1258,10 @@ def sftp_client_remove_dir(sftp_client, remote_dir):
 
     LOG.info('Deleted {} items.'.format(len(removed)))
 
+    ### Remove sub-directories from the snapshot, deepest first
+    for entry in sorted(remote_tree.dirs(), key=lambda entry: entry.path.count('/'), reverse=True):
+        sftp_client.rmdir(entry.path)
+
     sftp_client.rmdir(remote_dir)
 
     LOG.info('Deleted directory - "{}"'.format(remote_dir))
@@ -489,6 +1278,13 @@ class _Exception():
             str(sys.exc_info()[1])))
         
         return AssertionError()
+
+    def transfer_failed(errors, count):
+        err_msg = '[Error 1] {} of {} file(s) failed to transfer:\n{}'.format(
+            len(errors), count, '\n'.join('"{}" - {}'.format(path, error) for path, error in errors))
+        LOG.error(err_msg)
+
+        return IOError(__name__, err_msg)
         
 class SFTP():
     __host : str = "127.0.0.1"
@@ -538,6 +1334,13 @@ class SFTP():
         self.__transport = get_paramiko_transport(self.__host, self.__port, self.__username, self.__password)
         self.__client = get_sftp_client(self.__transport)
 
+    def __adopt(self, connection):
+        ### Continue on the connection re-established by a transfer (reconnect/refresh), call once per _Connection
+        if connection.transport is not None:
+            self.__transport.close()
+            self.__transport = connection.transport
+            self.__client = connection.client
+
     def close(self):
         self.__transport.close()
         LOG.info('Connection closed: {}:{}'.format(self.__host, self.__port))
@@ -551,24 +1354,45 @@ class SFTP():
             remote_path,
             str(os.path.getsize(local_path)/1024)))
         
-        r = sftp_client_put(self.__client, local_path, remote_path)
+        connection = _Connection(self.__client, self.__username, self.__password)
+        try:
+            r = sftp_client_put(self.__client, local_path, remote_path, connection)
+        finally:
+            self.__adopt(connection)
         LOG.info('OK')
 
         return r
 
-    def download_dir(self, remote_path, local_path):
+    def download_dir(self, remote_path, local_path, workers = DOWNLOAD_WORKERS, multi_transport = False, sync = False, manifest_path = MANIFEST_PATH, delete = False, checksum = False):
+        ### workers > 1: parallel download, workers = 1 (default, see SFTP_DOWNLOAD_WORKERS): serial download with reconnect, multi_transport: one SSH connection per worker
+        ### sync: new or changed files only against the manifest, delete: remove local files vanished from remote, checksum: also compare local file hash
+        if int(workers) > 1 and not sync:
+            return sftp_client_download_dir_parallel(
+                self.__client, remote_path, local_path, self.__username, self.__password, workers, multi_transport)
 
+        connection = _Connection(self.__client, self.__username, self.__password)
         try:
-            r = sftp_client_download_dir(self.__client, remote_path, local_path, self.__username, self.__password)
-        except Exception as e:
-            raise _Exception.default(e)
+            if sync:
+                return sftp_client_download_dir_sync(
+                    self.__client, remote_path, local_path, self.__username, self.__password, manifest_path, delete, checksum, workers, multi_transport, connection)
+
+            try:
+                r = sftp_client_download_dir(self.__client, remote_path, local_path, self.__username, self.__password, connection=connection)
+            except Exception as e:
+                raise _Exception.default(e)
+        finally:
+            self.__adopt(connection)
 
         return r
     
     ### Skip directory and files only (not recursive)
     def get(self, remote_path, local_path):
+        connection = _Connection(self.__client, self.__username, self.__password)
         try:
-            r = sftp_client_get(self.__client, remote_path, local_path)
+            try:
+                r = sftp_client_get(self.__client, remote_path, local_path, connection)
+            finally:
+                self.__adopt(connection)
         except Exception as e:
             try:
                 self.__client.get(remote_path, local_path)
@@ -578,8 +1402,17 @@ class SFTP():
 
         return r
     
-    def put_dir(self, local_path, remote_path):
-        return sftp_client_upload_dir(self.__client, local_path, remote_path, self.__username, self.__password)
+    def put_dir(self, local_path, remote_path, sync = False, manifest_path = MANIFEST_PATH, delete = False, checksum = False):
+        ### sync: new or changed files only against the manifest, delete: remove remote files vanished from local, checksum: also compare local file hash
+        connection = _Connection(self.__client, self.__username, self.__password)
+        try:
+            if sync:
+                return sftp_client_upload_dir_sync(
+                    self.__client, local_path, remote_path, self.__username, self.__password, manifest_path, delete, checksum, connection)
+
+            return sftp_client_upload_dir(self.__client, local_path, remote_path, self.__username, self.__password, connection=connection)
+        finally:
+            self.__adopt(connection)
     
     ### Allow to upload multiple files or directories
     def put(self, local_paths, remote_path):
@@ -0,0 +1,98 @@
+"""
+    Name:
+        watermark.py
+    Author:
+        hexton.chan@hkexpress.com
+    Description:
+        Persist the highest SRC_UPDATED_TIME published per project, for incremental extraction.
+        Stored as a small JSON file, replaced atomically on every advance.
+    Note:
+        20261017 - Init commit
+"""
+
+import os
+import json
+import datetime
+import tempfile
+import threading
+
+from .logging import Logging
+
+LOG = Logging(__name__)
+
+### Lower bound for the first run, the query's own date window still applies
+DEFAULT_WATERMARK = datetime.datetime(1970, 1, 1)
+
+def get_next_watermark(dataframe, outcomes = None, column = 'SRC_UPDATED_TIME'):
+    ### Highest update time that is safe to commit: stop before the earliest failed message so it is extracted again
+    if len(dataframe) == 0:
+        return None
+
+    updated_times = dataframe[column]
+
+    if outcomes:
+        failed = set(i['correlationId'] for i in outcomes if i['status'] != 'OK')
+        if failed:
+            earliest_failure = updated_times[dataframe['correlationId'].isin(failed)].min()
+            updated_times = updated_times[updated_times < earliest_failure]
+
+            if len(updated_times) == 0:
+                return None
+
+    watermark = updated_times.max()
+
+    return watermark.to_pydatetime() if hasattr(watermark, 'to_pydatetime') else watermark
+
+class Watermark():
+    __path = ""
+
+    def __init__(self, path) -> None:
+        self.__path = path
+        self.__lock = threading.Lock()
+
+    def get_path(self):
+        return self.__path
+
+    def get(self, project_id, default = DEFAULT_WATERMARK):
+        watermark = self.__read().get(project_id)
+
+        if watermark is None:
+            return default
+
+        return datetime.datetime.fromisoformat(watermark)
+
+    def advance(self, project_id, watermark):
+        ### Move the watermark forward only, return the stored value
+        with self.__lock:
+            watermarks = self.__read()
+            current = watermarks.get(project_id)
+
+            if watermark is None or (current is not None and datetime.datetime.fromisoformat(current) >= watermark):
+                LOG.info('Watermark unchanged - {}: {}'.format(project_id, current))
+                return self.get(project_id)
+
+            watermarks[project_id] = watermark.isoformat()
+            self.__write(watermarks)
+
+        LOG.info('Watermark advanced - {}: {} >>> {}'.format(project_id, current, watermark.isoformat()))
+
+        return watermark
+
+    def __read(self):
+        if not os.path.exists(self.__path):
+            return {}
+
+        with open(self.__path, 'r') as f:
+            return json.loads(f.read() or '{}')
+
+    def __write(self, watermarks):
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+            f.write(json.dumps(watermarks, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(f.name, self.__path)